@@ -0,0 +1,11 @@
+'''
+Benchmarks
+==========
+
+End-to-end benchmarks of pysniffwave against synthetic datasets, see
+:mod:`benchmarks.suite`.  Run offline (no Earthworm) with:
+
+    python -m benchmarks --channels 100 1000 10000 50000 -o results.json
+
+..  codeauthor:: Charles Blais
+'''
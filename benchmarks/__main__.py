@@ -0,0 +1,72 @@
+'''
+Benchmark utility
+=================
+
+Run the benchmark suite and write the results as JSON.
+
+..  codeauthor:: Charles Blais
+'''
+import argparse
+import json
+import logging
+import sys
+
+from .suite import BENCHMARKS, run
+
+
+def main():
+    '''
+    See module description
+    '''
+    parser = argparse.ArgumentParser(
+        description='Run the pysniffwave benchmarks on synthetic datasets')
+    parser.add_argument(
+        '-n', '--channels',
+        nargs='+',
+        default=[100, 1000, 10000, 50000],
+        type=int,
+        help='Amounts of channels of the datasets \
+(default: 100 1000 10000 50000)')
+    parser.add_argument(
+        '-r', '--rounds',
+        default=5,
+        type=int,
+        help='Amount of packets per channel (default: 5)')
+    parser.add_argument(
+        '-b', '--benchmark',
+        action='append',
+        choices=list(BENCHMARKS),
+        help='Benchmark to run, can be repeated (default: all)')
+    parser.add_argument(
+        '-d', '--directory',
+        help='Scratch directory (default: system temporary directory)')
+    parser.add_argument(
+        '-o', '--output',
+        help='JSON file of the results (default: stdout)')
+    parser.add_argument(
+        '-v', '--verbose',
+        action='count',
+        default=0,
+        help='Verbosity')
+
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(asctime)s %(levelname)s %(message)s',
+        level=logging.WARNING - (args.verbose * 10))
+
+    results = run(
+        args.channels,
+        rounds=args.rounds,
+        paths=args.benchmark,
+        directory=args.directory)
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as fp:
+            json.dump(results, fp, indent=2)
+
+
+if __name__ == '__main__':
+    main()
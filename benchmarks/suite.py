@@ -0,0 +1,350 @@
+'''
+Benchmark suite
+===============
+
+Every benchmark receives a synthetic :class:`Dataset` and returns a list
+of results (dictionaries) with the path measured, the amount of
+channels and rows and the measures (seconds, rates, sizes).
+
+Paths measured:
+
+1. parse = lines/s of the line parser and the columnar parser
+2. hdf5 = HDF5Worker batch write throughput and file size per
+   compression profile
+3. latest_arrival = LatestArrivalWorker add_latest_timestamp and
+   write_to_file cost
+4. check_arrival = check_arrival_metrics wall time and peak RSS
+5. sql = SQLWorker inserts/s
+
+..  codeauthor:: Charles Blais
+'''
+import datetime
+import logging
+import subprocess
+import sys
+import tempfile
+import time
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from pysniffwave.hdf5.client import Client
+from pysniffwave.nagios.arrival_metrics import SNAPSHOT_SUFFIX, \
+    LatestArrivalWorker
+from pysniffwave.sniffwave.columnar import ColumnBatch, ColumnParser, \
+    to_records
+from pysniffwave.sniffwave.parser import Channel, parse
+from pysniffwave.sniffwave.synthetic import Synthetic, generate
+from pysniffwave.workers.hdf5 import HDF5Worker
+from pysniffwave.workers.sql import SQLWorker
+
+Result = Dict[str, Any]
+
+# compression profiles of the HDF5 benchmark
+DEFAULT_PROFILES = ['zlib-9', 'zlib-3', 'blosc-lz4', 'blosc-zstd', 'none']
+
+
+@dataclass
+class Dataset:
+    '''
+    Synthetic sniffwave output, one batch per packet round
+
+    Properties
+    ----------
+    channels: int
+        Amount of channels
+
+    lines: List[List[str]]
+        Lines of each packet round
+
+    directory: Path
+        Scratch directory of the benchmarks
+    '''
+    channels: int
+    lines: List[List[str]]
+    directory: Path
+
+    @property
+    def rows(self) -> int:
+        return sum(len(lines) for lines in self.lines)
+
+    def batches(self) -> List[ColumnBatch]:
+        '''
+        Parse every packet round, each round is recorded one second
+        apart so rows never share the key of the SQL tables
+
+        :rtype: [:class:`ColumnBatch`, ...]
+        '''
+        parser = ColumnParser()
+        recorded_at = time.time()
+        return [parser.parse(lines, recorded_at=recorded_at + index)
+                for index, lines in enumerate(self.lines)]
+
+
+def make_dataset(
+    channels: int,
+    rounds: int,
+    directory: Path,
+    error_rate: float = 0.01,
+    seed: int = 0,
+) -> Dataset:
+    '''
+    Generate the synthetic dataset
+
+    :param int channels: amount of channels
+    :param int rounds: amount of packets per channel
+    :param directory: scratch directory
+    :param float error_rate: gap/overlap/out-of-order rate
+    :param int seed: seed of the generator
+    :rtype: :class:`Dataset`
+    '''
+    config = Synthetic(
+        channels=channels, error_rate=error_rate, duration=rounds,
+        rate=0, seed=seed)
+    lines: List[List[str]] = [[] for _ in range(rounds)]
+    start = time.time() - rounds * config.packet_length
+    for arrival, line in generate(config, start):
+        index = int((arrival - start - config.latency) / config.packet_length)
+        lines[min(max(index - 1, 0), rounds - 1)].append(line)
+    return Dataset(channels, lines, directory)
+
+
+def _timed(function: Callable[[], Any]) -> Tuple[float, Any]:
+    '''
+    Wall time of the function call
+
+    :rtype: (float, any)
+    '''
+    started = time.perf_counter()
+    value = function()
+    return time.perf_counter() - started, value
+
+
+def _size(path: Path) -> int:
+    '''
+    Size in bytes of the files under the path
+    '''
+    if path.is_file():
+        return path.stat().st_size
+    return sum(item.stat().st_size for item in path.rglob('*')
+               if item.is_file())
+
+
+def bench_parse(dataset: Dataset) -> List[Result]:
+    '''
+    Lines/s of the line parser and of the columnar parser
+    '''
+    lines = [line for round_lines in dataset.lines for line in round_lines]
+    seconds, _ = _timed(lambda: [parse(line) for line in lines])
+    results = [{
+        'path': 'parse', 'parser': 'line',
+        'rows': len(lines), 'seconds': seconds,
+        'rows_per_second': len(lines) / seconds,
+    }]
+    parser = ColumnParser()
+    seconds, _ = _timed(
+        lambda: [parser.parse(round_lines) for round_lines in dataset.lines])
+    results.append({
+        'path': 'parse', 'parser': 'columnar',
+        'rows': len(lines), 'seconds': seconds,
+        'rows_per_second': len(lines) / seconds,
+    })
+    return results
+
+
+def bench_hdf5(
+    dataset: Dataset,
+    profiles: Optional[List[str]] = None,
+) -> List[Result]:
+    '''
+    HDF5Worker batch write throughput and file size per compression
+    profile.  Each packet round is processed as one call of the worker.
+    '''
+    results = []
+    batches = dataset.batches()
+    for name in profiles or DEFAULT_PROFILES:
+        directory = dataset.directory.joinpath(f'hdf5-{name}')
+        directory.mkdir(parents=True)
+        worker = HDF5Worker(directory=str(directory))
+        # resources are set directly, setup opens production paths
+        worker.client = Client(directory=directory, compression=name)
+        worker.latest_arrival = LatestArrivalWorker(
+            filepath=directory.joinpath('latest_arrival.csv'), changes=10)
+        seconds, _ = _timed(
+            lambda: [worker.process([batch]) for batch in batches])
+        worker.teardown()
+        size = _size(directory)
+        results.append({
+            'path': 'hdf5', 'compression': name,
+            'rows': dataset.rows, 'seconds': seconds,
+            'rows_per_second': dataset.rows / seconds,
+            'bytes': size, 'bytes_per_row': size / dataset.rows,
+        })
+    return results
+
+
+def bench_latest_arrival(dataset: Dataset) -> List[Result]:
+    '''
+    Cost of LatestArrivalWorker add_latest_timestamp (per packet round)
+    and write_to_file
+    '''
+    records = [
+        [record for record in to_records(batch.channels)
+         if isinstance(record, Channel)]
+        for batch in dataset.batches()]
+    path = dataset.directory.joinpath('latest_arrival.csv')
+    # the file is only written by the explicit call
+    worker = LatestArrivalWorker(filepath=path, changes=len(records) + 1)
+    add, _ = _timed(
+        lambda: [worker.add_latest_timestamp(stats) for stats in records])
+    write, _ = _timed(worker.write_to_file)
+    return [{
+        'path': 'latest_arrival',
+        'rows': sum(len(stats) for stats in records),
+        'add_seconds': add,
+        'add_seconds_per_call': add / len(records),
+        'write_seconds': write,
+        'bytes': _size(path),
+    }]
+
+
+# Executes the command and prints its wall time and peak RSS.  On Linux,
+# the peak RSS of a child includes the RSS of its parent before exec, so
+# the command is executed from this small process instead of the suite.
+MEASURE_SCRIPT = '''
+import resource, subprocess, sys, time
+started = time.perf_counter()
+code = subprocess.call(sys.argv[1:], stdout=subprocess.DEVNULL)
+seconds = time.perf_counter() - started
+# kilobytes on Linux
+rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+print(seconds, code, rss)
+'''
+
+
+def _run_measured(command: List[str]) -> Tuple[float, int, int]:
+    '''
+    Wall time, exit code and peak RSS (bytes) of a command executed in
+    a new process
+    '''
+    output = subprocess.run(
+        [sys.executable, '-c', MEASURE_SCRIPT, *command],
+        check=True, stdout=subprocess.PIPE, text=True).stdout.split()
+    return float(output[0]), int(output[1]), int(output[2])
+
+
+def bench_check_arrival(dataset: Dataset) -> List[Result]:
+    '''
+    check_arrival_metrics wall time and peak RSS, executed as the Nagios
+    check is (a new process) on the latest arrival file of the dataset,
+    CSV and binary snapshot
+    '''
+    batches = dataset.batches()
+    results: List[Result] = []
+    for suffix in ('.csv', SNAPSHOT_SUFFIX):
+        path = dataset.directory.joinpath(f'check_arrival{suffix}')
+        worker = LatestArrivalWorker(
+            filepath=path, changes=len(batches) + 1)
+        for batch in batches:
+            worker.add_latest_timestamp([
+                record for record in to_records(batch.channels)
+                if isinstance(record, Channel)])
+        worker.write_to_file()
+
+        seconds, exit_code, peak_rss = _run_measured([
+            sys.executable, '-m', 'pysniffwave.bin.check_arrival_metrics',
+            '--critical-stale', '100', '--warning-stale', '50',
+            '--critical-latency', '60', '--warning-latency', '30',
+            '--critical-count', '100', '--warning-count', '50',
+            '--arrival-file', str(path), '--log-level', 'ERROR'])
+        results.append({
+            'path': 'check_arrival',
+            'format': 'binary' if suffix == SNAPSHOT_SUFFIX else 'csv',
+            'rows': len(worker), 'seconds': seconds,
+            'exit_code': exit_code,
+            'peak_rss_bytes': peak_rss,
+        })
+    return results
+
+
+def bench_sql(dataset: Dataset, max_rows: int = 10000) -> List[Result]:
+    '''
+    SQLWorker inserts/s, limited to max_rows as every insert commits
+    '''
+    worker = SQLWorker()
+    worker.setup()
+    records: List[Any] = []
+    for batch in dataset.batches():
+        records.extend(batch)
+        if len(records) >= max_rows:
+            break
+    records = records[:max_rows]
+    # the client logs every insert
+    logging.disable(logging.INFO)
+    try:
+        seconds, _ = _timed(lambda: worker.process(records))
+    finally:
+        logging.disable(logging.NOTSET)
+    return [{
+        'path': 'sql',
+        'rows': len(records), 'seconds': seconds,
+        'rows_per_second': len(records) / seconds,
+    }]
+
+
+def _version() -> str:
+    '''
+    Version of the installed pysniffwave
+    '''
+    try:
+        from importlib.metadata import version
+        return version('pysniffwave')
+    except Exception:
+        return 'unknown'
+
+
+BENCHMARKS: Dict[str, Callable[[Dataset], List[Result]]] = {
+    'parse': bench_parse,
+    'hdf5': bench_hdf5,
+    'latest_arrival': bench_latest_arrival,
+    'check_arrival': bench_check_arrival,
+    'sql': bench_sql,
+}
+
+
+def run(
+    channels: List[int],
+    rounds: int = 5,
+    paths: Optional[List[str]] = None,
+    directory: Optional[Path] = None,
+) -> Dict[str, Any]:
+    '''
+    Run the benchmarks for every amount of channels
+
+    :param channels: amounts of channels (ex: [100, 1000, 10000, 50000])
+    :param int rounds: amount of packets per channel
+    :param paths: benchmarks to run (default: all, see BENCHMARKS)
+    :param directory: scratch directory (default: temporary)
+    :rtype: dict
+    :returns: metadata and results
+    '''
+    results: List[Result] = []
+    with tempfile.TemporaryDirectory(
+            prefix='pysniffwave_bench_', dir=directory) as scratch:
+        for count in channels:
+            dataset = make_dataset(
+                count, rounds, Path(scratch).joinpath(str(count)))
+            dataset.directory.mkdir(parents=True)
+            for name in paths or list(BENCHMARKS):
+                logging.info(f'Benchmark {name} with {count} channels')
+                for result in BENCHMARKS[name](dataset):
+                    results.append({'channels': count, **result})
+    return {
+        'version': _version(),
+        'python': sys.version.split()[0],
+        'platform': sys.platform,
+        'created_at': datetime.datetime.now().isoformat(),
+        'rounds': rounds,
+        'results': results,
+    }
@@ -1,10 +1,10 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 import click
 import logging
 from pysniffwave.config import LogLevels
 from pysniffwave.nagios.arrival_metrics import LatestArrivalWorker
 from pysniffwave.nagios.check_arrival import ArrivalThresholds, \
-    get_arrival_results
+    get_arrival_results, get_latency_performance
 import sys
 
 
@@ -41,7 +41,25 @@ import sys
 )
 @click.option(
     '--arrival-file',
-    help=("Path to the file containing the latest arrival statistics")
+    help=("Path to the file containing the latest arrival statistics, " +
+          "CSV or binary snapshot")
+)
+@click.option(
+    '--state-file',
+    help=("Path to the latest state table published by the logger, read " +
+          "instead of the arrival file")
+)
+@click.option(
+    '--archive-directory',
+    help=("Directory of the HDF5 archive, adds the latency percentiles of " +
+          "its hourly sketches to the performance data")
+)
+@click.option(
+    '--sketch-hours',
+    type=int,
+    default=1,
+    help=("The number of complete hours of sketches merged for the " +
+          "latency percentiles")
 )
 @click.option(
     '--log-level',
@@ -57,6 +75,9 @@ def main(
     critical_count: str,
     warning_count: str,
     arrival_file: str,
+    state_file: str,
+    archive_directory: str,
+    sketch_hours: int,
     log_level: str
 ):
     # Set up logging format
@@ -75,11 +96,17 @@ def main(
         warn_count=warning_count
     )
 
-    # Load in arrival stats
-    arrival_stats = LatestArrivalWorker(
-        filepath=arrival_file,
-        changes=-1
-    )
+    # Load in arrival stats, the modules using numpy and pandas are only
+    # imported when needed so the check starts fast
+    if state_file:
+        from pysniffwave.nagios.latest_state import load_arrival_stats
+
+        arrival_stats = load_arrival_stats(state_file)
+    else:
+        arrival_stats = LatestArrivalWorker(
+            filepath=arrival_file,
+            changes=-1
+        )
     current_time = datetime.now()
 
     # Check the arrival stats against the threshold
@@ -89,6 +116,28 @@ def main(
         arrival_stats=arrival_stats
     )
 
+    # Add the latency percentiles of the last complete hours
+    if archive_directory:
+        from pysniffwave.hdf5.aggregate import DEFAULT_QUANTILES
+        from pysniffwave.hdf5.client import Client
+        from pysniffwave.hdf5.rollup import LATENCY_COLUMNS
+        from pysniffwave.hdf5.sketches import SketchMerger
+
+        endtime = current_time.replace(minute=0, second=0, microsecond=0)
+        rows = Client(directory=archive_directory).find_sketches(
+            endtime - timedelta(hours=sketch_hours), endtime)
+        sketches = {}
+        for latency in LATENCY_COLUMNS:
+            merged = SketchMerger(latency, by=[])
+            merged.update(rows)
+            sketch = merged.sketches().get('')
+            if sketch is not None:
+                sketches[latency] = sketch
+        results.performances += get_latency_performance(
+            sketches=sketches,
+            quantiles=DEFAULT_QUANTILES
+        )
+
     # Print the results
     print(results)
 
@@ -0,0 +1,81 @@
+'''
+Sniffwave compression
+=====================
+
+Utility comparing the compression profiles of the HDF5 archive on a
+synthetic hour of sniffwave output.  Reports the write and read time
+(us/row) and the size (bytes/row) of each profile.
+
+..  codeauthor:: Charles Blais
+'''
+import argparse
+import json
+import logging
+import sys
+
+from pysniffwave.hdf5.compression import PROFILES, measure, synthetic_hour
+
+
+def main():
+    '''
+    See module description
+    '''
+    parser = argparse.ArgumentParser(
+        description='Compare the HDF5 compression profiles')
+    parser.add_argument(
+        '-n', '--channels',
+        default=300,
+        type=int,
+        help='Amount of channels, 3 per station (default: 300)')
+    parser.add_argument(
+        '-D', '--duration',
+        default=3600,
+        type=float,
+        help='Duration (s) of data written (default: 3600)')
+    parser.add_argument(
+        '-F', '--flush-delay',
+        default=5,
+        type=float,
+        help='Duration (s) of data per write (default: 5)')
+    parser.add_argument(
+        '-z', '--profile',
+        action='append',
+        choices=list(PROFILES),
+        help='Profile to measure, can be repeated (default: all)')
+    parser.add_argument(
+        '-d', '--directory',
+        help='Scratch directory (default: system temporary directory)')
+    parser.add_argument(
+        '-j', '--json',
+        action='store_true',
+        help='Print the results as JSON')
+    parser.add_argument(
+        '-v', '--verbose',
+        action='count',
+        default=0,
+        help='Verbosity')
+
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(asctime)s %(levelname)s %(message)s',
+        level=logging.WARNING - (args.verbose * 10))
+
+    batches = synthetic_hour(
+        channels=args.channels,
+        duration=args.duration,
+        flush_delay=args.flush_delay)
+    results = measure(batches, args.profile, args.directory)
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+        return
+    print(f'{"profile":<22} {"write us/row":>12} {"read us/row":>12} \
+{"bytes/row":>10}')
+    for result in results:
+        print(f'{result["profile"]:<22} {result["write_us_per_row"]:12.2f} \
+{result["read_us_per_row"]:12.2f} {result["bytes_per_row"]:10.2f}')
+
+
+if __name__ == '__main__':
+    main()
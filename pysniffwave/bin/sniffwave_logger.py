@@ -2,7 +2,9 @@
 Sniffwave logger
 ================
 
-Utility for logging sniffwave information to HDF5 files.
+Utility for logging sniffwave information to HDF5 files (or SWMR HDF5
+and parquet files readable during the current hour with
+--archive-format).
 Could be modified for SQL if required...
 
 ..  codeauthor:: Charles Blais
@@ -12,8 +14,17 @@ import argparse
 from pathlib import Path
 
 
+from pysniffwave.hdf5.compression import DEFAULT_PROFILE, PROFILES
+from pysniffwave.nagios.arrival_metrics import DEFAULT_ARRIVAL_FILE, \
+    DEFAULT_ARRIVAL_INTERVAL, SNAPSHOT_SUFFIX
+from pysniffwave.queues import OverflowPolicy
+import pysniffwave.sniffwave.aio as sniffwave_aio
 import pysniffwave.sniffwave.client as sniffwave
-from pysniffwave.workers.hdf5 import HDF5Worker
+from pysniffwave.workers.hdf5 import DEFAULT_FLUSH_DELAY, \
+    DEFAULT_FLUSH_ROWS, HDF5Worker
+from pysniffwave.sniffwave.reader import DEFAULT_CHUNK_SIZE
+from pysniffwave.sniffwave.replay import Replay
+from pysniffwave.sniffwave.spec import SniffwaveSpec
 
 
 DEFAULT_DIRECTORY = Path().cwd()
@@ -27,9 +38,17 @@ def main():
     parser = argparse.ArgumentParser(description='Run create origin script')
     parser.add_argument(
         'cmd_args',
-        nargs='+',
+        nargs='*',
         help='Command arguments to send to sniffave (ex: "WAVE_RING"). \
 See "sniffwave" for more information.')
+    parser.add_argument(
+        '-s', '--spec',
+        action='append',
+        default=[],
+        type=SniffwaveSpec.from_string,
+        help='Additional sniffwave invocation, can be repeated.  Packets are \
+tagged with the source prefix or the ring name \
+(ex: "imports=IMPORT_RING IU wild wild wild")')
     parser.add_argument(
         '-v', '--verbose',
         action='count',
@@ -45,6 +64,71 @@ See "sniffwave" for more information.')
         type=int,
         help=f'Timeout condition (s) for the HDF queue \
 (default: {DEFAULT_TIMEOUT})')
+    parser.add_argument(
+        '-A', '--archive-format',
+        choices=['hdf5', 'hdf5-swmr', 'parquet'],
+        default='hdf5',
+        help='Format of the archive, hdf5-swmr (SWMR mode) and parquet (a \
+part file per flush) can be read during the current hour (default: hdf5)')
+    parser.add_argument(
+        '-f', '--flush-rows',
+        default=DEFAULT_FLUSH_ROWS,
+        type=int,
+        help=f'Write to the HDF5 archive once the amount of rows is pending \
+(default: {DEFAULT_FLUSH_ROWS})')
+    parser.add_argument(
+        '-F', '--flush-delay',
+        default=DEFAULT_FLUSH_DELAY,
+        type=float,
+        help=f'Write to the HDF5 archive once the oldest row pending is \
+older than the time (s) (default: {DEFAULT_FLUSH_DELAY})')
+    parser.add_argument(
+        '-W', '--writer-process',
+        action='store_true',
+        help='Write the HDF5 archive from a separate process so compression \
+does not slow down reading sniffwave')
+    parser.add_argument(
+        '-z', '--compression',
+        choices=list(PROFILES),
+        default=DEFAULT_PROFILE,
+        help=f'Compression profile of the HDF5 archive, see \
+sniffwave_compression to compare them (default: {DEFAULT_PROFILE})')
+    parser.add_argument(
+        '-C', '--compact',
+        action='store_true',
+        help='Compact and index each hourly HDF5 file once its hour is \
+over, in the background')
+    parser.add_argument(
+        '-R', '--rollup',
+        action='store_true',
+        help='Write per minute, per channel aggregates of the packets to \
+daily rollup files')
+    parser.add_argument(
+        '-Q', '--sketches',
+        action='store_true',
+        help='Write hourly latency quantile sketches of each channel to the \
+daily rollup files')
+    parser.add_argument(
+        '-L', '--latest-state',
+        help='Publish the latest state of every channel to a memory mapped \
+table read by check_arrival_metrics --state-file \
+(ex: /dev/shm/sniffwave_latest_state)')
+    parser.add_argument(
+        '-a', '--arrival-file',
+        default=DEFAULT_ARRIVAL_FILE,
+        help=f'File of the latest arrival statistics read by \
+check_arrival_metrics, a binary snapshot when its suffix is \
+{SNAPSHOT_SUFFIX}, empty to disable (default: {DEFAULT_ARRIVAL_FILE})')
+    parser.add_argument(
+        '-E', '--arrival-csv',
+        help='CSV export of the latest arrival statistics, written with the \
+binary snapshot (ex: /data/sniffwave/latest_arrival.csv)')
+    parser.add_argument(
+        '-i', '--arrival-interval',
+        default=DEFAULT_ARRIVAL_INTERVAL,
+        type=float,
+        help=f'Minimum time (s) between writes of the arrival file, only \
+written when a channel changed (default: {DEFAULT_ARRIVAL_INTERVAL})')
     parser.add_argument(
         '-m', '--max-lines',
         default=-1,
@@ -57,7 +141,112 @@ See "sniffwave" for more information.')
         help='Max amount of allowed sniffwave fails (-1 for infinite) \
 (default: 10)')
 
+    parser.add_argument(
+        '-c', '--chunk-size',
+        default=0,
+        type=int,
+        help=f'Read sniffwave output in chunks of bytes, for example \
+{DEFAULT_CHUNK_SIZE} (0 to read line by line) (default: 0)')
+
+    parser.add_argument(
+        '-p', '--parse-processes',
+        default=0,
+        type=int,
+        help='Parse the chunks (--chunk-size) in a pool of processes, the \
+reader thread only reads the pipe (thread engine) (default: 0)')
+    parser.add_argument(
+        '-b', '--broadcast-size',
+        default=0,
+        type=int,
+        help='Publish messages once in a broadcast ring buffer of the size \
+read by every worker (thread engine) (default: 0, one queue per worker)')
+    parser.add_argument(
+        '-q', '--queue-size',
+        default=0,
+        type=int,
+        help='Maximum amount of messages in each worker queue (thread \
+engine) (default: 0, unbounded)')
+    parser.add_argument(
+        '-o', '--overflow',
+        choices=[policy.value for policy in OverflowPolicy],
+        default=OverflowPolicy.block.value,
+        help=f'Policy when a worker falls behind a full broadcast ring or \
+queue, drop_newest and latest_only apply to queues, spill to the ring \
+(default: {OverflowPolicy.block.value})')
+    parser.add_argument(
+        '-r', '--max-restarts',
+        default=0,
+        type=int,
+        help='Respawn sniffwave when it exits or hangs, the workers are \
+kept running (-1 for infinite) (thread engine) (default: 0)')
+    parser.add_argument(
+        '-H', '--hang-timeout',
+        default=0,
+        type=float,
+        help='Kill sniffwave when it produces no output for the time (s), \
+see --max-restarts (default: 0, never)')
+    parser.add_argument(
+        '-B', '--max-backoff',
+        default=5,
+        type=float,
+        help='Maximum delay (s) before respawning sniffwave, keep the hang \
+timeout and backoff below the worker timeout (default: 5)')
+    parser.add_argument(
+        '-P', '--program',
+        default='sniffwave',
+        help='Sniffwave executable, for example sniffwave_synthetic to \
+benchmark without Earthworm (default: sniffwave)')
+    parser.add_argument(
+        '--replay',
+        action='append',
+        default=[],
+        help='Replay a captured sniffwave output file instead of executing \
+sniffwave, can be repeated (thread engine)')
+    parser.add_argument(
+        '--replay-rate',
+        default=1.0,
+        type=float,
+        help='Replay rate multiplier (0 as fast as possible) (default: 1)')
+    parser.add_argument(
+        '--replay-loops',
+        default=1,
+        type=int,
+        help='Amount of passes over the replayed files (-1 for infinite) \
+(default: 1)')
+    parser.add_argument(
+        '--replay-rewrite',
+        action='store_true',
+        help='Rewrite the replayed timestamps so packets arrive now and each \
+pass follows the previous one')
+    parser.add_argument(
+        '-e', '--engine',
+        choices=['thread', 'asyncio'],
+        default='thread',
+        help='Engine supervising sniffwave and the workers (default: thread)')
+
     args = parser.parse_args()
+    if not args.cmd_args and not args.spec and not args.replay:
+        parser.error('cmd_args or at least one --spec is required')
+    worker_class = HDF5Worker
+    if args.archive_format != 'hdf5' and (
+            args.writer_process or args.compact):
+        parser.error('--writer-process and --compact only apply to the \
+hdf5 archive')
+    if args.archive_format == 'parquet':
+        # pyarrow is only required by the parquet archive
+        from pysniffwave.workers.parquet import ParquetWorker
+        worker_class = ParquetWorker
+    specs = args.spec
+    if args.cmd_args:
+        specs = [SniffwaveSpec(cmd_args=args.cmd_args), *specs]
+    replay = None
+    if args.replay:
+        replay = Replay(
+            paths=args.replay,
+            rate=args.replay_rate,
+            loops=args.replay_loops,
+            rewrite_times=args.replay_rewrite)
+        specs = specs or [SniffwaveSpec()]
 
     # Set logging level
     logging.basicConfig(
@@ -67,11 +256,42 @@ See "sniffwave" for more information.')
         level=logging.WARNING - (args.verbose * 10))
 
     # start the worker thread
-    myworker = HDF5Worker(
+    myworker = worker_class(
         directory=args.directory,
-        timeout=args.timeout)
-    sniffwave.start(
-        myworker,
-        cmd_args=args.cmd_args,
-        max_lines=args.max_lines,
-        max_fails=args.max_fails)
+        timeout=args.timeout,
+        flush_rows=args.flush_rows,
+        flush_delay=args.flush_delay,
+        writer_process=args.writer_process,
+        compression=args.compression,
+        compact=args.compact,
+        rollup=args.rollup,
+        sketches=args.sketches,
+        swmr=args.archive_format == 'hdf5-swmr',
+        latest_state=args.latest_state,
+        arrival_file=args.arrival_file or None,
+        arrival_interval=args.arrival_interval,
+        arrival_csv=args.arrival_csv)
+    if args.engine == 'asyncio':
+        sniffwave_aio.start(
+            myworker,
+            cmd_args=specs,
+            max_lines=args.max_lines,
+            max_fails=args.max_fails,
+            chunk_size=args.chunk_size or None,
+            program=args.program)
+    else:
+        sniffwave.start(
+            myworker,
+            cmd_args=specs,
+            max_lines=args.max_lines,
+            max_fails=args.max_fails,
+            chunk_size=args.chunk_size or None,
+            parse_processes=args.parse_processes,
+            broadcast_size=args.broadcast_size,
+            overflow=OverflowPolicy(args.overflow),
+            queue_size=args.queue_size,
+            max_restarts=args.max_restarts,
+            hang_timeout=args.hang_timeout,
+            max_backoff=args.max_backoff,
+            replay=replay,
+            program=args.program)
@@ -0,0 +1,167 @@
+'''
+Sniffwave query
+===============
+
+Utility querying the HDF5 archive of the logger.  Rows are written as
+CSV, one hourly file (or chunk) at a time so large time ranges are
+streamed.  With aggregate, the statistics per channel of a column are
+written instead of the rows, computed over chunks in constant memory.
+On the sketches table, aggregate merges the hourly latency sketches
+by channel (or the by columns, ex: network) and writes their quantiles
+without reading the packets.  The SWMR HDF5 and parquet archives (channels
+and errors tables, including the current hour) are queried with
+archive-format.
+
+..  codeauthor:: Charles Blais
+'''
+import argparse
+import datetime
+import logging
+import sys
+
+from pathlib import Path
+
+from pysniffwave.hdf5.aggregate import DEFAULT_QUANTILES, ChannelAggregator
+from pysniffwave.hdf5.query import SKETCH_TABLE, TABLES, Query, iter_query
+from pysniffwave.hdf5.sketches import SketchMerger
+from pysniffwave.hdf5.swmr import iter_query as iter_swmr
+
+
+DEFAULT_DIRECTORY = Path().cwd()
+DEFAULT_CHUNKSIZE = 100000
+
+
+def main():
+    '''
+    See module description
+    '''
+    parser = argparse.ArgumentParser(
+        description='Query the sniffwave HDF5 archive')
+    parser.add_argument(
+        'starttime',
+        type=datetime.datetime.fromisoformat,
+        help='Start of the time range (ex: 2010-06-22T14:00:00)')
+    parser.add_argument(
+        'endtime',
+        type=datetime.datetime.fromisoformat,
+        help='End of the time range, exclusive (ex: 2010-06-22T15:00:00)')
+    parser.add_argument(
+        '-d', '--directory',
+        default=DEFAULT_DIRECTORY,
+        help=f'Directory of the HDF5 archive (default: {DEFAULT_DIRECTORY})')
+    parser.add_argument(
+        '-A', '--archive-format',
+        choices=['hdf5', 'hdf5-swmr', 'parquet'],
+        default='hdf5',
+        help='Format of the archive (default: hdf5)')
+    parser.add_argument(
+        '-N', '--network',
+        help='Network codes, comma separated, wildcards allowed')
+    parser.add_argument(
+        '-S', '--station',
+        help='Station codes, comma separated, wildcards allowed')
+    parser.add_argument(
+        '-L', '--location',
+        help='Location codes, comma separated, wildcards allowed')
+    parser.add_argument(
+        '-C', '--channel',
+        help='Channel codes, comma separated, wildcards allowed (ex: HN?)')
+    parser.add_argument(
+        '-c', '--columns',
+        help='Columns returned, comma separated (default: all)')
+    parser.add_argument(
+        '-t', '--table',
+        choices=TABLES,
+        default='channels',
+        help='Table queried, rollup for the per minute aggregates, sketches \
+for the hourly latency sketches (default: channels)')
+    parser.add_argument(
+        '-p', '--processes',
+        type=int,
+        help='Amount of processes reading the files (default: cpu count)')
+    parser.add_argument(
+        '-k', '--chunksize',
+        type=int,
+        help=f'Stream the rows in chunks of the size (default: one frame \
+per hourly file, {DEFAULT_CHUNKSIZE} with --aggregate)')
+    parser.add_argument(
+        '-a', '--aggregate',
+        help='Write the count, mean, max and quantiles per channel of the \
+column (ex: data_latency) instead of the rows, on the sketches table the \
+quantiles of the latency sketches merged')
+    parser.add_argument(
+        '-b', '--by',
+        help='Columns grouping the sketches merged, comma separated, empty \
+for a single group (ex: network) (default: channel SCNL)')
+    parser.add_argument(
+        '-q', '--quantile',
+        action='append',
+        type=float,
+        help=f'Quantile of the aggregate, can be repeated \
+(default: {" ".join(str(q) for q in DEFAULT_QUANTILES)})')
+    parser.add_argument(
+        '-o', '--output',
+        help='CSV file of the results (default: stdout)')
+    parser.add_argument(
+        '-v', '--verbose',
+        action='count',
+        default=0,
+        help='Verbosity')
+
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(asctime)s %(levelname)s %(message)s',
+        level=logging.WARNING - (args.verbose * 10))
+
+    aggregator = None
+    columns = args.columns.split(',') if args.columns else None
+    chunksize = args.chunksize
+    if args.aggregate and args.table == SKETCH_TABLE:
+        by = None if args.by is None \
+            else [column for column in args.by.split(',') if column]
+        aggregator = SketchMerger(args.aggregate, by, args.quantile)
+        columns = aggregator.columns
+        chunksize = chunksize or DEFAULT_CHUNKSIZE
+    elif args.aggregate:
+        aggregator = ChannelAggregator(args.aggregate, args.quantile)
+        columns = aggregator.columns
+        chunksize = chunksize or DEFAULT_CHUNKSIZE
+
+    query = Query(
+        starttime=args.starttime,
+        endtime=args.endtime,
+        network=args.network,
+        station=args.station,
+        location=args.location,
+        channel=args.channel,
+        columns=columns,
+        table=args.table)
+
+    output = sys.stdout if args.output is None \
+        else open(args.output, 'w', newline='')
+    if args.archive_format == 'parquet':
+        # pyarrow is only required by the parquet archive
+        from pysniffwave.parquet.query import iter_query as iter_parquet
+        chunks = iter_parquet(args.directory, query)
+    elif args.archive_format == 'hdf5-swmr':
+        chunks = iter_swmr(args.directory, query)
+    else:
+        chunks = iter_query(args.directory, query, args.processes, chunksize)
+    try:
+        if aggregator is not None:
+            aggregator.consume(chunks).result().to_csv(output)
+            return
+        header = True
+        for df in chunks:
+            if df.empty:
+                continue
+            df.to_csv(output, header=header, index=False)
+            header = False
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
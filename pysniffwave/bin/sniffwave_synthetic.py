@@ -0,0 +1,103 @@
+'''
+Sniffwave synthetic
+===================
+
+Utility writing synthetic sniffwave output, it can stand in for the
+sniffwave program of the logger (ex: sniffwave_logger --program
+sniffwave_synthetic "WAVE_RING -n 10000").
+
+..  codeauthor:: Charles Blais
+'''
+import argparse
+import os
+import sys
+
+from pysniffwave.sniffwave.synthetic import Synthetic, run
+
+
+def main():
+    '''
+    See module description
+    '''
+    parser = argparse.ArgumentParser(
+        description='Write synthetic sniffwave output')
+    parser.add_argument(
+        'cmd_args',
+        nargs='*',
+        help='Sniffwave arguments (ex: "WAVE_RING"), ignored')
+    parser.add_argument(
+        '-n', '--channels',
+        default=100,
+        type=int,
+        help='Amount of channels, 3 per station (default: 100)')
+    parser.add_argument(
+        '-s', '--sample-rate',
+        action='append',
+        type=float,
+        help='Sample rate (Hz) of the stations, can be repeated to assign \
+rates in turn (default: 100)')
+    parser.add_argument(
+        '-l', '--packet-length',
+        default=1.0,
+        type=float,
+        help='Duration (s) of a packet (default: 1)')
+    parser.add_argument(
+        '-L', '--latency',
+        default=2.0,
+        type=float,
+        help='Mean data latency (s) (default: 2)')
+    parser.add_argument(
+        '-j', '--latency-jitter',
+        default=0.5,
+        type=float,
+        help='Standard deviation of the data latency (s) (default: 0.5)')
+    parser.add_argument(
+        '-f', '--feeding-latency',
+        default=0.2,
+        type=float,
+        help='Feeding latency (s) (default: 0.2)')
+    parser.add_argument(
+        '-e', '--error-rate',
+        default=0.0,
+        type=float,
+        help='Probability of a packet to be a gap, overlap or out-of-order \
+(default: 0)')
+    parser.add_argument(
+        '-r', '--rate',
+        default=1.0,
+        type=float,
+        help='Rate multiplier (0 as fast as possible) (default: 1)')
+    parser.add_argument(
+        '-d', '--duration',
+        default=-1,
+        type=float,
+        help='Duration (s) of data generated (-1 for infinite) (default: -1)')
+    parser.add_argument(
+        '--seed',
+        type=int,
+        help='Seed of the random generator')
+
+    args = parser.parse_args()
+
+    config = Synthetic(
+        channels=args.channels,
+        sample_rates=args.sample_rate or [100.0],
+        packet_length=args.packet_length,
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        feeding_latency=args.feeding_latency,
+        error_rate=args.error_rate,
+        rate=args.rate,
+        duration=args.duration,
+        seed=args.seed)
+    try:
+        run(config, sys.stdout)
+    except BrokenPipeError:
+        # the reader stopped, silence the flush at exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
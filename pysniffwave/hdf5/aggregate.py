@@ -0,0 +1,158 @@
+'''
+HDF5 aggregate
+==============
+
+Incremental per channel statistics of a column (ex: data_latency)
+computed over the chunks streamed from the archive (see
+:func:`pysniffwave.hdf5.query.iter_query` with chunksize), so reports
+over weeks of data run in constant memory.
+
+Statistics are the count, mean, max and quantiles (from a
+:class:`pysniffwave.sketch.QuantileSketch` per channel).  Channels are
+identified by their SCNL code NET.STA.LOC.CHA.
+
+..  codeauthor:: Charles Blais
+'''
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from pysniffwave.sketch import DEFAULT_RELATIVE_ACCURACY, QuantileSketch
+
+from .query import SCNL_COLUMNS
+
+DEFAULT_QUANTILES = [0.5, 0.95, 0.99]
+
+
+def scnl(df: pd.DataFrame) -> pd.Series:
+    '''
+    SCNL code of each row (NET.STA.LOC.CHA)
+
+    :rtype: pd.Series
+    '''
+    return df['network'].str.cat(
+        [df['station'], df['location'], df['channel']], sep='.')
+
+
+class ChannelAggregator(object):
+    '''
+    See module description.
+
+    :param str column: column aggregated
+    :param quantiles: quantiles reported
+    :param float relative_accuracy: relative accuracy of the quantiles
+    '''
+    def __init__(
+        self,
+        column: str = 'data_latency',
+        quantiles: Optional[List[float]] = None,
+        relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY,
+    ):
+        self.column = column
+        self.quantiles = DEFAULT_QUANTILES if quantiles is None \
+            else quantiles
+        self.relative_accuracy = relative_accuracy
+        self.rows = 0
+        self._totals: Optional[pd.DataFrame] = None
+        self._sketches: Dict[str, QuantileSketch] = {}
+        # used to compute the buckets of every channel at once
+        self._sketch = QuantileSketch(relative_accuracy)
+
+    @property
+    def columns(self) -> List[str]:
+        '''
+        Columns required in the chunks
+        '''
+        return [*SCNL_COLUMNS, self.column]
+
+    def update(self, df: pd.DataFrame) -> None:
+        '''
+        Add a chunk of rows
+
+        :param df: rows with the SCNL columns and the column aggregated
+        '''
+        if df.empty:
+            return
+        self.rows += len(df)
+        keys = scnl(df)
+        values = df[self.column].astype('float64')
+        totals = values.groupby(keys).agg(['count', 'sum', 'max'])
+        if self._totals is None:
+            self._totals = totals
+        else:
+            merged = self._totals.reindex(
+                self._totals.index.union(totals.index))
+            other = totals.reindex(merged.index)
+            merged['count'] = merged['count'].fillna(0) \
+                + other['count'].fillna(0)
+            merged['sum'] = merged['sum'].fillna(0) + other['sum'].fillna(0)
+            merged['max'] = np.fmax(merged['max'], other['max'])
+            self._totals = merged
+
+        # bucket counts of every channel in a single group by
+        valid = values.notna().to_numpy()
+        keys, values = keys[valid], values[valid].to_numpy()
+        low = values < self._sketch.min_value
+        buckets = np.zeros(len(values), dtype='int64')
+        buckets[~low] = self._sketch.bucket(values[~low])
+        counts = pd.DataFrame({
+            'scnl': keys.to_numpy(),
+            'bucket': buckets,
+            'low': low,
+        }).groupby(['scnl', 'low', 'bucket']).size()
+        for (key, is_low, bucket), count in counts.items():
+            sketch = self._sketches.get(key)
+            if sketch is None:
+                sketch = self._sketches[key] = QuantileSketch(
+                    self.relative_accuracy)
+            if is_low:
+                sketch.zero += count
+                sketch.count += count
+            else:
+                sketch.add_buckets([bucket], [count])
+
+    def consume(self, chunks: Iterable[pd.DataFrame]) -> 'ChannelAggregator':
+        '''
+        Add every chunk of the iterator
+
+        :rtype: :class:`ChannelAggregator`
+        '''
+        for chunk in chunks:
+            self.update(chunk)
+        return self
+
+    def sketch(self, key: str) -> QuantileSketch:
+        '''
+        Quantile sketch of a channel
+
+        :param str key: SCNL code
+        :rtype: :class:`QuantileSketch`
+        '''
+        return self._sketches[key]
+
+    def result(self) -> pd.DataFrame:
+        '''
+        Statistics per channel
+
+        :rtype: pd.DataFrame
+        :returns: count, mean, max and one column per quantile
+            (ex: p50, p95) indexed by SCNL code
+        '''
+        names = ['count', 'mean', 'max', *[
+            f'p{q * 100:g}' for q in self.quantiles]]
+        if self._totals is None:
+            return pd.DataFrame(columns=names)
+        totals = self._totals
+        result = pd.DataFrame({
+            'count': totals['count'].astype('int64'),
+            'mean': totals['sum'] / totals['count'],
+            'max': totals['max'],
+        }, index=totals.index)
+        for q, name in zip(self.quantiles, names[3:]):
+            result[name] = [
+                self._sketches[key].quantile(q)
+                if key in self._sketches else np.nan
+                for key in result.index]
+        result.index.name = 'scnl'
+        return result.sort_index()
@@ -29,14 +29,27 @@ Their table structure matches the same as the sql database example.
 
 The reader will return a pd.Dataframe based on the conditions sent.
 
+.. see:: pysniffwave.hdf5.query
+
+Files are compressed with a named profile (default: zlib level 3).
+
+.. see:: pysniffwave.hdf5.compression
+
 ..  codeauthor:: Charles Blais
 '''
 import logging
-from typing import Optional, Union
+from typing import Callable, Dict, Iterator, List, Optional, Union
 import datetime
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
+
+from pysniffwave.sniffwave.columnar import to_frame
+
+from .compression import DEFAULT_PROFILE, CompressionProfile, \
+    get_profile, open_store
+from .query import Query, iter_query, read
 pd.set_option('display.max_rows', None)
 
 MIN_ITEMSIZE_CHANNELS = {
@@ -49,6 +62,9 @@ MIN_ITEMSIZE_ERRORS = {
     **MIN_ITEMSIZE_CHANNELS,
     'error': 20,
 }
+MIN_ITEMSIZE_SOURCE = {
+    'source': 20,
+}
 DTYPES = {
     'n_samples': 'uint16',
     'n_bytes': 'uint16',
@@ -65,12 +81,19 @@ class Client(object):
 
     :param str directory: directory where information is saved
         (default: is cwd)
+    :param compression: name of the compression profile or profile
+    :param on_close: function called with the filename of each hourly
+        file closed once its hour is over (ex: compaction)
     '''
     def __init__(
         self,
-        directory: Optional[Union[str, Path]] = None
+        directory: Optional[Union[str, Path]] = None,
+        compression: Union[str, CompressionProfile] = DEFAULT_PROFILE,
+        on_close: Optional[Callable[[Path], None]] = None,
     ):
         self.directory = Path.cwd() if directory is None else Path(directory)
+        self.compression = get_profile(compression)
+        self.on_close = on_close
         self._store: Optional[pd.HDFStore] = None
 
     def get_filename(self, at: datetime.datetime) -> Path:
@@ -90,6 +113,21 @@ class Client(object):
             at.strftime('%d'),
             f'sniffwave_{at.strftime("%Y%m%d_%H")}.h5')
 
+    def get_rollup_filename(self, at: datetime.datetime) -> Path:
+        '''
+        Generate the filename of the daily rollup file (see
+        :mod:`pysniffwave.hdf5.rollup` and :mod:`pysniffwave.hdf5.sketches`)
+        based on the at time
+
+        :rtype: Path
+        :returns: filename
+        '''
+        return self.directory.joinpath(
+            at.strftime('%Y'),
+            at.strftime('%m'),
+            at.strftime('%d'),
+            f'sniffwave_rollup_{at.strftime("%Y%m%d")}.h5')
+
     def get_store(self, at: datetime.datetime, **kwargs) -> pd.HDFStore:
         '''
         Set the hdf5 store based on the at time and the directory
@@ -103,26 +141,24 @@ class Client(object):
         :return: :class:`pd.HDFStore`
         '''
         filename = self.get_filename(at)
+        # PyTables has no SWMR mode, the file can only be read once
+        # closed (see pysniffwave.hdf5.swmr for live reads)
         store_props = {
             'path': filename,
-            'libver': 'latest',
-            'swmr': True,
-            'complib': 'zlib',
-            'complevel': 9,
             **kwargs
         }
 
         if self._store is None:
             logging.info(f'HDF5 not set, open new store at {filename}')
-        elif self._store.filename == filename:
+        elif Path(self._store.filename) == filename:
             logging.debug(f'HDF5 has not change: {filename}')
             return self._store
         else:
             logging.debug(f'HDF5 has changed change: {filename}')
-            self._store.close()
+            self._close_store(rollover=True)
         # make the directory if it doesn't exist
         filename.parent.mkdir(mode=0o755, parents=True, exist_ok=True)
-        self._store = pd.HDFStore(**store_props)
+        self._store = open_store(self.compression, **store_props)
         return self._store
 
     @staticmethod
@@ -136,61 +172,215 @@ class Client(object):
             if column in DTYPES:
                 df[column] = df[column].astype(DTYPES[column])
 
+    @staticmethod
+    def _min_itemsize(
+        df: pd.DataFrame,
+        min_itemsize: Dict[str, int],
+    ) -> Dict[str, int]:
+        '''
+        Add the size of the source column when the packets are tagged
+        '''
+        if 'source' in df.columns:
+            return {**min_itemsize, **MIN_ITEMSIZE_SOURCE}
+        return min_itemsize
+
     def write(
         self,
-        df: pd.DataFrame,
-        at: datetime.datetime = datetime.datetime.now()
+        df: Union[pd.DataFrame, np.ndarray],
+        at: datetime.datetime = datetime.datetime.now(),
+        source: Optional[str] = None,
     ):
         '''
         Insert the dataframe into an HDF5 daily file
         based on the "at" time.
 
-        :param df: dataframe to write
+        :param df: dataframe or structured array of the columnar parser
+            to write
         :type at: class::`datetime.datetime`
         :param at: current timestamp used to generate the filename
+        :param str source: source tag of the structured array
         '''
+        if isinstance(df, np.ndarray):
+            df = to_frame(df, source)
         store = self.get_store(at, mode='a')
         Client._format_df(df)
         logging.debug(f'Writing following df\n:{df}')
         store.append(
             'channels', df,
             format='t',
-            min_itemsize=MIN_ITEMSIZE_CHANNELS,
+            min_itemsize=Client._min_itemsize(df, MIN_ITEMSIZE_CHANNELS),
             index=False,
             data_columns=True)
         logging.debug('df write complete')
 
     def write_error(
         self,
-        df: pd.DataFrame,
-        at: datetime.datetime = datetime.datetime.now()
+        df: Union[pd.DataFrame, np.ndarray],
+        at: datetime.datetime = datetime.datetime.now(),
+        source: Optional[str] = None,
     ):
         '''
         Insert the dataframe into an HDF5 daily file
         based on the "at" time.
 
-        :param df: dataframe to write
+        :param df: dataframe or structured array of the columnar parser
+            to write
 
         :type at: class::`datetime.datetime`
         :param at: current timestamp used to generate the filename
+        :param str source: source tag of the structured array
         '''
+        if isinstance(df, np.ndarray):
+            df = to_frame(df, source)
         store = self.get_store(at, mode='a')
         Client._format_df(df)
         logging.debug(f'Writing following error df\n:{df}')
         store.append(
             'errors', df,
             format='t',
-            min_itemsize=MIN_ITEMSIZE_ERRORS,
+            min_itemsize=Client._min_itemsize(df, MIN_ITEMSIZE_ERRORS),
             index=False,
             data_columns=True)
         logging.debug('error df write complete')
 
+    def _close_store(self, rollover: bool = False) -> None:
+        '''
+        Close the HDF5 store and hand the file to on_close if its hour
+        is over (rollover or closed after the hour)
+        '''
+        if self._store is None:
+            return
+        filename = Path(self._store.filename)
+        was_open = self._store.is_open
+        self._store.close()
+        self._store = None
+        if self.on_close is None or not was_open:
+            return
+        if rollover or filename != self.get_filename(datetime.datetime.now()):
+            self.on_close(filename)
+
+    def _query(
+        self,
+        table: str,
+        starttime: datetime.datetime,
+        endtime: datetime.datetime,
+        network: Optional[str] = None,
+        station: Optional[str] = None,
+        location: Optional[str] = None,
+        channel: Optional[str] = None,
+        columns: Optional[List[str]] = None,
+    ) -> Query:
+        return Query(
+            starttime=starttime,
+            endtime=endtime,
+            network=network,
+            station=station,
+            location=location,
+            channel=channel,
+            columns=columns,
+            table=table)
+
+    def find(
+        self,
+        *args,
+        processes: Optional[int] = None,
+        **kwargs,
+    ) -> pd.DataFrame:
+        '''
+        Search the channels of the archive
+
+        :param starttime: start time of insert
+        :param endtime: end time of insert
+        :param str network: network codes (comma separated, wildcards)
+        :param str station: station codes (comma separated, wildcards)
+        :param str location: location codes (comma separated, wildcards)
+        :param str channel: channel codes (comma separated, wildcards)
+        :param columns: columns returned (default: all)
+        :param int processes: amount of processes reading the files
+
+        :rtype: pd.Dataframe
+        '''
+        return read(
+            self.directory,
+            self._query('channels', *args, **kwargs),
+            processes)
+
+    def find_error(
+        self,
+        *args,
+        processes: Optional[int] = None,
+        **kwargs,
+    ) -> pd.DataFrame:
+        '''
+        Search the special conditions of the archive
+
+        .. see:: find
+        '''
+        return read(
+            self.directory,
+            self._query('errors', *args, **kwargs),
+            processes)
+
+    def find_rollup(
+        self,
+        *args,
+        processes: Optional[int] = None,
+        **kwargs,
+    ) -> pd.DataFrame:
+        '''
+        Search the per minute rollups of the archive (time range on the
+        minute)
+
+        .. see:: find
+        '''
+        return read(
+            self.directory,
+            self._query('rollup', *args, **kwargs),
+            processes)
+
+    def find_sketches(
+        self,
+        *args,
+        processes: Optional[int] = None,
+        **kwargs,
+    ) -> pd.DataFrame:
+        '''
+        Search the hourly latency sketches of the archive (time range on
+        the hour), see :class:`pysniffwave.hdf5.sketches.SketchMerger` to
+        merge them
+
+        .. see:: find
+        '''
+        return read(
+            self.directory,
+            self._query('sketches', *args, **kwargs),
+            processes)
+
+    def iter_find(
+        self,
+        *args,
+        table: str = 'channels',
+        processes: Optional[int] = None,
+        chunksize: Optional[int] = None,
+        **kwargs,
+    ) -> Iterator[pd.DataFrame]:
+        '''
+        Search the archive in time order, one frame per hourly file or
+        frames of at most chunksize rows
+
+        .. see:: find
+        '''
+        return iter_query(
+            self.directory,
+            self._query(table, *args, **kwargs),
+            processes,
+            chunksize)
+
     def close(self):
         '''
         Close the HDF5 store befor exiting
         '''
-        if self._store is not None:
-            self._store.close()
+        self._close_store()
 
     def __del__(self):
         '''Desctructor'''
@@ -0,0 +1,156 @@
+'''
+HDF5 compaction
+===============
+
+Rewrite an hourly HDF5 file once it is closed.  Appending every few
+seconds leaves the tables fragmented in small chunks without index.
+The compacted file has:
+
+1. tables sorted by recorded_at, with a chunk shape sized for the
+   amount of rows of the hour
+2. a completely sorted index (CSI) on the time and SCNL columns, so
+   where clauses on a station or a time range are index lookups
+
+The file is written next to the original and atomically replaces it,
+readers holding the original open keep reading the previous version.
+
+:class:`Compactor` compacts the files in a background process so the
+logger is not slowed down.
+
+..  codeauthor:: Charles Blais
+'''
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import signal
+
+from pathlib import Path
+from typing import Union
+
+import pandas as pd
+
+from .client import MIN_ITEMSIZE_CHANNELS, MIN_ITEMSIZE_ERRORS, Client
+from .compression import DEFAULT_PROFILE, CompressionProfile, \
+    get_profile, open_store
+
+INDEX_COLUMNS = {
+    'channels': [
+        'recorded_at', 'start_time',
+        'network', 'station', 'location', 'channel'],
+    'errors': [
+        'recorded_at', 'start_time',
+        'network', 'station', 'location', 'channel'],
+}
+MIN_ITEMSIZE = {
+    'channels': MIN_ITEMSIZE_CHANNELS,
+    'errors': MIN_ITEMSIZE_ERRORS,
+}
+
+
+def compact(
+    filename: Union[str, Path],
+    compression: Union[str, CompressionProfile] = DEFAULT_PROFILE,
+) -> Path:
+    '''
+    Compact and index an HDF5 file of the archive
+
+    :param filename: hourly HDF5 file
+    :param compression: name of the compression profile or profile
+    :rtype: Path
+    :returns: filename
+    '''
+    filename = Path(filename)
+    profile = get_profile(compression)
+    compacted = filename.with_name(f'.{filename.name}.compact')
+    try:
+        with pd.HDFStore(filename, mode='r') as source, open_store(
+                profile, path=compacted, mode='w') as target:
+            for table in ('channels', 'errors'):
+                if f'/{table}' not in source.keys():
+                    continue
+                df = source.select(table)
+                df.sort_values(
+                    'recorded_at', kind='stable', inplace=True,
+                    ignore_index=True)
+                target.append(
+                    table, df,
+                    format='t',
+                    min_itemsize=Client._min_itemsize(
+                        df, MIN_ITEMSIZE[table]),
+                    index=False,
+                    data_columns=True,
+                    expectedrows=max(len(df), 1))
+                target.create_table_index(
+                    table,
+                    columns=[column for column in INDEX_COLUMNS[table]
+                             if column in df.columns],
+                    optlevel=9,
+                    kind='full')
+        os.replace(compacted, filename)
+    except BaseException:
+        compacted.unlink(missing_ok=True)
+        raise
+    logging.info(f'Compacted {filename}')
+    return filename
+
+
+def _init_process():
+    '''
+    Interruptions are handled by the parent process
+    '''
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+
+class Compactor(object):
+    '''
+    Compact the closed HDF5 files in a background process
+
+    :param compression: name of the compression profile or profile
+    :param bool process: compact in a process, otherwise in a thread
+        (ex: from a daemon process which can not have children)
+    '''
+    def __init__(
+        self,
+        compression: Union[str, CompressionProfile] = DEFAULT_PROFILE,
+        process: bool = True,
+    ):
+        self.compression = compression
+        self.compacted = 0
+        self.failed = 0
+        self._executor: concurrent.futures.Executor
+        if process:
+            # spawn avoids forking the threads of the logger
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_process)
+        else:
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix='HDF5Compactor')
+
+    def _done(self, future: concurrent.futures.Future) -> None:
+        try:
+            future.result()
+            self.compacted += 1
+        except Exception:
+            self.failed += 1
+            logging.exception('Failed to compact HDF5 file')
+
+    def submit(self, filename: Union[str, Path]) -> None:
+        '''
+        Compact the file in the background
+
+        :param filename: closed hourly HDF5 file
+        '''
+        logging.info(f'Compacting {filename} in background')
+        self._executor.submit(
+            compact, filename, self.compression).add_done_callback(
+                self._done)
+
+    def close(self) -> None:
+        '''
+        Wait for the files submitted to be compacted
+        '''
+        self._executor.shutdown(wait=True)
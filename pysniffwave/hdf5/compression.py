@@ -0,0 +1,201 @@
+'''
+Compression profiles
+====================
+
+Named compression settings of the HDF5 archive.  A profile is the
+compression library and level passed to :class:`pd.HDFStore` plus the
+byte shuffle filter applied before compression (shuffle groups the
+bytes of the float32/uint16 columns, which usually compresses better).
+
+The default profile is zlib level 3, level 9 barely compresses the
+float32 latency columns better for a much higher CPU cost.  Use
+:func:`measure` (sniffwave_compression utility) to compare the profiles
+on a synthetic hour for a given host.
+
+..  codeauthor:: Charles Blais
+'''
+import datetime
+import shutil
+import tempfile
+import time
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+import pandas as pd
+import tables
+
+from pysniffwave.sniffwave.columnar import ColumnBatch, ColumnParser
+from pysniffwave.sniffwave.synthetic import Synthetic, generate
+
+
+@dataclass(frozen=True)
+class CompressionProfile:
+    '''
+    Compression settings of the HDF5 store
+
+    Properties
+    ----------
+    complib: str | None
+        Compression library (ex: zlib, blosc:lz4, blosc:zstd), None to
+        disable compression
+
+    complevel: int
+        Compression level (0-9)
+
+    shuffle: bool
+        Apply the byte shuffle filter before compressing
+    '''
+    complib: Optional[str]
+    complevel: int
+    shuffle: bool = True
+
+
+PROFILES: Dict[str, CompressionProfile] = {
+    'none': CompressionProfile(None, 0, False),
+    'zlib-1': CompressionProfile('zlib', 1),
+    'zlib-3': CompressionProfile('zlib', 3),
+    'zlib-6': CompressionProfile('zlib', 6),
+    'zlib-9': CompressionProfile('zlib', 9),
+    'zlib-3-noshuffle': CompressionProfile('zlib', 3, False),
+    'zlib-9-noshuffle': CompressionProfile('zlib', 9, False),
+    'blosc-lz4': CompressionProfile('blosc:lz4', 5),
+    'blosc-lz4-noshuffle': CompressionProfile('blosc:lz4', 5, False),
+    'blosc-zstd': CompressionProfile('blosc:zstd', 5),
+    'blosc-zstd-noshuffle': CompressionProfile('blosc:zstd', 5, False),
+}
+DEFAULT_PROFILE = 'zlib-3'
+
+
+def get_profile(
+    profile: Union[str, CompressionProfile],
+) -> CompressionProfile:
+    '''
+    Compression profile by name
+
+    :raises ValueError: unknown profile
+    :rtype: :class:`CompressionProfile`
+    '''
+    if isinstance(profile, CompressionProfile):
+        return profile
+    if profile not in PROFILES:
+        raise ValueError(
+            f'Unknown compression profile {profile}, '
+            f'expected one of {", ".join(PROFILES)}')
+    return PROFILES[profile]
+
+
+def open_store(profile: CompressionProfile, **kwargs) -> pd.HDFStore:
+    '''
+    Open an HDF5 store compressing the tables it creates with the profile
+
+    :param profile: compression profile
+    :param kwargs: any paramters to pass to pd.HDFStore
+    :rtype: :class:`pd.HDFStore`
+    '''
+    store = pd.HDFStore(**{
+        'complib': profile.complib,
+        'complevel': profile.complevel,
+        **kwargs})
+    if store._complevel:
+        # pandas does not expose the shuffle filter, the filters of the
+        # store are used for the tables it creates
+        store._filters = tables.Filters(
+            complevel=store._complevel,
+            complib=store._complib,
+            shuffle=profile.shuffle,
+            fletcher32=store._fletcher32)
+    return store
+
+
+def synthetic_hour(
+    channels: int = 300,
+    duration: float = 3600,
+    flush_delay: float = 5,
+    error_rate: float = 0.01,
+    seed: int = 0,
+) -> List[ColumnBatch]:
+    '''
+    Synthetic sniffwave output parsed in batches of flush_delay seconds,
+    as written by the HDF5 worker
+
+    :param int channels: amount of channels
+    :param float duration: duration (s) of data
+    :param float flush_delay: duration (s) of each batch
+    :param float error_rate: gap/overlap/out-of-order rate
+    :param int seed: seed of the generator
+    :rtype: [:class:`ColumnBatch`, ...]
+    '''
+    config = Synthetic(
+        channels=channels, error_rate=error_rate, duration=duration,
+        rate=0, seed=seed)
+    parser = ColumnParser()
+    start = time.time() - duration
+    batches: List[ColumnBatch] = []
+    lines: List[str] = []
+    flush_at = start + flush_delay
+    for arrival, line in generate(config, start):
+        if arrival >= flush_at and lines:
+            batches.append(parser.parse(lines, recorded_at=flush_at))
+            lines = []
+            flush_at += flush_delay
+        lines.append(line)
+    if lines:
+        batches.append(parser.parse(lines, recorded_at=flush_at))
+    return batches
+
+
+def measure(
+    batches: Iterable[ColumnBatch],
+    profiles: Optional[List[str]] = None,
+    directory: Optional[Union[str, Path]] = None,
+) -> List[Dict[str, Any]]:
+    '''
+    Write and read back the batches with every profile
+
+    :param batches: batches written one append at a time
+    :param profiles: names of the profiles (default: all)
+    :param directory: scratch directory (default: temporary)
+    :rtype: [dict, ...]
+    :returns: write us/row, read us/row and bytes/row per profile
+    '''
+    # avoid a circular import, the client uses the profiles
+    from .client import Client
+
+    batches = list(batches)
+    rows = sum(len(batch) for batch in batches)
+    at = datetime.datetime.now()
+    results = []
+    with tempfile.TemporaryDirectory(
+            prefix='pysniffwave_compression_', dir=directory) as scratch:
+        for name in profiles or list(PROFILES):
+            profile_directory = Path(scratch).joinpath(name)
+            client = Client(directory=profile_directory, compression=name)
+            started = time.perf_counter()
+            for batch in batches:
+                if len(batch.channels):
+                    client.write(batch.channels, at=at)
+                if len(batch.errors):
+                    client.write_error(batch.errors, at=at)
+            client.close()
+            write = time.perf_counter() - started
+
+            filename = client.get_filename(at)
+            started = time.perf_counter()
+            with pd.HDFStore(filename, mode='r') as store:
+                for table in ('channels', 'errors'):
+                    if table in store:
+                        store.select(table)
+            read = time.perf_counter() - started
+
+            size = filename.stat().st_size
+            results.append({
+                'profile': name,
+                'rows': rows,
+                'write_us_per_row': write / rows * 1e6,
+                'read_us_per_row': read / rows * 1e6,
+                'bytes_per_row': size / rows,
+            })
+            shutil.rmtree(profile_directory)
+    return results
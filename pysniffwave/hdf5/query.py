@@ -0,0 +1,335 @@
+'''
+HDF5 query
+==========
+
+Query the hourly HDF5 archive (see :mod:`pysniffwave.hdf5.client`).
+
+A :class:`Query` selects a table (channels or errors), a time range on
+recorded_at, SCNL codes and the columns returned.  The rollup table
+queries the daily per minute rollups (see :mod:`pysniffwave.hdf5.rollup`)
+on their minute column instead, the sketches table the hourly latency
+sketches (see :mod:`pysniffwave.hdf5.sketches`) on their hour column.
+SCNL codes are comma separated lists of codes which may hold wildcards
+(* and ?).
+
+The query is executed in three steps:
+
+1. files are pruned from the directory layout, only the hourly files
+   of the time range are opened (and the next one when the range ends
+   within FILE_SLACK of its hour, rows are written after being
+   recorded)
+2. the time range and the SCNL codes without wildcards are pushed down
+   as where clauses of :meth:`pd.HDFStore.select` (index lookups on
+   compacted files), codes with wildcards are matched on the rows read
+3. files are read in parallel by a pool of processes and returned in
+   time order, concatenated or as an iterator of one frame per file
+
+With a chunksize, files are streamed one after the other in chunks of
+at most chunksize rows (see :mod:`pysniffwave.hdf5.aggregate` for
+statistics computed over the chunks in constant memory).
+
+..  codeauthor:: Charles Blais
+'''
+import concurrent.futures
+import datetime
+import fnmatch
+import multiprocessing
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, List, Optional, Union
+
+import pandas as pd
+
+ROLLUP_TABLE = 'rollup'
+SKETCH_TABLE = 'sketches'
+TABLES = ['channels', 'errors', ROLLUP_TABLE, SKETCH_TABLE]
+# tables of the daily rollup files
+DAILY_TABLES = [ROLLUP_TABLE, SKETCH_TABLE]
+SCNL_COLUMNS = ['network', 'station', 'location', 'channel']
+TIME_COLUMN = 'recorded_at'
+ROLLUP_TIME_COLUMN = 'minute'
+SKETCH_TIME_COLUMN = 'hour'
+# maximum delay between recording a row and writing it to the archive
+FILE_SLACK = datetime.timedelta(minutes=5)
+
+
+@dataclass
+class Query:
+    '''
+    Query of the HDF5 archive
+
+    Properties
+    ----------
+    starttime: datetime
+        Start of the time range (recorded_at, inclusive)
+
+    endtime: datetime
+        End of the time range (recorded_at, exclusive)
+
+    network: str | None
+        Network codes (comma separated, wildcards allowed)
+
+    station: str | None
+        Station codes (comma separated, wildcards allowed)
+
+    location: str | None
+        Location codes (comma separated, wildcards allowed)
+
+    channel: str | None
+        Channel codes (comma separated, wildcards allowed)
+
+    columns: List[str] | None
+        Columns returned (default: all)
+
+    table: str
+        Table queried, channels, errors, rollup or sketches
+    '''
+    starttime: datetime.datetime
+    endtime: datetime.datetime
+    network: Optional[str] = None
+    station: Optional[str] = None
+    location: Optional[str] = None
+    channel: Optional[str] = None
+    columns: Optional[List[str]] = None
+    table: str = 'channels'
+
+    def __post_init__(self):
+        if self.table not in TABLES:
+            raise ValueError(
+                f'Unknown table {self.table}, expected one of {TABLES}')
+
+    @property
+    def time_column(self) -> str:
+        '''
+        Column of the time range
+        '''
+        if self.table == ROLLUP_TABLE:
+            return ROLLUP_TIME_COLUMN
+        if self.table == SKETCH_TABLE:
+            return SKETCH_TIME_COLUMN
+        return TIME_COLUMN
+
+    def codes(self, column: str) -> List[str]:
+        '''
+        Codes of the SCNL column, empty when every code is selected
+
+        :param str column: network, station, location or channel
+        :rtype: [str, ...]
+        '''
+        value = getattr(self, column)
+        if not value:
+            return []
+        codes = [code.strip() for code in value.split(',')]
+        if '*' in codes:
+            return []
+        # empty location is written -- by sniffwave
+        return ['' if code == '--' else code for code in codes]
+
+    def where(self) -> List[str]:
+        '''
+        Where clauses pushed down to :meth:`pd.HDFStore.select`, the
+        time range and the codes without wildcards
+
+        :rtype: [str, ...]
+        '''
+        clauses = [
+            f'{self.time_column} >= "{self.starttime.isoformat()}"',
+            f'{self.time_column} < "{self.endtime.isoformat()}"',
+        ]
+        for column in SCNL_COLUMNS:
+            codes = self.codes(column)
+            if codes and not any(_has_wildcard(code) for code in codes):
+                clauses.append(f'{column} == {codes!r}')
+        return clauses
+
+    def wildcards(self) -> List[str]:
+        '''
+        SCNL columns with wildcards, matched on the rows read
+
+        :rtype: [str, ...]
+        '''
+        return [
+            column for column in SCNL_COLUMNS
+            if any(_has_wildcard(code) for code in self.codes(column))]
+
+    def filter(self, df: pd.DataFrame) -> pd.DataFrame:
+        '''
+        Match the codes with wildcards and project the columns
+
+        :param df: rows selected with the where clauses
+        :rtype: pd.DataFrame
+        '''
+        for column in self.wildcards():
+            # match the distinct codes in Python, the regex engine of
+            # the string backend (ex: RE2 of pyarrow) rejects the
+            # patterns of fnmatch
+            codes = self.codes(column)
+            matched = [
+                value for value in df[column].unique()
+                if isinstance(value, str) and any(
+                    fnmatch.fnmatchcase(value, code) for code in codes)]
+            df = df[df[column].isin(matched)]
+        if self.columns is not None:
+            df = df[self.columns]
+        return df.reset_index(drop=True)
+
+
+def _has_wildcard(code: str) -> bool:
+    return '*' in code or '?' in code
+
+
+def get_filenames(
+    directory: Union[str, Path],
+    starttime: datetime.datetime,
+    endtime: datetime.datetime,
+    table: str = 'channels',
+) -> List[Path]:
+    '''
+    Hourly files (daily files of the rollup and sketches tables) of the
+    archive covering the time range, in time order
+
+    :param directory: directory of the archive
+    :param starttime: start of the time range
+    :param endtime: end of the time range (exclusive)
+    :param str table: table queried
+    :rtype: [Path, ...]
+    '''
+    # avoid a circular import, the client uses the query
+    from .client import Client
+
+    client = Client(directory=directory)
+    if table in DAILY_TABLES:
+        at = starttime.replace(hour=0, minute=0, second=0, microsecond=0)
+        step = datetime.timedelta(days=1)
+        get_filename = client.get_rollup_filename
+        # rows are written by minute or hour, nothing is late
+        end = endtime
+    else:
+        at = starttime.replace(minute=0, second=0, microsecond=0)
+        step = datetime.timedelta(hours=1)
+        get_filename = client.get_filename
+        end = endtime + FILE_SLACK
+    filenames = []
+    while at < end:
+        filename = get_filename(at)
+        if filename.exists():
+            filenames.append(filename)
+        at += step
+    return filenames
+
+
+def _columns(query: Query) -> Optional[List[str]]:
+    '''
+    Columns read for the query, codes with wildcards are matched after
+    reading
+    '''
+    if query.columns is None:
+        return None
+    return list(dict.fromkeys([*query.columns, *query.wildcards()]))
+
+
+def select(filename: Union[str, Path], query: Query) -> pd.DataFrame:
+    '''
+    Select the rows of the query in an hourly file
+
+    :param filename: hourly HDF5 file
+    :param query: query
+    :rtype: pd.DataFrame
+    '''
+    columns = _columns(query)
+    with pd.HDFStore(filename, mode='r') as store:
+        if f'/{query.table}' not in store.keys():
+            return pd.DataFrame(columns=query.columns)
+        df = store.select(query.table, where=query.where(), columns=columns)
+    return query.filter(df)
+
+
+def iter_chunks(
+    filenames: List[Path],
+    query: Query,
+    chunksize: int,
+) -> Iterator[pd.DataFrame]:
+    '''
+    Stream the rows of the query in chunks of at most chunksize rows,
+    file after file
+
+    :param filenames: hourly HDF5 files in time order
+    :param query: query
+    :param int chunksize: maximum amount of rows read at once
+    :rtype: iterator of pd.DataFrame
+    '''
+    columns = _columns(query)
+    for filename in filenames:
+        with pd.HDFStore(filename, mode='r') as store:
+            if f'/{query.table}' not in store.keys():
+                continue
+            for df in store.select(
+                    query.table, where=query.where(), columns=columns,
+                    chunksize=chunksize):
+                df = query.filter(df)
+                if len(df):
+                    yield df
+
+
+def iter_query(
+    directory: Union[str, Path],
+    query: Query,
+    processes: Optional[int] = None,
+    chunksize: Optional[int] = None,
+) -> Iterator[pd.DataFrame]:
+    '''
+    Execute the query, one frame per hourly file in time order
+
+    Files are read in parallel, at most twice the amount of processes
+    are read ahead of the frame returned.  With a chunksize, files are
+    instead streamed by the calling process in chunks of at most
+    chunksize rows (memory bound by the chunksize).
+
+    :param directory: directory of the archive
+    :param query: query
+    :param int processes: amount of processes (default: cpu count,
+        0 to read in the calling process)
+    :param int chunksize: maximum amount of rows of each frame
+    :rtype: iterator of pd.DataFrame
+    '''
+    filenames = get_filenames(
+        directory, query.starttime, query.endtime, query.table)
+    if chunksize:
+        yield from iter_chunks(filenames, query, chunksize)
+        return
+    if processes == 0 or len(filenames) <= 1:
+        for filename in filenames:
+            yield select(filename, query)
+        return
+    processes = min(processes or multiprocessing.cpu_count(), len(filenames))
+    # spawn avoids forking the threads of the caller
+    with concurrent.futures.ProcessPoolExecutor(
+            processes,
+            mp_context=multiprocessing.get_context('spawn')) as executor:
+        pending = [
+            executor.submit(select, filename, query)
+            for filename in filenames[:processes * 2]]
+        for filename in filenames[processes * 2:]:
+            yield pending.pop(0).result()
+            pending.append(executor.submit(select, filename, query))
+        for future in pending:
+            yield future.result()
+
+
+def read(
+    directory: Union[str, Path],
+    query: Query,
+    processes: Optional[int] = None,
+) -> pd.DataFrame:
+    '''
+    Execute the query, concatenated in a single frame
+
+    .. see:: :func:`iter_query`
+
+    :rtype: pd.DataFrame
+    '''
+    frames = list(iter_query(directory, query, processes))
+    if not frames:
+        return pd.DataFrame(columns=query.columns)
+    return pd.concat(frames, ignore_index=True)
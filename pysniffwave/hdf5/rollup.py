@@ -0,0 +1,193 @@
+'''
+HDF5 rollup
+===========
+
+Per minute, per channel aggregates of the channels written alongside
+the hourly files, so reports over days read kilobytes of rollups
+instead of the raw packets.  The rollups of a day are appended to:
+
+    YYYY/mm/dd/sniffwave_rollup_YYYYmmdd.h5
+
+in a single table (rollup) with a row per minute (of recorded_at) and
+channel (and source when tagged):
+
+1. packets = amount of packets
+2. n_bytes, n_samples = total bytes and samples
+3. data_latency_min/mean/max/last = data latency statistics
+4. feeding_latency_min/mean/max/last = feeding latency statistics
+
+Aggregates are kept in memory until the minute is over (the latest row
+received is more than grace seconds after the end of the minute).  A
+row received after its minute was written produces an additional row
+for the minute, combine them by channel and minute when reading.
+
+The rollups are read with :mod:`pysniffwave.hdf5.query` (rollup table).
+
+..  codeauthor:: Charles Blais
+'''
+import datetime
+import logging
+
+from pathlib import Path
+from typing import Any, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from pysniffwave.sniffwave.columnar import to_frame
+
+from .client import MIN_ITEMSIZE_CHANNELS, MIN_ITEMSIZE_SOURCE, Client
+from .compression import DEFAULT_PROFILE, CompressionProfile, \
+    get_profile, open_store
+from .query import ROLLUP_TABLE, ROLLUP_TIME_COLUMN, SCNL_COLUMNS
+
+LATENCY_COLUMNS = ['data_latency', 'feeding_latency']
+DEFAULT_GRACE = 60.0
+
+# partial aggregates kept in memory and how they are merged
+_AGGREGATES = {
+    'packets': 'sum',
+    'n_bytes': 'sum',
+    'n_samples': 'sum',
+    **{f'{column}_{name}': name
+       for column in LATENCY_COLUMNS
+       for name in ('min', 'sum', 'max', 'last')},
+}
+DTYPES = {
+    'packets': 'uint32',
+    'n_bytes': 'uint64',
+    'n_samples': 'uint64',
+    **{f'{column}_{name}': 'float32'
+       for column in LATENCY_COLUMNS
+       for name in ('min', 'mean', 'max', 'last')},
+}
+
+
+class MinuteRollup(object):
+    '''
+    See module description.
+
+    :param str directory: directory of the archive
+    :param compression: name of the compression profile or profile
+    :param float grace: time (s) after the end of a minute before it is
+        written
+    '''
+    def __init__(
+        self,
+        directory: Optional[Union[str, Path]] = None,
+        compression: Union[str, CompressionProfile] = DEFAULT_PROFILE,
+        grace: float = DEFAULT_GRACE,
+    ):
+        self.client = Client(directory=directory)
+        self.compression = get_profile(compression)
+        self.grace = datetime.timedelta(seconds=grace)
+        self.latest: Optional[pd.Timestamp] = None
+        self._frame: Optional[pd.DataFrame] = None
+
+    @property
+    def pending(self) -> int:
+        '''
+        Amount of rows (minute and channel) not written yet
+        '''
+        return 0 if self._frame is None else len(self._frame)
+
+    def update(self, items: Union[pd.DataFrame, np.ndarray, List[Any]],
+               source: Optional[str] = None) -> None:
+        '''
+        Add channels to the aggregates
+
+        :param items: dataframe, structured array of the columnar parser
+            or list of :class:`pysniffwave.sniffwave.parser.Channel`
+        :param str source: source tag of the structured array
+        '''
+        if isinstance(items, np.ndarray):
+            df = to_frame(items, source)
+        elif isinstance(items, list):
+            df = pd.DataFrame(items)
+        else:
+            df = items
+        if df.empty:
+            return
+
+        keys = [ROLLUP_TIME_COLUMN, *SCNL_COLUMNS]
+        if 'source' in df.columns:
+            keys.append('source')
+        # aggregate the chunk then merge with the pending aggregates
+        chunk = pd.DataFrame({
+            ROLLUP_TIME_COLUMN: df['recorded_at'].dt.floor('min'),
+            **{column: df[column] for column in keys[1:]},
+            'packets': 1,
+            'n_bytes': df['n_bytes'].astype('uint64'),
+            'n_samples': df['n_samples'].astype('uint64'),
+            **{f'{column}_{name}': df[column].astype('float64')
+               for column in LATENCY_COLUMNS
+               for name in ('min', 'sum', 'max', 'last')},
+        })
+        frames = [chunk] if self._frame is None else [self._frame, chunk]
+        self._frame = pd.concat(frames, ignore_index=True).groupby(
+            keys, sort=False, as_index=False, dropna=False).agg(_AGGREGATES)
+        latest = df['recorded_at'].max()
+        if self.latest is None or latest > self.latest:
+            self.latest = latest
+
+    def _format(self, frame: pd.DataFrame) -> pd.DataFrame:
+        '''
+        Convert the partial aggregates to the rollup columns
+        '''
+        frame = frame.copy()
+        for column in LATENCY_COLUMNS:
+            frame.insert(
+                frame.columns.get_loc(f'{column}_sum'),
+                f'{column}_mean',
+                frame[f'{column}_sum'] / frame['packets'])
+            frame.drop(columns=f'{column}_sum', inplace=True)
+        for column, dtype in DTYPES.items():
+            frame[column] = frame[column].astype(dtype)
+        return frame.sort_values(
+            [ROLLUP_TIME_COLUMN, *SCNL_COLUMNS], ignore_index=True)
+
+    def write(self, force: bool = False) -> int:
+        '''
+        Write the minutes over to the daily rollup files
+
+        :param bool force: write every minute (ex: on stop)
+        :rtype: int
+        :returns: amount of rows written
+        '''
+        if self._frame is None or self._frame.empty:
+            return 0
+        if force:
+            done = np.ones(len(self._frame), dtype=bool)
+        else:
+            minutes = self._frame[ROLLUP_TIME_COLUMN]
+            done = (minutes + pd.Timedelta(minutes=1) + self.grace
+                    <= self.latest).to_numpy()
+        if not done.any():
+            return 0
+        frame = self._format(self._frame[done])
+        self._frame = self._frame[~done].reset_index(drop=True)
+
+        days = frame[ROLLUP_TIME_COLUMN].dt.normalize()
+        for day, rows in frame.groupby(days):
+            filename = self.client.get_rollup_filename(day.to_pydatetime())
+            filename.parent.mkdir(mode=0o755, parents=True, exist_ok=True)
+            min_itemsize = MIN_ITEMSIZE_CHANNELS
+            if 'source' in rows.columns:
+                min_itemsize = {**min_itemsize, **MIN_ITEMSIZE_SOURCE}
+            # opened for each write so the file can be read in between
+            with open_store(
+                    self.compression, path=filename, mode='a') as store:
+                store.append(
+                    ROLLUP_TABLE, rows,
+                    format='t',
+                    min_itemsize=min_itemsize,
+                    index=False,
+                    data_columns=True)
+        logging.debug(f'Wrote {len(frame)} rollup rows')
+        return len(frame)
+
+    def close(self) -> None:
+        '''
+        Write every pending aggregate
+        '''
+        self.write(force=True)
@@ -0,0 +1,315 @@
+'''
+HDF5 sketches
+=============
+
+Hourly quantile sketches (see :class:`pysniffwave.sketch.QuantileSketch`)
+of the latencies of each channel, written alongside the hourly files so
+the tail latencies (ex: p99 feeding latency of a network over a week)
+are computed from a few kilobytes of bucket counts instead of the raw
+packets.  The sketches of a day are appended to the daily rollup file:
+
+    YYYY/mm/dd/sniffwave_rollup_YYYYmmdd.h5
+
+in a single table (sketches) with a row per hour (of recorded_at),
+channel (and source when tagged), latency column (data_latency or
+feeding_latency) and bucket:
+
+1. bucket = bucket of the sketch (ZERO_BUCKET for values counted as
+   zero)
+2. count = amount of packets in the bucket
+
+Every sketch is written at RELATIVE_ACCURACY so the sketches of any
+hours, channels or networks are merged by adding the counts of their
+buckets (see :class:`SketchMerger`).
+
+Bucket counts are kept in memory, a dictionary per hour updated with
+the counts of each batch, until the hour is over (the latest row
+received is more than grace seconds after the end of the hour).  A
+row received after its hour was written produces additional bucket
+rows for the hour, which merge like any other.
+
+..  codeauthor:: Charles Blais
+'''
+import datetime
+import logging
+
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from pysniffwave.sketch import DEFAULT_RELATIVE_ACCURACY, QuantileSketch
+from pysniffwave.sniffwave.columnar import to_frame
+
+from .aggregate import DEFAULT_QUANTILES
+from .client import MIN_ITEMSIZE_CHANNELS, MIN_ITEMSIZE_SOURCE, Client
+from .compression import DEFAULT_PROFILE, CompressionProfile, \
+    get_profile, open_store
+from .query import SCNL_COLUMNS, SKETCH_TABLE, SKETCH_TIME_COLUMN
+from .rollup import DEFAULT_GRACE, LATENCY_COLUMNS
+
+# fixed so the sketches written are always mergeable
+RELATIVE_ACCURACY = DEFAULT_RELATIVE_ACCURACY
+# bucket of the values lower than the minimum value of the sketch
+ZERO_BUCKET = int(np.iinfo('int32').min)
+MIN_ITEMSIZE_SKETCHES = {
+    **MIN_ITEMSIZE_CHANNELS,
+    'latency': 16,
+}
+# columns of the bucket counts kept in memory for each hour
+BUCKET_KEYS = [*SCNL_COLUMNS, 'source', 'latency', 'bucket']
+
+
+def _buckets(sketch: QuantileSketch, values: np.ndarray) -> np.ndarray:
+    '''
+    Bucket of each value, ZERO_BUCKET for values counted as zero
+    '''
+    low = values < sketch.min_value
+    buckets = np.full(len(values), ZERO_BUCKET, dtype='int32')
+    buckets[~low] = sketch.bucket(values[~low])
+    return buckets
+
+
+class HourlySketches(object):
+    '''
+    See module description.
+
+    :param str directory: directory of the archive
+    :param compression: name of the compression profile or profile
+    :param float grace: time (s) after the end of an hour before it is
+        written
+    '''
+    def __init__(
+        self,
+        directory: Optional[Union[str, Path]] = None,
+        compression: Union[str, CompressionProfile] = DEFAULT_PROFILE,
+        grace: float = DEFAULT_GRACE,
+    ):
+        self.client = Client(directory=directory)
+        self.compression = get_profile(compression)
+        self.grace = datetime.timedelta(seconds=grace)
+        self.latest: Optional[pd.Timestamp] = None
+        # count of each bucket key (BUCKET_KEYS) of each hour
+        self._counts: Dict[pd.Timestamp, Dict[Tuple, int]] = {}
+        # used to compute the buckets of every channel at once
+        self._sketch = QuantileSketch(RELATIVE_ACCURACY)
+
+    @property
+    def pending(self) -> int:
+        '''
+        Amount of bucket rows not written yet
+        '''
+        return sum(len(counts) for counts in self._counts.values())
+
+    def update(self, items: Union[pd.DataFrame, np.ndarray, List[Any]],
+               source: Optional[str] = None) -> None:
+        '''
+        Add the latencies of channels to the sketches
+
+        :param items: dataframe, structured array of the columnar parser
+            or list of :class:`pysniffwave.sniffwave.parser.Channel`
+        :param str source: source tag of the structured array
+        '''
+        if isinstance(items, np.ndarray):
+            df = to_frame(items, source)
+        elif isinstance(items, list):
+            df = pd.DataFrame(items)
+        else:
+            df = items
+        if df.empty:
+            return
+
+        hours = df['recorded_at'].dt.floor('h')
+        source = df['source'] if 'source' in df.columns else None
+        chunks = []
+        for column in LATENCY_COLUMNS:
+            values = df[column].astype('float64')
+            valid = values.notna().to_numpy()
+            chunks.append(pd.DataFrame({
+                SKETCH_TIME_COLUMN: hours[valid],
+                **{key: df[key][valid] for key in SCNL_COLUMNS},
+                # empty when untagged, NaN keys would never be equal
+                'source': '' if source is None
+                else source[valid].fillna(''),
+                'latency': column,
+                'bucket': _buckets(self._sketch, values[valid].to_numpy()),
+                'count': 1,
+            }))
+        # count the batch then add to the counts of its hours, the cost
+        # only depends on the batch
+        counts = pd.concat(chunks, ignore_index=True).groupby(
+            [SKETCH_TIME_COLUMN, *BUCKET_KEYS], sort=False)['count'].sum()
+        for (hour, *key), count in zip(
+                counts.index.tolist(), counts.tolist()):
+            pending = self._counts.get(hour)
+            if pending is None:
+                pending = self._counts[hour] = {}
+            key = tuple(key)
+            pending[key] = pending.get(key, 0) + count
+        latest = df['recorded_at'].max()
+        if self.latest is None or latest > self.latest:
+            self.latest = latest
+
+    def write(self, force: bool = False) -> int:
+        '''
+        Write the hours over to the daily rollup files
+
+        :param bool force: write every hour (ex: on stop)
+        :rtype: int
+        :returns: amount of bucket rows written
+        '''
+        done = [
+            hour for hour in self._counts
+            if force or hour + pd.Timedelta(hours=1) + self.grace
+            <= self.latest]
+        if not done:
+            return 0
+        frames = []
+        for hour in done:
+            counts = self._counts.pop(hour)
+            rows = pd.DataFrame(list(counts), columns=BUCKET_KEYS)
+            rows.insert(0, SKETCH_TIME_COLUMN, hour)
+            rows['count'] = list(counts.values())
+            frames.append(rows)
+        frame = pd.concat(frames, ignore_index=True)
+        untagged = frame['source'] == ''
+        if untagged.all():
+            frame = frame.drop(columns='source')
+        else:
+            frame['source'] = frame['source'].astype(object).where(
+                ~untagged, None)
+        frame = frame.astype(
+            {'bucket': 'int32', 'count': 'uint32'}).sort_values(
+            [SKETCH_TIME_COLUMN, *SCNL_COLUMNS, 'latency', 'bucket'],
+            ignore_index=True)
+
+        days = frame[SKETCH_TIME_COLUMN].dt.normalize()
+        for day, rows in frame.groupby(days):
+            filename = self.client.get_rollup_filename(day.to_pydatetime())
+            filename.parent.mkdir(mode=0o755, parents=True, exist_ok=True)
+            min_itemsize = MIN_ITEMSIZE_SKETCHES
+            if 'source' in rows.columns:
+                min_itemsize = {**min_itemsize, **MIN_ITEMSIZE_SOURCE}
+            # opened for each write so the file can be read in between
+            with open_store(
+                    self.compression, path=filename, mode='a') as store:
+                store.append(
+                    SKETCH_TABLE, rows,
+                    format='t',
+                    min_itemsize=min_itemsize,
+                    index=False,
+                    data_columns=True)
+        logging.debug(f'Wrote {len(frame)} sketch rows')
+        return len(frame)
+
+    def close(self) -> None:
+        '''
+        Write every pending sketch
+        '''
+        self.write(force=True)
+
+
+class SketchMerger(object):
+    '''
+    Merge the sketches read from the archive (sketches table) by
+    channel, station, network or any other columns, over chunks in
+    constant memory
+
+    :param str latency: latency column merged (data_latency or
+        feeding_latency)
+    :param by: columns of the groups (default: SCNL code, empty for a
+        single group)
+    :param quantiles: quantiles reported
+    '''
+    def __init__(
+        self,
+        latency: str = 'data_latency',
+        by: Optional[List[str]] = None,
+        quantiles: Optional[List[float]] = None,
+    ):
+        if latency not in LATENCY_COLUMNS:
+            raise ValueError(
+                f'Unknown latency {latency}, expected one of '
+                f'{LATENCY_COLUMNS}')
+        self.latency = latency
+        self.by = SCNL_COLUMNS if by is None else by
+        self.quantiles = DEFAULT_QUANTILES if quantiles is None \
+            else quantiles
+        self._counts: Optional[pd.Series] = None
+
+    @property
+    def columns(self) -> List[str]:
+        '''
+        Columns required in the chunks
+        '''
+        return list(dict.fromkeys([*self.by, 'latency', 'bucket', 'count']))
+
+    def _keys(self, df: pd.DataFrame) -> pd.Series:
+        if not self.by:
+            return pd.Series('', index=df.index)
+        return df[self.by[0]].astype(str).str.cat(
+            [df[column].astype(str) for column in self.by[1:]], sep='.')
+
+    def update(self, df: pd.DataFrame) -> None:
+        '''
+        Add a chunk of bucket rows
+
+        :param df: rows of the sketches table
+        '''
+        if df.empty:
+            return
+        df = df[df['latency'] == self.latency]
+        if df.empty:
+            return
+        counts = df['count'].astype('int64').groupby(
+            [self._keys(df).rename('key'), df['bucket']]).sum()
+        if self._counts is not None:
+            counts = self._counts.add(counts, fill_value=0).astype('int64')
+        self._counts = counts
+
+    def consume(self, chunks: Iterable[pd.DataFrame]) -> 'SketchMerger':
+        '''
+        Add every chunk of the iterator
+
+        :rtype: :class:`SketchMerger`
+        '''
+        for chunk in chunks:
+            self.update(chunk)
+        return self
+
+    def sketches(self) -> Dict[str, QuantileSketch]:
+        '''
+        Merged sketch of each group
+
+        :rtype: dict
+        :returns: sketches by key (values of the by columns joined by .)
+        '''
+        sketches: Dict[str, QuantileSketch] = {}
+        if self._counts is None:
+            return sketches
+        for key, counts in self._counts.groupby(level='key'):
+            sketch = sketches[key] = QuantileSketch(RELATIVE_ACCURACY)
+            buckets = counts.index.get_level_values('bucket')
+            zero = buckets == ZERO_BUCKET
+            sketch.zero = int(counts[zero].sum())
+            sketch.count = sketch.zero
+            sketch.add_buckets(buckets[~zero], counts[~zero])
+        return sketches
+
+    def result(self) -> pd.DataFrame:
+        '''
+        Quantiles of each group
+
+        :rtype: pd.DataFrame
+        :returns: count and one column per quantile (ex: p50, p99)
+            indexed by key
+        '''
+        names = ['count', *[f'p{q * 100:g}' for q in self.quantiles]]
+        sketches = self.sketches()
+        result = pd.DataFrame(
+            [[sketch.count, *sketch.quantiles(self.quantiles)]
+             for sketch in sketches.values()],
+            index=pd.Index(list(sketches), name='key'),
+            columns=names)
+        return result.sort_index()
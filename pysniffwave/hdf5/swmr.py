@@ -0,0 +1,452 @@
+'''
+HDF5 SWMR
+=========
+
+Hourly HDF5 files written in single writer, multiple readers (SWMR)
+mode with h5py, so the current hour can be read while it is written.
+:class:`pd.HDFStore` (PyTables) does not implement SWMR, the files of
+:mod:`pysniffwave.hdf5.client` can only be read once closed.
+
+The structure of the archive is the same as the HDF5 archive with its
+own file names:
+
+    YYYY/mm/dd/sniffwave_YYYYmmdd_HH.swmr.h5
+
+A writer that stops without closing its file (crash, kill) leaves the
+file flagged as open for SWMR write and HDF5 refuses to open it again
+for writing.  The rows flushed are still readable, so the writer rolls
+over to the next part of the hour:
+
+    YYYY/mm/dd/sniffwave_YYYYmmdd_HH.N.swmr.h5
+
+and readers read every part of an hour in order.
+
+Each file holds two chunked, resizable datasets (channels and errors)
+of fixed compound dtypes, the columns of the columnar parser with
+fixed size byte strings, epoch float64 times and the source tag (empty
+when untagged).  Both are created before the file switches to SWMR
+mode.  Each write resizes the dataset, writes the rows and flushes, a
+reader refreshing the dataset sees every row flushed so far.
+
+Files are compressed with gzip (the zlib profiles), the blosc filters
+are not available to h5py without plugins.
+
+..  codeauthor:: Charles Blais
+'''
+import datetime
+import logging
+
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Union
+
+import h5py
+import numpy as np
+import pandas as pd
+
+from pysniffwave.sniffwave.columnar import CHANNEL_DTYPE, ERROR_DTYPE, \
+    TIME_COLUMNS, to_epoch, to_frame
+
+from .compression import DEFAULT_PROFILE, CompressionProfile, get_profile
+from .query import FILE_SLACK, SCNL_COLUMNS, Query, _has_wildcard
+
+SOURCE_SIZE = 20
+SUFFIX = '.swmr.h5'
+# parts of an hour tried before giving up
+MAX_PARTS = 100
+# rows of each chunk of the datasets
+CHUNK_ROWS = 4096
+
+
+def _dtype(dtype: np.dtype) -> np.dtype:
+    '''
+    Columns of the structured array with fixed size byte strings and the
+    source tag
+    '''
+    return np.dtype([
+        *[(name, f'S{dtype[name].itemsize // 4}'
+           if dtype[name].kind == 'U' else dtype[name])
+          for name in dtype.names or ()],
+        ('source', f'S{SOURCE_SIZE}'),
+    ])
+
+
+DTYPES: Dict[str, np.dtype] = {
+    'channels': _dtype(CHANNEL_DTYPE),
+    'errors': _dtype(ERROR_DTYPE),
+}
+
+
+def to_rows(
+    table: str,
+    df: Union[pd.DataFrame, np.ndarray],
+    source: Optional[str] = None,
+) -> np.ndarray:
+    '''
+    Convert a dataframe or a structured array of the columnar parser to
+    the rows of a dataset
+
+    :param str table: channels or errors
+    :param df: dataframe or structured array
+    :param str source: source tag of the structured array
+    :rtype: np.ndarray
+    '''
+    dtype = DTYPES[table]
+    rows = np.zeros(len(df), dtype=dtype)
+    if isinstance(df, np.ndarray):
+        for name in df.dtype.names or ():
+            rows[name] = df[name].astype(dtype[name])
+        rows['source'] = source or ''
+        return rows
+    for name in dtype.names or ():
+        if name not in df.columns:
+            continue
+        column = df[name]
+        if name in TIME_COLUMNS:
+            rows[name] = to_epoch(column.to_numpy('datetime64[us]'))
+        elif dtype[name].kind == 'S':
+            rows[name] = column.fillna('').to_numpy().astype(dtype[name])
+        else:
+            rows[name] = column.to_numpy()
+    return rows
+
+
+def from_rows(rows: np.ndarray) -> pd.DataFrame:
+    '''
+    Convert the rows of a dataset to a dataframe with the same columns
+    as :func:`pysniffwave.sniffwave.columnar.to_frame` (source only when
+    tagged)
+
+    :rtype: pd.DataFrame
+    '''
+    names = [name for name in rows.dtype.names or () if name != 'source']
+    records = np.empty(len(rows), dtype=[
+        (name, f'U{rows.dtype[name].itemsize}'
+         if rows.dtype[name].kind == 'S' else rows.dtype[name])
+        for name in names])
+    for name in names:
+        records[name] = rows[name].astype(records.dtype[name])
+    df = to_frame(records)
+    source = rows['source'].astype('U')
+    if (source != '').any():
+        tags = source.astype(object)
+        tags[source == ''] = None
+        df['source'] = tags
+    return df
+
+
+class SWMRClient(object):
+    '''
+    See module description.  Same writing interface as
+    :class:`pysniffwave.hdf5.client.Client`.
+
+    :param str directory: directory where information is saved
+        (default: is cwd)
+    :param compression: name of the compression profile or profile
+        (zlib profiles only)
+    :param int chunk_rows: rows of each chunk of the datasets
+    '''
+    def __init__(
+        self,
+        directory: Optional[Union[str, Path]] = None,
+        compression: Union[str, CompressionProfile] = DEFAULT_PROFILE,
+        chunk_rows: int = CHUNK_ROWS,
+    ):
+        self.directory = Path.cwd() if directory is None else Path(directory)
+        self.compression = get_profile(compression)
+        if self.compression.complib not in (None, 'zlib'):
+            raise ValueError(
+                f'Compression {self.compression.complib} is not available '
+                'to the SWMR archive, use a zlib profile')
+        self.chunk_rows = chunk_rows
+        self._file: Optional[h5py.File] = None
+        self._hour: Optional[str] = None
+
+    def get_filename(self, at: datetime.datetime, part: int = 0) -> Path:
+        '''
+        Generate the filename of the hourly file based on the at time
+
+        :param int part: part of the hour (0 for the first file)
+        :rtype: Path
+        :returns: filename
+        '''
+        hour = at.strftime("%Y%m%d_%H")
+        return self.directory.joinpath(
+            at.strftime('%Y'),
+            at.strftime('%m'),
+            at.strftime('%d'),
+            f'sniffwave_{hour}{f".{part}" if part else ""}{SUFFIX}')
+
+    def get_filenames(self, at: datetime.datetime) -> List[Path]:
+        '''
+        Existing files (parts) of the hour of the at time, in the order
+        written
+
+        :rtype: [Path, ...]
+        '''
+        first = self.get_filename(at)
+        parts = {}
+        for filename in first.parent.glob(
+                f'{first.name[:-len(SUFFIX)]}.*{SUFFIX}'):
+            part = filename.name[:-len(SUFFIX)].rsplit('.', 1)[1]
+            if part.isdigit():
+                parts[int(part)] = filename
+        return ([first] if first.exists() else []) + [
+            parts[part] for part in sorted(parts)]
+
+    def _open(self, at: datetime.datetime) -> h5py.File:
+        '''
+        Open the first part of the hour that can be written
+        '''
+        for part in range(MAX_PARTS):
+            filename = self.get_filename(at, part)
+            try:
+                return h5py.File(filename, 'a', libver='latest')
+            except OSError as error:
+                if not filename.exists():
+                    raise
+                # still flagged open by a writer that did not close it
+                logging.warning(
+                    f'Can not write SWMR file {filename} ({error}), '
+                    'rolling over to the next part')
+        raise RuntimeError(
+            f'No writable SWMR file for {at} after {MAX_PARTS} parts')
+
+    def get_file(self, at: datetime.datetime) -> h5py.File:
+        '''
+        Open the hourly file of the at time in SWMR mode, closing the
+        previous hour
+
+        :rtype: :class:`h5py.File`
+        '''
+        hour = at.strftime("%Y%m%d_%H")
+        if self._file is not None:
+            if self._hour == hour:
+                return self._file
+            logging.debug(f'SWMR hour has changed: {hour}')
+            self.close()
+        self.get_filename(at).parent.mkdir(
+            mode=0o755, parents=True, exist_ok=True)
+        fp = self._open(at)
+        logging.info(f'Open SWMR file {fp.filename}')
+        compressed = self.compression.complib is not None
+        for table, dtype in DTYPES.items():
+            # every dataset is created before switching to SWMR
+            if table not in fp:
+                fp.create_dataset(
+                    table,
+                    shape=(0,),
+                    maxshape=(None,),
+                    dtype=dtype,
+                    chunks=(self.chunk_rows,),
+                    compression='gzip' if compressed else None,
+                    compression_opts=self.compression.complevel
+                    if compressed else None,
+                    shuffle=self.compression.shuffle)
+        fp.swmr_mode = True
+        self._file = fp
+        self._hour = hour
+        return fp
+
+    def _append(
+        self,
+        table: str,
+        df: Union[pd.DataFrame, np.ndarray],
+        at: datetime.datetime,
+        source: Optional[str],
+    ) -> None:
+        if not len(df):
+            return
+        rows = to_rows(table, df, source)
+        dataset = self.get_file(at)[table]
+        size = dataset.shape[0]
+        dataset.resize((size + len(rows),))
+        dataset[size:] = rows
+        dataset.flush()
+        logging.debug(f'Appended {len(rows)} rows to {table}')
+
+    def write(
+        self,
+        df: Union[pd.DataFrame, np.ndarray],
+        at: datetime.datetime = datetime.datetime.now(),
+        source: Optional[str] = None,
+    ):
+        '''
+        Append the channels to the hourly file of the "at" time
+
+        :param df: dataframe or structured array of the columnar parser
+            to write
+        :type at: class::`datetime.datetime`
+        :param at: current timestamp used to generate the filename
+        :param str source: source tag of the structured array
+        '''
+        self._append('channels', df, at, source)
+
+    def write_error(
+        self,
+        df: Union[pd.DataFrame, np.ndarray],
+        at: datetime.datetime = datetime.datetime.now(),
+        source: Optional[str] = None,
+    ):
+        '''
+        Append the special conditions to the hourly file of the "at" time
+
+        .. see:: write
+        '''
+        self._append('errors', df, at, source)
+
+    def close(self):
+        '''
+        Close the hourly file
+        '''
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._hour = None
+
+    def __del__(self):
+        '''Desctructor'''
+        self.close()
+
+
+class SWMRReader(object):
+    '''
+    Read an hourly SWMR file while it is written, each read refreshes
+    the dataset to the rows flushed by the writer
+
+    :param filename: hourly SWMR file
+    '''
+    def __init__(self, filename: Union[str, Path]):
+        self.filename = Path(filename)
+        self._file = h5py.File(self.filename, 'r', libver='latest', swmr=True)
+        self._positions: Dict[str, int] = {}
+
+    def size(self, table: str = 'channels') -> int:
+        '''
+        Amount of rows flushed so far
+
+        :rtype: int
+        '''
+        dataset = self._file[table]
+        dataset.refresh()
+        return dataset.shape[0]
+
+    def rows(
+        self,
+        table: str = 'channels',
+        start: int = 0,
+        stop: Optional[int] = None,
+    ) -> np.ndarray:
+        '''
+        Rows flushed so far, as stored
+
+        :param str table: channels or errors
+        :param int start: first row
+        :param int stop: last row (exclusive, default: every row)
+        :rtype: np.ndarray
+        '''
+        dataset = self._file[table]
+        dataset.refresh()
+        return dataset[start:stop]
+
+    def read(
+        self,
+        table: str = 'channels',
+        start: int = 0,
+        stop: Optional[int] = None,
+    ) -> pd.DataFrame:
+        '''
+        Rows flushed so far
+
+        .. see:: rows
+
+        :rtype: pd.DataFrame
+        '''
+        return from_rows(self.rows(table, start, stop))
+
+    def read_new(self, table: str = 'channels') -> pd.DataFrame:
+        '''
+        Rows flushed since the previous call (every row on the first call)
+
+        :rtype: pd.DataFrame
+        '''
+        start = self._positions.get(table, 0)
+        stop = self.size(table)
+        self._positions[table] = stop
+        return self.read(table, start, stop)
+
+    def close(self):
+        '''
+        Close the file
+        '''
+        self._file.close()
+
+    def __enter__(self) -> 'SWMRReader':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def select(filename: Union[str, Path], query: Query) -> pd.DataFrame:
+    '''
+    Select the rows of the query in an hourly SWMR file
+
+    :param filename: hourly SWMR file
+    :param query: query (channels or errors)
+    :rtype: pd.DataFrame
+    '''
+    with SWMRReader(filename) as reader:
+        rows = reader.rows(query.table)
+    # time range on the epoch times, before converting the rows
+    times = to_epoch(np.array([
+        query.starttime, query.endtime], dtype='datetime64[us]'))
+    rows = rows[(rows['recorded_at'] >= times[0])
+                & (rows['recorded_at'] < times[1])]
+    for column in SCNL_COLUMNS:
+        codes = query.codes(column)
+        if codes and not any(_has_wildcard(code) for code in codes):
+            rows = rows[np.isin(
+                rows[column], np.array(codes, dtype=rows.dtype[column]))]
+    return query.filter(from_rows(rows))
+
+
+def iter_query(
+    directory: Union[str, Path],
+    query: Query,
+) -> Iterator[pd.DataFrame]:
+    '''
+    Execute the query on the SWMR archive, one frame per hourly file
+    (and part) in time order, including the hour being written
+
+    :param directory: directory of the archive
+    :param query: query (channels or errors)
+    :rtype: iterator of pd.DataFrame
+    '''
+    if query.table not in DTYPES:
+        raise ValueError(
+            f'Table {query.table} is not in the SWMR archive, '
+            f'expected one of {list(DTYPES)}')
+    client = SWMRClient(directory=directory)
+    at = query.starttime.replace(minute=0, second=0, microsecond=0)
+    # rows are written after being recorded
+    while at < query.endtime + FILE_SLACK:
+        for filename in client.get_filenames(at):
+            yield select(filename, query)
+        at += datetime.timedelta(hours=1)
+
+
+def read(
+    directory: Union[str, Path],
+    query: Query,
+) -> pd.DataFrame:
+    '''
+    Execute the query, concatenated in a single frame
+
+    .. see:: :func:`iter_query`
+
+    :rtype: pd.DataFrame
+    '''
+    frames = list(iter_query(directory, query))
+    if not frames:
+        return pd.DataFrame(columns=query.columns)
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,212 @@
+'''
+HDF5 writer process
+===================
+
+Write the HDF5 archive from a separate process so compression does not
+hold the interpreter reading and parsing the sniffwave pipe.
+
+:class:`ProcessClient` has the writing interface of
+:class:`pysniffwave.hdf5.client.Client`.  Structured arrays (or
+dataframes) are sent through a bounded pipe to a process owning the
+real client, which appends them in the order received.  The backlog is
+the amount of writes sent but not completed yet, the caller blocks when
+it reaches max_backlog.  Closing the client waits for the backlog to be
+written before the process exits.
+
+..  codeauthor:: Charles Blais
+'''
+import datetime
+import logging
+import multiprocessing
+import queue
+import signal
+
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from .client import Client
+from .compaction import Compactor
+from .compression import DEFAULT_PROFILE, CompressionProfile
+
+DEFAULT_MAX_BACKLOG = 64
+# time (s) between checks of the process while the backlog is full
+PUT_POLL = 1.0
+
+
+def _serve(
+    requests: multiprocessing.Queue,
+    written,
+    directory: Optional[Union[str, Path]],
+    compression: Union[str, CompressionProfile],
+    compact: bool,
+    log_level: int,
+) -> None:
+    '''
+    Write the requests received until the end of the requests (None).
+    Interruptions are handled by the parent process which drains the
+    requests on close.
+    '''
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    logging.basicConfig(
+        format='%(asctime)s.%(msecs)03d %(levelname)s %(processName)s \
+%(message)s',
+        datefmt="%Y-%m-%d %H:%M:%S",
+        level=log_level)
+    # the writer is a daemon process, it compacts from a thread
+    compactor = Compactor(compression, process=False) if compact else None
+    client = Client(
+        directory=directory,
+        compression=compression,
+        on_close=None if compactor is None else compactor.submit)
+    try:
+        while True:
+            request = requests.get()
+            if request is None:
+                return
+            table, df, at, source = request
+            try:
+                if table == 'errors':
+                    client.write_error(df, at=at, source=source)
+                else:
+                    client.write(df, at=at, source=source)
+            except Exception:
+                logging.exception(f'Failed to write {table} to HDF5')
+            with written.get_lock():
+                written.value += 1
+    finally:
+        client.close()
+        if compactor is not None:
+            compactor.close()
+
+
+class ProcessClient(object):
+    '''
+    See module description.
+
+    :param str directory: directory where information is saved
+        (default: is cwd)
+    :param compression: name of the compression profile or profile
+    :param bool compact: compact the hourly files once closed
+    :param int max_backlog: maximum amount of writes pending
+    '''
+    def __init__(
+        self,
+        directory: Optional[Union[str, Path]] = None,
+        compression: Union[str, CompressionProfile] = DEFAULT_PROFILE,
+        compact: bool = False,
+        max_backlog: int = DEFAULT_MAX_BACKLOG,
+    ):
+        self.directory = Path.cwd() if directory is None else Path(directory)
+        self.sent = 0
+        self.high_water = 0
+        # spawn avoids forking the threads of the logger
+        context = multiprocessing.get_context('spawn')
+        self._requests = context.Queue(maxsize=max_backlog)
+        self._written = context.Value('Q', 0)
+        self._process = context.Process(
+            target=_serve,
+            args=(self._requests, self._written, self.directory,
+                  compression, compact,
+                  logging.getLogger().getEffectiveLevel()),
+            name='HDF5Writer',
+            daemon=True)
+        self._process.start()
+
+    @property
+    def backlog(self) -> int:
+        '''
+        Amount of writes sent but not completed yet
+        '''
+        return self.sent - self._written.value
+
+    def _put(self, request: Any) -> None:
+        '''
+        Send a request, waiting while the backlog is full as long as the
+        process is running
+
+        :raises RuntimeError: the process is not running
+        '''
+        while True:
+            if not self._process.is_alive():
+                raise RuntimeError('HDF5 writer process is not running')
+            try:
+                self._requests.put(request, timeout=PUT_POLL)
+                return
+            except queue.Full:
+                continue
+
+    def _send(
+        self,
+        table: str,
+        df: Union[pd.DataFrame, np.ndarray],
+        at: Optional[datetime.datetime],
+        source: Optional[str],
+    ) -> None:
+        self._put((
+            table, df, datetime.datetime.now() if at is None else at,
+            source))
+        self.sent += 1
+        self.high_water = max(self.high_water, self.backlog)
+
+    def write(
+        self,
+        df: Union[pd.DataFrame, np.ndarray],
+        at: Optional[datetime.datetime] = None,
+        source: Optional[str] = None,
+    ):
+        '''
+        Send the channels to the writer process
+
+        .. see:: :meth:`pysniffwave.hdf5.client.Client.write`
+        '''
+        self._send('channels', df, at, source)
+
+    def write_error(
+        self,
+        df: Union[pd.DataFrame, np.ndarray],
+        at: Optional[datetime.datetime] = None,
+        source: Optional[str] = None,
+    ):
+        '''
+        Send the errors to the writer process
+
+        .. see:: :meth:`pysniffwave.hdf5.client.Client.write_error`
+        '''
+        self._send('errors', df, at, source)
+
+    def stats(self) -> Dict[str, int]:
+        '''
+        Backlog, high water mark and writes sent
+
+        :rtype: dict
+        '''
+        return {
+            'backlog': self.backlog,
+            'high_water': self.high_water,
+            'sent': self.sent,
+        }
+
+    def log_stats(self) -> None:
+        '''
+        Log the statistics of the writer
+        '''
+        logging.info(f'HDF5 writer: {self.stats()}')
+
+    def close(self):
+        '''
+        Wait for the backlog to be written and stop the process
+        '''
+        if self._process.is_alive():
+            logging.info(f'Draining HDF5 writer backlog of {self.backlog}')
+            try:
+                self._put(None)
+            except RuntimeError:
+                logging.error('HDF5 writer process stopped while draining')
+        self._process.join()
+        self._requests.close()
+        if self.backlog:
+            logging.error(f'HDF5 writer lost {self.backlog} writes')
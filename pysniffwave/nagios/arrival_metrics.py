@@ -1,9 +1,33 @@
-from datetime import datetime
+from array import array
+from datetime import datetime, timezone
+import mmap
+import os
 import pathlib
+import struct
+import time
 from dataclasses import dataclass
 from pysniffwave.sniffwave.parser import Channel
 import logging
-from typing import Dict, List, Union
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+
+DEFAULT_ARRIVAL_FILE = '/data/sniffwave/latest_arrival.csv'
+DEFAULT_ARRIVAL_INTERVAL = 5.0
+
+# Binary snapshot of the arrival statistics, written in place of the CSV
+# when the arrival file has the snapshot suffix:
+#   header = magic, amount of channels, size of the SCNL table
+#   start_time (float64) of every channel, the naive sniffwave time
+#   encoded as if UTC so it round trips in any local time zone
+#   data_latency then feeding_latency (float32) of every channel
+#   SCNL table, the codes joined by new lines (utf-8)
+# Arrays are in the native byte order, the header keeps them aligned.
+SNAPSHOT_SUFFIX = '.bin'
+SNAPSHOT_MAGIC = b'SNFARRV1'
+SNAPSHOT_HEADER = struct.Struct('<8sII')
+# sniffwave reports latencies to 0.1 s, float32 keeps them well below
+# the ms
+LATENCY_DIGITS = 3
 
 
 @dataclass
@@ -56,12 +80,155 @@ class ArrivalStat:
         return f"{self.channel}, {self.start_time.isoformat()}, {latency}s"
 
 
+def format_arrival(stat: ArrivalStat) -> str:
+    '''
+    Line of the arrival file of a channel
+    '''
+    return (f"{stat.channel},{stat.start_time}," +
+            f"{stat.data_latency},{stat.feeding_latency}\n")
+
+
+def parse_arrival(line: str) -> ArrivalStat:
+    '''
+    Arrival statistics of a line of the arrival file
+    '''
+    channel, start_timestring, data_latency, feeding_latency = \
+        line.split(',')
+    # Handle strings with or without nanoseconds, fromisoformat parses
+    # the format written (str of the datetime) much faster than strptime
+    try:
+        start_time = datetime.fromisoformat(start_timestring)
+    except ValueError:
+        try:
+            start_time = datetime.strptime(
+                start_timestring, '%Y-%m-%d %H:%M:%S.%f')
+        except ValueError:
+            start_time = datetime.strptime(
+                start_timestring, '%Y-%m-%d %H:%M:%S')
+    return ArrivalStat(
+        channel=channel,
+        start_time=start_time,
+        data_latency=float(data_latency),
+        feeding_latency=float(feeding_latency))
+
+
+def pack_snapshot(
+    channels: List[str],
+    records: List[Tuple[float, float, float]],
+) -> bytes:
+    '''
+    Binary snapshot of the arrival statistics
+
+    Parameters
+    ----------
+    channels: List[str]
+        SCNL code of every channel
+
+    records: List[Tuple[float, float, float]]
+        start_time (epoch of the naive time taken as UTC), data and
+        feeding latency of every channel
+    '''
+    names = '\n'.join(channels).encode()
+    start_times = array('d', [record[0] for record in records])
+    data_latencies = array('f', [record[1] for record in records])
+    feeding_latencies = array('f', [record[2] for record in records])
+    return b''.join([
+        SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, len(channels), len(names)),
+        start_times.tobytes(),
+        data_latencies.tobytes(),
+        feeding_latencies.tobytes(),
+        names])
+
+
+def unpack_snapshot(buffer) -> List[ArrivalStat]:
+    '''
+    Arrival statistics of a binary snapshot
+
+    Parameters
+    ----------
+    buffer: bytes | mmap
+        Content of the snapshot
+
+    Raises
+    ------
+    ValueError
+        Not a snapshot or truncated
+    '''
+    magic, count, size = SNAPSHOT_HEADER.unpack_from(buffer)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError('Not a latest arrival snapshot')
+    offset = SNAPSHOT_HEADER.size
+    end = offset + count * 16 + size
+    if len(buffer) < end:
+        raise ValueError('Latest arrival snapshot truncated')
+
+    # Copy the arrays out of the buffer so it can be released
+    view = memoryview(buffer)
+    try:
+        start_times = view[offset:offset + count * 8].cast('d').tolist()
+        offset += count * 8
+        data_latencies = view[offset:offset + count * 4].cast('f').tolist()
+        offset += count * 4
+        feeding_latencies = \
+            view[offset:offset + count * 4].cast('f').tolist()
+        offset += count * 4
+        names = bytes(view[offset:end]).decode()
+    finally:
+        view.release()
+    channels = names.split('\n') if count else []
+
+    fromtimestamp = datetime.fromtimestamp
+    return [
+        ArrivalStat(
+            channel=channel,
+            start_time=fromtimestamp(
+                start_time, timezone.utc).replace(tzinfo=None),
+            data_latency=round(data_latency, LATENCY_DIGITS),
+            feeding_latency=round(feeding_latency, LATENCY_DIGITS))
+        for channel, start_time, data_latency, feeding_latency in zip(
+            channels, start_times, data_latencies, feeding_latencies)]
+
+
+def load_snapshot(path: Union[str, pathlib.Path]) -> List[ArrivalStat]:
+    '''
+    Memory map a binary snapshot and load its arrival statistics
+
+    .. see:: unpack_snapshot
+    '''
+    with open(path, mode='rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            return unpack_snapshot(buffer)
+
+
+def _replace(path: pathlib.Path, content: bytes) -> None:
+    '''
+    Write to a temporary file then replace the file with it
+    '''
+    temporary = path.with_name(f'.{path.name}.tmp')
+    with open(temporary, mode='wb') as f:
+        f.write(content)
+    os.replace(temporary, path)
+
+
 class LatestArrivalWorker(Dict[str, ArrivalStat]):
-    ''' Class for managing arrival statistics'''
+    '''
+    Class for managing arrival statistics
+
+    The file is rewritten atomically (temporary file renamed over it) so
+    readers never see a partial file.  Only the channels changed since
+    the last write are formatted again, the file is only written when a
+    channel changed.
+
+    A file with the snapshot suffix (.bin) is written as a binary
+    snapshot (see pack_snapshot), memory mapped on load without parsing
+    any timestamp.  The CSV can still be exported next to it.
+    '''
     def __init__(
         self,
-        filepath: Union[str, pathlib.Path],
-        changes: int
+        filepath: Optional[Union[str, pathlib.Path]],
+        changes: int = 1,
+        interval: Optional[float] = None,
+        csv_filepath: Optional[Union[str, pathlib.Path]] = None
     ):
         '''
         Initialize the object by ensuring the output file exists, and reading
@@ -69,47 +236,65 @@ class LatestArrivalWorker(Dict[str, ArrivalStat]):
 
         Parameters
         ----------
-        filepath: str | Path
-            String or Path object pointing at the desired file location
+        filepath: str | Path | None
+            String or Path object pointing at the desired file location,
+            None to keep the statistics in memory only.  Binary snapshot
+            when its suffix is SNAPSHOT_SUFFIX, either format is loaded
 
         changes: int
             The number of changes before the file is updated
+
+        interval: float | None
+            Minimum time (s) between file updates, replaces changes when
+            set
+
+        csv_filepath: str | Path | None
+            CSV export written with each update of the file
         '''
         # Convert a str path to a pathlib Path
         if isinstance(filepath, str):
             filepath = pathlib.Path(filepath)
+        if isinstance(csv_filepath, str):
+            csv_filepath = pathlib.Path(csv_filepath)
 
         self.path = filepath
+        self.csv_path = csv_filepath
+        self.binary = filepath is not None and \
+            filepath.suffix == SNAPSHOT_SUFFIX
+
+        # Channels changed since the last write, line and snapshot record
+        # of each channel
+        self.dirty: Set[str] = set()
+        self._lines: Dict[str, str] = {}
+        self._records: Dict[str, Tuple[float, float, float]] = {}
 
         # Open the file to initialize the dictionary
-        if filepath.exists():
+        if filepath is None:
+            pass
+        elif filepath.exists():
+            with open(filepath, mode='rb') as f:
+                magic = f.read(len(SNAPSHOT_MAGIC))
 
-            # Load the lines from file
-            with open(filepath, mode='r') as f:
-                lines = f.readlines()
+            if magic == SNAPSHOT_MAGIC:
+                # Channel code is used as dictionary key so data can
+                # be easily replaced
+                for stat in load_snapshot(filepath):
+                    self[stat.channel] = stat
+            else:
+                # Load the lines from file
+                with open(filepath, mode='r') as f:
+                    lines = f.readlines()
 
-                # Populate the internal dictionary of ArrivalStat objects with
-                # the information from file
+                # Populate the internal dictionary of ArrivalStat objects
+                # with the information from file
                 for line in lines:
                     if line != '\n':
-                        channel, start_timestring, data_latency, \
-                            feeding_latency = line.split(',')
-
-                        # Handle strings with or without nanoseconds
-                        try:
-                            start_time = datetime.strptime(
-                                start_timestring, '%Y-%m-%d %H:%M:%S.%f')
-                        except ValueError:
-                            start_time = datetime.strptime(
-                                start_timestring, '%Y-%m-%d %H:%M:%S')
-
-                        # Channel code is used as dictionary key so data can
-                        # be easily replaced
-                        self[channel] = ArrivalStat(
-                            channel=channel,
-                            start_time=start_time,
-                            data_latency=float(data_latency),
-                            feeding_latency=float(feeding_latency))
+                        stat = parse_arrival(line)
+                        self[stat.channel] = stat
+                        self._lines[stat.channel] = line.rstrip('\n') + '\n'
+
+            # Loaded channels are kept as read until they change
+            self.dirty.clear()
         else:
             # Create a new file if it doesn't exist
             filepath.touch(mode=0o644)
@@ -118,6 +303,15 @@ class LatestArrivalWorker(Dict[str, ArrivalStat]):
         # Initialize counter of changes
         self.changes = changes
         self.currentchange = 0
+        self.interval = interval
+        self.written = time.monotonic()
+
+    def __setitem__(self, channel: str, stat: ArrivalStat):
+        '''
+        Track the channels changed since the last write
+        '''
+        super().__setitem__(channel, stat)
+        self.dirty.add(channel)
 
     def add_latest_timestamp(
         self,
@@ -148,7 +342,10 @@ class LatestArrivalWorker(Dict[str, ArrivalStat]):
             )
         self.currentchange += 1
 
-        if self.currentchange >= self.changes:
+        if self.interval is not None:
+            if time.monotonic() - self.written >= self.interval:
+                self.write_to_file()
+        elif self.currentchange >= self.changes:
             self.currentchange = 0
             self.write_to_file()
 
@@ -156,19 +353,54 @@ class LatestArrivalWorker(Dict[str, ArrivalStat]):
             self,
     ):
         '''
-        Write the recorded arrival statistics to file
+        Write the recorded arrival statistics to file (and the CSV
+        export), if any changed
+        '''
+        self.written = time.monotonic()
+        if self.path is None or not self.dirty:
+            return
+
+        dirty = set(self.dirty)
+        self.dirty.clear()
+        if self.binary:
+            _replace(self.path, self.to_snapshot(dirty))
+        else:
+            _replace(self.path, self.to_csv(dirty).encode())
+        if self.csv_path is not None:
+            _replace(self.csv_path, self.to_csv(dirty).encode())
+
+    def to_csv(self, dirty: Optional[Set[str]] = None) -> str:
+        '''
+        Content of the CSV arrival file
+
+        Parameters
+        ----------
+        dirty: Set[str] | None
+            Channels changed since the last call, every channel when None
         '''
-        lines: str = ''
+        # Only format the channels changed (or never formatted)
+        for channel, stat in self.items():
+            if dirty is None or channel in dirty or \
+                    channel not in self._lines:
+                self._lines[channel] = format_arrival(stat)
+        return ''.join(self._lines[channel] for channel in self)
 
-        # Convert the internal dictionary to a string format
-        for channel in self:
-            lines += (f"{channel},{self[channel].start_time}," +
-                      f"{self[channel].data_latency}," +
-                      f"{self[channel].feeding_latency}\n")
+    def to_snapshot(self, dirty: Optional[Set[str]] = None) -> bytes:
+        '''
+        Content of the binary snapshot
 
-        # Write to file, overwriting it's contents
-        with open(str(self.path), mode='w') as f:
-            f.write(lines)
+        .. see:: to_csv
+        '''
+        for channel, stat in self.items():
+            if dirty is None or channel in dirty or \
+                    channel not in self._records:
+                self._records[channel] = (
+                    stat.start_time.replace(
+                        tzinfo=timezone.utc).timestamp(),
+                    stat.data_latency,
+                    stat.feeding_latency)
+        return pack_snapshot(
+            list(self), [self._records[channel] for channel in self])
 
     def sort_list(self) -> List[ArrivalStat]:
         '''
@@ -1,10 +1,14 @@
 from datetime import datetime
-from typing import List
+from typing import TYPE_CHECKING, Dict, List
 from pysniffwave.nagios.arrival_metrics import LatestArrivalWorker
 from dataclasses import dataclass
 from pysniffwave.nagios.models import NagiosOutputCode, NagiosPerformance, \
     NagiosRange, NagiosResult, NagiosVerbose
 
+if TYPE_CHECKING:
+    # numpy is not imported by the check unless sketches are reported
+    from pysniffwave.sketch import QuantileSketch
+
 
 @dataclass
 class ArrivalThresholds:
@@ -79,6 +83,43 @@ def get_arrival_performance(
     return performances
 
 
+def get_latency_performance(
+    sketches: Dict[str, 'QuantileSketch'],
+    quantiles: List[float]
+) -> List[NagiosPerformance]:
+    '''
+    Assemble latency percentiles of merged quantile sketches into
+    performance data for Nagios XI
+
+    Parameters
+    ----------
+    sketches: Dict[str, QuantileSketch]
+        Sketch of each latency (ex: data_latency, feeding_latency), see
+        pysniffwave.hdf5.sketches
+
+    quantiles: List[float]
+        Quantiles reported (ex: 0.5, 0.99)
+
+    Returns
+    -------
+    List[NagiosPerformance]: Performance data in Nagios's standard format
+    '''
+    performances: List[NagiosPerformance] = []
+
+    for latency, sketch in sketches.items():
+        if not sketch.count:
+            continue
+        label = latency.replace('_', ' ')
+        for quantile, value in zip(quantiles, sketch.quantiles(quantiles)):
+            performances.append(NagiosPerformance(
+                label=f'{label} p{quantile * 100:g}',
+                value=round(value, 3),
+                uom='s'
+            ))
+
+    return performances
+
+
 def get_details(
     arrival_stats: LatestArrivalWorker
 ) -> str:
@@ -0,0 +1,338 @@
+'''
+Latest state
+============
+
+Latest state of every channel published by the logger in a memory
+mapped table of fixed layout (ex: under /dev/shm), so local readers
+(check_arrival_metrics, dashboards) map it and read thousands of
+channels without parsing and without ever seeing a partially written
+file.
+
+The file is a header followed by capacity slots of SLOT_DTYPE:
+
+1. header = magic, version, capacity and the amount of slots used
+2. slot = sequence, SCNL code (NET.STA.LOC.CHA), start_time (epoch),
+   data and feeding latency, recorded_at (epoch) of the last packet,
+   packet count and packet rate (packets/s, exponentially weighted)
+
+A channel is assigned the next free slot the first time it is seen,
+its SCNL code is written before the amount of slots used is increased,
+so readers only see complete slots and rebuild the SCNL to slot index
+from the codes.
+
+Slots are updated with a seqlock: the writer makes the sequence of the
+slot odd, writes the fields then makes it even again.  A reader copies
+the sequences, the slots then the sequences again and retries the slots
+whose sequence was odd or changed in between.  There is a single
+writer, the logger.
+
+..  codeauthor:: Charles Blais
+'''
+import datetime
+import logging
+import mmap
+import os
+import pathlib
+
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+
+from pysniffwave.nagios.arrival_metrics import ArrivalStat, \
+    LatestArrivalWorker
+from pysniffwave.sniffwave.parser import Channel
+
+MAGIC = b'SNFSTATE'
+VERSION = 1
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'),
+    ('version', 'uint32'),
+    ('capacity', 'uint32'),
+    ('count', 'uint32'),
+    ('padding', 'S44'),
+])
+SLOT_DTYPE = np.dtype([
+    ('sequence', 'uint64'),
+    ('scnl', 'S32'),
+    ('start_time', 'float64'),
+    ('recorded_at', 'float64'),
+    ('packets', 'uint64'),
+    ('data_latency', 'float32'),
+    ('feeding_latency', 'float32'),
+    ('packet_rate', 'float32'),
+    ('padding', 'S4'),
+])
+DEFAULT_CAPACITY = 16384
+# weight of the latest rate measured in the packet rate
+RATE_WEIGHT = 0.1
+MAX_RETRIES = 100
+
+
+def _map(path: pathlib.Path, write: bool) -> np.ndarray:
+    '''
+    Map the file as a byte array
+    '''
+    with open(path, 'r+b' if write else 'rb') as fp:
+        buffer = mmap.mmap(
+            fp.fileno(), 0,
+            access=mmap.ACCESS_WRITE if write else mmap.ACCESS_READ)
+    return np.frombuffer(buffer, dtype='uint8')
+
+
+def _views(data: np.ndarray):
+    '''
+    Header and slots of the mapped file
+    '''
+    header = data[:HEADER_DTYPE.itemsize].view(HEADER_DTYPE)
+    if header['magic'][0] != MAGIC or header['version'][0] != VERSION:
+        raise ValueError('Not a latest state file')
+    capacity = int(header['capacity'][0])
+    slots = data[HEADER_DTYPE.itemsize:].view(SLOT_DTYPE)
+    if len(slots) < capacity:
+        raise ValueError('Latest state file truncated')
+    return header, slots[:capacity]
+
+
+def _epoch(values: Any) -> Any:
+    '''
+    Epoch seconds of local naive datetimes
+    '''
+    if isinstance(values, datetime.datetime):
+        return values.timestamp()
+    return values
+
+
+class LatestStateWriter(object):
+    '''
+    See module description.  The file is created (or reused when valid,
+    the state survives restarts).
+
+    :param path: file of the table (ex: /dev/shm/sniffwave_latest_state)
+    :param int capacity: maximum amount of channels
+    '''
+    def __init__(
+        self,
+        path: Union[str, pathlib.Path],
+        capacity: int = DEFAULT_CAPACITY,
+    ):
+        self.path = pathlib.Path(path)
+        try:
+            self._data = _map(self.path, write=True)
+            self.header, self.slots = _views(self._data)
+        except (OSError, ValueError):
+            self._create(capacity)
+        count = int(self.header['count'][0])
+        self.index: Dict[str, int] = {
+            scnl.decode(): slot
+            for slot, scnl in enumerate(self.slots['scnl'][:count])}
+        self.dropped = 0
+
+    def _create(self, capacity: int) -> None:
+        '''
+        Create the file under a temporary name then rename it
+        '''
+        self.path.parent.mkdir(mode=0o755, parents=True, exist_ok=True)
+        temporary = self.path.with_name(f'.{self.path.name}.tmp')
+        with open(temporary, 'wb') as fp:
+            fp.truncate(HEADER_DTYPE.itemsize + SLOT_DTYPE.itemsize * capacity)
+            fp.write(np.array(
+                [(MAGIC, VERSION, capacity, 0, b'')],
+                dtype=HEADER_DTYPE).tobytes())
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, self.path)
+        logging.info(f'Created latest state table {self.path}')
+        self._data = _map(self.path, write=True)
+        self.header, self.slots = _views(self._data)
+
+    def _slot(self, scnl: str) -> Optional[int]:
+        '''
+        Slot of the channel, assigned on first use
+        '''
+        slot = self.index.get(scnl)
+        if slot is not None:
+            return slot
+        count = int(self.header['count'][0])
+        if count >= len(self.slots):
+            self.dropped += 1
+            if self.dropped == 1:
+                logging.warning(
+                    f'Latest state table {self.path} is full, '
+                    f'{scnl} is not published')
+            return None
+        self.slots['scnl'][count] = scnl.encode()
+        # published once the code is written
+        self.header['count'][0] = count + 1
+        self.index[scnl] = count
+        return count
+
+    def update(
+        self,
+        channels: Union[np.ndarray, List[Channel], Channel],
+    ) -> int:
+        '''
+        Publish the latest state of the channels
+
+        :param channels: structured array of the columnar parser or
+            Channel objects from the pysniffwave parser
+        :rtype: int
+        :returns: amount of channels updated
+        '''
+        if isinstance(channels, np.ndarray):
+            codes = np.char.add(np.char.add(np.char.add(np.char.add(
+                np.char.add(np.char.add(
+                    channels['network'], '.'), channels['station']), '.'),
+                channels['location']), '.'), channels['channel'])
+            rows = {
+                name: channels[name]
+                for name in (
+                    'start_time', 'recorded_at', 'data_latency',
+                    'feeding_latency')}
+        else:
+            if isinstance(channels, Channel):
+                channels = [channels]
+            codes = np.array([
+                f"{channel['network']}.{channel['station']}."
+                f"{channel['location']}.{channel['channel']}"
+                for channel in channels], dtype=str)
+            rows = {
+                name: np.array([
+                    _epoch(channel[name]) for channel in channels],
+                    dtype='float64')
+                for name in (
+                    'start_time', 'recorded_at', 'data_latency',
+                    'feeding_latency')}
+        if not len(codes):
+            return 0
+
+        # last packet and amount of packets of each channel
+        unique, first, counts = np.unique(
+            codes[::-1], return_index=True, return_counts=True)
+        last = len(codes) - 1 - first
+        slots, keep = [], []
+        for i, scnl in enumerate(unique):
+            slot = self._slot(str(scnl))
+            if slot is not None:
+                slots.append(slot)
+                keep.append(i)
+        if not slots:
+            return 0
+        index = np.array(slots)
+        last, counts = last[keep], counts[keep]
+
+        previous = self.slots[index]
+        recorded_at = rows['recorded_at'][last]
+        interval = recorded_at - previous['recorded_at']
+        measured = (previous['packets'] > 0) & (interval > 0)
+        rate = previous['packet_rate'].astype('float64')
+        rate[measured] = (1 - RATE_WEIGHT) * rate[measured] \
+            + RATE_WEIGHT * counts[measured] / interval[measured]
+
+        slots = self.slots
+        # seqlock, odd while the slots are written
+        slots['sequence'][index] += 1
+        for name, values in rows.items():
+            slots[name][index] = values[last]
+        slots['packets'][index] = previous['packets'] + counts
+        slots['packet_rate'][index] = rate
+        slots['sequence'][index] += 1
+        return len(index)
+
+    def close(self) -> None:
+        '''
+        Unmap the table, closing it again does nothing
+        '''
+        if not hasattr(self, '_data'):
+            return
+        del self.header, self.slots, self._data
+
+
+class LatestStateReader(object):
+    '''
+    Map a latest state table published by :class:`LatestStateWriter`
+
+    :param path: file of the table
+    :raises ValueError: not a latest state file
+    '''
+    def __init__(self, path: Union[str, pathlib.Path]):
+        self.path = pathlib.Path(path)
+        self._data = _map(self.path, write=False)
+        self.header, self.slots = _views(self._data)
+
+    def read(self) -> np.ndarray:
+        '''
+        Consistent copy of the slots used
+
+        :rtype: np.ndarray
+        :returns: structured array of SLOT_DTYPE
+        :raises RuntimeError: slots kept changing while reading
+        '''
+        count = int(self.header['count'][0])
+        slots = self.slots[:count]
+        sequences = slots['sequence'].copy()
+        result = slots.copy()
+        pending = np.arange(count)
+        for _ in range(MAX_RETRIES):
+            before = sequences[pending]
+            # retry the slots written during the copy
+            torn = (before % 2 == 1) | (before != slots['sequence'][pending])
+            if not torn.any():
+                return result
+            pending = pending[torn]
+            sequences[pending] = slots['sequence'][pending]
+            result[pending] = slots[pending]
+        raise RuntimeError(
+            f'Latest state table {self.path} changed while reading')
+
+    def get(self, scnl: str) -> Optional[np.void]:
+        '''
+        Consistent copy of the slot of a channel
+
+        :param str scnl: SCNL code
+        :rtype: np.void
+        :returns: slot or None if the channel was never published
+        '''
+        count = int(self.header['count'][0])
+        matches = np.flatnonzero(self.slots['scnl'][:count] == scnl.encode())
+        if not len(matches):
+            return None
+        slot = matches[0]
+        sequences = self.slots['sequence']
+        for _ in range(MAX_RETRIES):
+            sequence = int(sequences[slot])
+            copy = self.slots[slot].copy()
+            if sequence % 2 == 0 and int(sequences[slot]) == sequence:
+                return copy
+        raise RuntimeError(
+            f'Latest state table {self.path} changed while reading')
+
+    def close(self) -> None:
+        '''
+        Unmap the table, closing it again does nothing
+        '''
+        if not hasattr(self, '_data'):
+            return
+        del self.header, self.slots, self._data
+
+
+def load_arrival_stats(path: Union[str, pathlib.Path]) -> LatestArrivalWorker:
+    '''
+    Latest arrival statistics of every channel of a latest state table,
+    in place of the arrival file
+
+    :param path: file of the table
+    :rtype: :class:`LatestArrivalWorker`
+    '''
+    reader = LatestStateReader(path)
+    try:
+        slots = reader.read()
+    finally:
+        reader.close()
+    arrival_stats = LatestArrivalWorker(filepath=None, changes=-1)
+    for slot in slots:
+        scnl = slot['scnl'].decode()
+        arrival_stats[scnl] = ArrivalStat(
+            channel=scnl,
+            start_time=datetime.datetime.fromtimestamp(slot['start_time']),
+            data_latency=float(slot['data_latency']),
+            feeding_latency=float(slot['feeding_latency']))
+    return arrival_stats
@@ -0,0 +1,382 @@
+'''
+Parquet Client
+==============
+
+Parquet archive of sniffwave, an alternative to the HDF5 archive (see
+:mod:`pysniffwave.hdf5.client`) whose current hour can be read while it
+is written.  The channels and errors tables have the same columns as the
+HDF5 tables.
+
+Each write is a small immutable part file, written under a temporary
+name and renamed once complete, so readers never see a partial part:
+
+    YYYY/mm/dd/sniffwave_YYYYmmdd_HH_<table>.parts/part-NNNNNN.parquet
+
+Once the hour is over (rollover or closed after the hour), the parts are
+merged, sorted by recorded_at, into one file per hour and table, in a
+background process so the writes of the next hour are not delayed:
+
+    YYYY/mm/dd/sniffwave_YYYYmmdd_HH_<table>.parquet
+
+The merged file is renamed in place before the parts are removed.
+Readers use the merged file of an hour when it exists and its parts
+otherwise (see :mod:`pysniffwave.parquet.query`).
+
+Files are compressed with zstd and the SCNL (and source, error) columns
+are dictionary encoded.
+
+..  codeauthor:: Charles Blais
+'''
+import concurrent.futures
+import datetime
+import logging
+import multiprocessing
+import os
+
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from pysniffwave.hdf5.client import DTYPES
+from pysniffwave.hdf5.compaction import _init_process
+from pysniffwave.hdf5.query import Query
+from pysniffwave.sniffwave.columnar import to_frame
+
+TABLES = ['channels', 'errors']
+DICTIONARY_COLUMNS = [
+    'network', 'station', 'location', 'channel', 'error', 'source']
+DEFAULT_COMPRESSION = 'zstd'
+DEFAULT_COMPRESSION_LEVEL = 3
+# rows of each row group of the merged hourly files
+ROW_GROUP_SIZE = 100000
+PART_PATTERN = 'part-*.parquet'
+
+
+def write_table(
+    df: pd.DataFrame,
+    filename: Path,
+    compression: str = DEFAULT_COMPRESSION,
+    compression_level: Optional[int] = DEFAULT_COMPRESSION_LEVEL,
+    row_group_size: Optional[int] = None,
+) -> None:
+    '''
+    Write the dataframe to a parquet file under a temporary name and
+    rename it once complete
+
+    :param df: rows written
+    :param filename: parquet file
+    :param str compression: compression codec
+    :param int compression_level: level of the compression codec
+    :param int row_group_size: maximum rows of each row group
+    '''
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    temporary = filename.with_name(f'.{filename.name}.tmp')
+    pq.write_table(
+        table, temporary,
+        compression=compression,
+        compression_level=compression_level,
+        use_dictionary=[
+            column for column in DICTIONARY_COLUMNS
+            if column in df.columns],
+        row_group_size=row_group_size)
+    os.replace(temporary, filename)
+
+
+def merge_parts(
+    filename: Path,
+    directory: Path,
+    compression: str = DEFAULT_COMPRESSION,
+    compression_level: Optional[int] = DEFAULT_COMPRESSION_LEVEL,
+) -> Optional[Path]:
+    '''
+    Merge the part files of an hour into its hourly file, sorted by
+    recorded_at, and remove the parts
+
+    :param filename: hourly parquet file
+    :param directory: directory of the part files
+    :param str compression: compression codec
+    :param int compression_level: level of the compression codec
+    :rtype: Path
+    :returns: hourly file or None if there was no part
+    '''
+    parts = sorted(directory.glob(PART_PATTERN))
+    if not parts:
+        return None
+    frames = [pd.read_parquet(part) for part in parts]
+    # parts written after a previous merge of the hour
+    if filename.exists():
+        frames.insert(0, pd.read_parquet(filename))
+    df = pd.concat(frames, ignore_index=True).sort_values(
+        'recorded_at', kind='stable', ignore_index=True)
+    write_table(
+        df, filename, compression, compression_level, ROW_GROUP_SIZE)
+    for part in parts:
+        part.unlink()
+    try:
+        directory.rmdir()
+    except OSError:
+        logging.warning(f'Parts directory {directory} not empty after merge')
+    logging.info(f'Merged {len(parts)} parts ({len(df)} rows) to {filename}')
+    return filename
+
+
+class Client(object):
+    '''
+    See module description.
+
+    :param str directory: directory where information is saved
+        (default: is cwd)
+    :param str compression: compression codec
+    :param int compression_level: level of the compression codec
+    :param bool process: merge the hours in a background process,
+        otherwise in a thread (ex: from a daemon process which can not
+        have children)
+    '''
+    def __init__(
+        self,
+        directory: Optional[Union[str, Path]] = None,
+        compression: str = DEFAULT_COMPRESSION,
+        compression_level: Optional[int] = DEFAULT_COMPRESSION_LEVEL,
+        process: bool = True,
+    ):
+        self.directory = Path.cwd() if directory is None else Path(directory)
+        self.compression = compression
+        self.compression_level = compression_level
+        self.process = process
+        self.merged = 0
+        self.failed = 0
+        self._hour: Optional[datetime.datetime] = None
+        self._sequence: Dict[str, int] = {}
+        # created on the first merge, readers never start it
+        self._executor: Optional[concurrent.futures.Executor] = None
+
+    def get_filename(
+        self,
+        at: datetime.datetime,
+        table: str = 'channels',
+    ) -> Path:
+        '''
+        Generate the filename of the hourly file of a table based on the
+        at time
+
+        :type at: class::`datetime.datetime`
+        :param at: current timestamp used to generate the filename
+        :param str table: channels or errors
+
+        :rtype: Path
+        :returns: filename
+        '''
+        return self.directory.joinpath(
+            at.strftime('%Y'),
+            at.strftime('%m'),
+            at.strftime('%d'),
+            f'sniffwave_{at.strftime("%Y%m%d_%H")}_{table}.parquet')
+
+    def get_parts_directory(
+        self,
+        at: datetime.datetime,
+        table: str = 'channels',
+    ) -> Path:
+        '''
+        Generate the directory of the part files of the hour
+
+        :rtype: Path
+        '''
+        return self.get_filename(at, table).with_suffix('.parts')
+
+    def _next_part(self, table: str, directory: Path) -> Path:
+        '''
+        Filename of the next part file of the table
+        '''
+        if table not in self._sequence:
+            # continue after the parts of a previous run within the hour
+            self._sequence[table] = max((
+                int(part.stem.split('-')[1])
+                for part in directory.glob(PART_PATTERN)), default=0)
+        self._sequence[table] += 1
+        return directory.joinpath(f'part-{self._sequence[table]:06d}.parquet')
+
+    def _set_hour(self, at: datetime.datetime) -> None:
+        '''
+        Merge the parts of the previous hour on rollover
+        '''
+        hour = at.replace(minute=0, second=0, microsecond=0)
+        if self._hour == hour:
+            return
+        if self._hour is not None:
+            logging.debug(f'Parquet hour has changed: {hour}')
+            self.submit(self._hour)
+        self._hour = hour
+        self._sequence = {}
+
+    def _write(
+        self,
+        table: str,
+        df: Union[pd.DataFrame, np.ndarray],
+        at: datetime.datetime,
+        source: Optional[str],
+    ) -> None:
+        if isinstance(df, np.ndarray):
+            df = to_frame(df, source)
+        if df.empty:
+            return
+        self._set_hour(at)
+        for column in df.columns:
+            if column in DTYPES:
+                df[column] = df[column].astype(DTYPES[column])
+        directory = self.get_parts_directory(at, table)
+        directory.mkdir(mode=0o755, parents=True, exist_ok=True)
+        filename = self._next_part(table, directory)
+        write_table(df, filename, self.compression, self.compression_level)
+        logging.debug(f'Wrote {len(df)} rows to {filename}')
+
+    def write(
+        self,
+        df: Union[pd.DataFrame, np.ndarray],
+        at: datetime.datetime = datetime.datetime.now(),
+        source: Optional[str] = None,
+    ):
+        '''
+        Write the dataframe as a part file of the hour of the "at" time
+
+        :param df: dataframe or structured array of the columnar parser
+            to write
+        :type at: class::`datetime.datetime`
+        :param at: current timestamp used to generate the filename
+        :param str source: source tag of the structured array
+        '''
+        self._write('channels', df, at, source)
+
+    def write_error(
+        self,
+        df: Union[pd.DataFrame, np.ndarray],
+        at: datetime.datetime = datetime.datetime.now(),
+        source: Optional[str] = None,
+    ):
+        '''
+        Write the special conditions as a part file of the hour of the
+        "at" time
+
+        .. see:: write
+        '''
+        self._write('errors', df, at, source)
+
+    def merge(self, at: datetime.datetime) -> List[Path]:
+        '''
+        Merge the parts of every table of the hour of the "at" time
+
+        :rtype: [Path, ...]
+        :returns: hourly files written
+        '''
+        filenames = []
+        for table in TABLES:
+            filename = merge_parts(
+                self.get_filename(at, table),
+                self.get_parts_directory(at, table),
+                self.compression,
+                self.compression_level)
+            if filename is not None:
+                filenames.append(filename)
+        return filenames
+
+    def _get_executor(self) -> concurrent.futures.Executor:
+        if self._executor is None:
+            if self.process:
+                # spawn avoids forking the threads of the logger
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=1,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_process)
+            else:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix='ParquetMerger')
+        return self._executor
+
+    def _done(self, future: concurrent.futures.Future) -> None:
+        try:
+            if future.result() is not None:
+                self.merged += 1
+        except Exception:
+            self.failed += 1
+            logging.exception('Failed to merge parquet parts')
+
+    def submit(self, at: datetime.datetime) -> None:
+        '''
+        Merge the parts of every table of the hour of the "at" time in
+        the background
+
+        .. see:: merge
+        '''
+        logging.info(f'Merging parquet hour {at} in background')
+        executor = self._get_executor()
+        for table in TABLES:
+            executor.submit(
+                merge_parts,
+                self.get_filename(at, table),
+                self.get_parts_directory(at, table),
+                self.compression,
+                self.compression_level).add_done_callback(self._done)
+
+    def _query(
+        self,
+        table: str,
+        starttime: datetime.datetime,
+        endtime: datetime.datetime,
+        network: Optional[str] = None,
+        station: Optional[str] = None,
+        location: Optional[str] = None,
+        channel: Optional[str] = None,
+        columns: Optional[List[str]] = None,
+    ) -> Query:
+        return Query(
+            starttime=starttime,
+            endtime=endtime,
+            network=network,
+            station=station,
+            location=location,
+            channel=channel,
+            columns=columns,
+            table=table)
+
+    def find(self, *args, **kwargs) -> pd.DataFrame:
+        '''
+        Search the channels of the archive, including the current hour
+
+        .. see:: pysniffwave.hdf5.client.Client.find
+
+        :rtype: pd.Dataframe
+        '''
+        # avoid a circular import, the query uses the client
+        from .query import read
+
+        return read(self.directory, self._query('channels', *args, **kwargs))
+
+    def find_error(self, *args, **kwargs) -> pd.DataFrame:
+        '''
+        Search the special conditions of the archive, including the
+        current hour
+
+        .. see:: find
+        '''
+        from .query import read
+
+        return read(self.directory, self._query('errors', *args, **kwargs))
+
+    def close(self):
+        '''
+        Merge the parts of the last hour written if it is over and wait
+        for the hours submitted to be merged
+        '''
+        if self._hour is not None:
+            now = datetime.datetime.now().replace(
+                minute=0, second=0, microsecond=0)
+            if self._hour != now:
+                self.submit(self._hour)
+            self._hour = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
@@ -0,0 +1,129 @@
+'''
+Parquet query
+=============
+
+Query the parquet archive (see :mod:`pysniffwave.parquet.client`) with
+the same :class:`pysniffwave.hdf5.query.Query` as the HDF5 archive
+(channels or errors tables).
+
+Hours are read from their merged file when it exists and from their
+part files otherwise, so the current hour is returned up to its last
+write.  The time range and the SCNL codes without wildcards are pushed
+down as parquet filters (row groups pruned on their statistics), only
+the columns of the query are read and codes with wildcards are matched
+on the rows read.
+
+..  codeauthor:: Charles Blais
+'''
+import datetime
+
+from pathlib import Path
+from typing import Any, Iterator, List, Tuple, Union
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from pysniffwave.hdf5.query import FILE_SLACK, SCNL_COLUMNS, Query, \
+    _columns, _has_wildcard
+
+from .client import PART_PATTERN, TABLES, Client
+
+
+def filters(query: Query) -> List[Tuple[str, str, Any]]:
+    '''
+    Parquet filters of the query, the time range and the codes without
+    wildcards
+
+    :rtype: [(column, op, value), ...]
+    '''
+    clauses: List[Tuple[str, str, Any]] = [
+        (query.time_column, '>=', pd.Timestamp(query.starttime)),
+        (query.time_column, '<', pd.Timestamp(query.endtime)),
+    ]
+    for column in SCNL_COLUMNS:
+        codes = query.codes(column)
+        if codes and not any(_has_wildcard(code) for code in codes):
+            clauses.append((column, 'in', codes))
+    return clauses
+
+
+def _read(filename: Path, query: Query) -> pd.DataFrame:
+    table = pq.read_table(
+        filename, columns=_columns(query), filters=filters(query))
+    return table.to_pandas()
+
+
+def select_hour(
+    directory: Union[str, Path],
+    at: datetime.datetime,
+    query: Query,
+) -> pd.DataFrame:
+    '''
+    Select the rows of the query in an hour of the archive
+
+    :param directory: directory of the archive
+    :param at: time within the hour
+    :param query: query
+    :rtype: pd.DataFrame
+    '''
+    client = Client(directory=directory)
+    filename = client.get_filename(at, query.table)
+    merged = filename.exists()
+    if not merged:
+        parts = sorted(client.get_parts_directory(
+            at, query.table).glob(PART_PATTERN))
+        try:
+            frames = [_read(part, query) for part in parts]
+        except FileNotFoundError:
+            # parts merged while reading them
+            merged = True
+        if not parts:
+            # parts merged between the check and the glob
+            merged = filename.exists()
+    if merged:
+        frames = [_read(filename, query)]
+    frames = [frame for frame in frames if len(frame)]
+    if not frames:
+        return pd.DataFrame(columns=query.columns)
+    return query.filter(pd.concat(frames, ignore_index=True))
+
+
+def iter_query(
+    directory: Union[str, Path],
+    query: Query,
+) -> Iterator[pd.DataFrame]:
+    '''
+    Execute the query, one frame per hour in time order
+
+    :param directory: directory of the archive
+    :param query: query
+    :rtype: iterator of pd.DataFrame
+    '''
+    if query.table not in TABLES:
+        raise ValueError(
+            f'Table {query.table} is not in the parquet archive, '
+            f'expected one of {TABLES}')
+    at = query.starttime.replace(minute=0, second=0, microsecond=0)
+    # rows are written after being recorded
+    while at < query.endtime + FILE_SLACK:
+        df = select_hour(directory, at, query)
+        if len(df):
+            yield df
+        at += datetime.timedelta(hours=1)
+
+
+def read(
+    directory: Union[str, Path],
+    query: Query,
+) -> pd.DataFrame:
+    '''
+    Execute the query, concatenated in a single frame
+
+    .. see:: :func:`iter_query`
+
+    :rtype: pd.DataFrame
+    '''
+    frames = list(iter_query(directory, query))
+    if not frames:
+        return pd.DataFrame(columns=query.columns)
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,399 @@
+'''
+Queue library
+=============
+
+Queues connecting the sniffwave reader to the workers.
+
+:class:`BoundedQueue` is a :class:`queue.Queue` with a size limit and an
+overflow policy applied when the queue is full:
+
+1. block = the producer (sniffwave reader) waits for the worker
+2. drop_newest = the message published is dropped
+3. drop_oldest = the oldest message of the queue is dropped
+4. latest_only = the queue is compacted to the latest packet per channel
+
+:class:`BroadcastRing` is a single producer, multiple consumers ring
+buffer: a message is published once and every consumer reads it at its
+own pace through its own cursor.  Consumers implement the subset of
+:class:`queue.Queue` used by the workers (get, get_nowait, qsize, empty).
+
+When the slowest consumer is a full ring behind, the overflow policy
+decides what happens (drop_newest and latest_only are not supported):
+
+1. block = the producer waits for the consumer
+2. drop_oldest = the oldest message is dropped for the consumer
+3. spill = the oldest message is spilled to a temporary file read by the
+   consumer before the ring
+
+..  codeauthor:: Charles Blais
+'''
+import collections
+import logging
+import pickle
+import queue
+import tempfile
+import threading
+import time
+
+from enum import Enum
+from typing import Any, Dict, List, Optional
+
+
+from pysniffwave.sniffwave.columnar import ColumnBatch
+
+
+class OverflowPolicy(Enum):
+    block = 'block'
+    drop_newest = 'drop_newest'
+    drop_oldest = 'drop_oldest'
+    latest_only = 'latest_only'
+    spill = 'spill'
+
+
+class BoundedQueue(queue.Queue):
+    '''
+    Queue with a size limit and an overflow policy
+
+    :param int maxsize: maximum amount of messages (0 for unbounded)
+    :param policy: overflow policy when the queue is full
+    :param str name: name used in the statistics
+    '''
+    def __init__(
+        self,
+        maxsize: int = 0,
+        policy: OverflowPolicy = OverflowPolicy.block,
+        name: str = 'queue',
+    ):
+        if maxsize > 0 and policy == OverflowPolicy.spill:
+            raise ValueError(f'{policy.value} not supported by queues')
+        super().__init__(maxsize)
+        self.policy = policy
+        self.name = name
+        self.dropped = 0
+        self.compacted = 0
+        self.high_water = 0
+
+    def put(self, item, block=True, timeout=None):
+        '''
+        Put the message in the queue applying the overflow policy
+        '''
+        if self.policy == OverflowPolicy.block or self.maxsize <= 0:
+            super().put(item, block, timeout)
+            self.high_water = max(self.high_water, self.qsize())
+            return
+        with self.not_full:
+            if self._qsize() >= self.maxsize:
+                self._overflow()
+            if self._qsize() >= self.maxsize:
+                self.dropped += 1
+                return
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.high_water = max(self.high_water, self._qsize())
+            self.not_empty.notify()
+
+    def _overflow(self):
+        '''
+        Make room in the full queue.  The lock must be held.
+        '''
+        if self.policy == OverflowPolicy.drop_oldest:
+            self._get()
+            self.dropped += 1
+        elif self.policy == OverflowPolicy.latest_only:
+            size = self._qsize()
+            self.queue = collections.deque(latest_only(list(self.queue)))
+            self.compacted += size - self._qsize()
+            # still full, more channels than room in the queue
+            if self._qsize() >= self.maxsize:
+                self._get()
+                self.dropped += 1
+
+    def stats(self) -> Dict[str, int]:
+        '''
+        Depth, high water mark, dropped and compacted messages
+
+        :rtype: dict
+        '''
+        with self.mutex:
+            return {
+                'depth': self._qsize(),
+                'maxsize': self.maxsize,
+                'high_water': self.high_water,
+                'dropped': self.dropped,
+                'compacted': self.compacted,
+            }
+
+    def log_stats(self) -> None:
+        '''
+        Log the statistics of the queue
+        '''
+        logging.info(f'Queue {self.name}: {self.stats()}')
+
+
+def latest_only(items: List[Any]) -> List[Any]:
+    '''
+    Keep only the latest packet per channel (and source).  Column batches
+    are merged per source in a single batch.
+
+    :param items: messages (dictionary or :class:`ColumnBatch`)
+    :rtype: list
+    '''
+    latest: Dict[Any, Any] = {}
+    batches: Dict[Optional[str], List[ColumnBatch]] = {}
+    for item in items:
+        if isinstance(item, ColumnBatch):
+            batches.setdefault(item.source, []).append(item)
+        else:
+            key = (
+                type(item), item.get('source'),
+                item['network'], item['station'],
+                item['location'], item['channel'])
+            # re-insert so the order follows the latest packets
+            latest.pop(key, None)
+            latest[key] = item
+    return [
+        *latest.values(),
+        *[ColumnBatch.concatenate(source_batches).latest()
+          for source_batches in batches.values()],
+    ]
+
+
+class _Spill(object):
+    '''
+    Append only spill file read in order
+    '''
+    def __init__(self):
+        self._file = tempfile.TemporaryFile(prefix='pysniffwave_spill_')
+        self._read_at = 0
+        self.size = 0
+
+    def append(self, item: Any):
+        self._file.seek(0, 2)
+        pickle.dump(item, self._file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.size += 1
+
+    def pop(self) -> Any:
+        self._file.seek(self._read_at)
+        item = pickle.load(self._file)
+        self._read_at = self._file.tell()
+        self.size -= 1
+        if not self.size:
+            # everything was read, reuse the file from the start
+            self._file.seek(0)
+            self._file.truncate()
+            self._read_at = 0
+        return item
+
+    def close(self):
+        self._file.close()
+
+
+class RingConsumer(object):
+    '''
+    Consumer of a :class:`BroadcastRing`, see :meth:`BroadcastRing.subscribe`
+    '''
+    def __init__(self, ring: 'BroadcastRing', name: str, cursor: int):
+        self.ring = ring
+        self.name = name
+        self.cursor = cursor
+        self.dropped = 0
+        self.spilled = 0
+        self._spill: Optional[_Spill] = None
+
+    @property
+    def lag(self) -> int:
+        '''
+        Amount of messages published but not read yet by the consumer
+        '''
+        spilled = 0 if self._spill is None else self._spill.size
+        return self.ring.head - self.cursor + spilled
+
+    def qsize(self) -> int:
+        return self.lag
+
+    def empty(self) -> bool:
+        return self.lag == 0
+
+    def _pop(self) -> Any:
+        '''
+        Next message, the lock of the ring must be held
+        '''
+        if self._spill is not None and self._spill.size:
+            return self._spill.pop()
+        item = self.ring._items[self.cursor % self.ring.capacity]
+        self.cursor += 1
+        return item
+
+    def get(self, block: bool = True, timeout: Optional[float] = None) -> Any:
+        '''
+        Get the next message
+
+        :raises queue.Empty: no message available
+        '''
+        return self.get_many(1, block, timeout)[0]
+
+    def get_nowait(self) -> Any:
+        return self.get(block=False)
+
+    def get_many(
+        self,
+        max_items: Optional[int] = None,
+        block: bool = True,
+        timeout: Optional[float] = None,
+    ) -> List[Any]:
+        '''
+        Get every available message (up to max_items) in one call
+
+        :raises queue.Empty: no message available
+        '''
+        with self.ring._changed:
+            if block:
+                deadline = None if timeout is None \
+                    else time.monotonic() + timeout
+                while not self.lag:
+                    remaining = None if deadline is None \
+                        else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        break
+                    self.ring._changed.wait(remaining)
+            count = self.lag if max_items is None \
+                else min(self.lag, max_items)
+            if not count:
+                raise queue.Empty()
+            items = [self._pop() for _ in range(count)]
+            self.ring._release()
+            # producer might be waiting for this consumer
+            self.ring._changed.notify_all()
+            return items
+
+
+class BroadcastRing(object):
+    '''
+    Single producer, multiple consumers broadcast ring buffer
+
+    :param int capacity: amount of messages kept in the ring
+    :param policy: overflow policy when a consumer is a full ring behind
+    '''
+    def __init__(
+        self,
+        capacity: int = 256,
+        policy: OverflowPolicy = OverflowPolicy.block,
+    ):
+        if policy in (OverflowPolicy.drop_newest, OverflowPolicy.latest_only):
+            raise ValueError(f'{policy.value} not supported by the ring')
+        self.capacity = capacity
+        self.policy = policy
+        self.head = 0
+        self.closed = False
+        # oldest message still referenced by the ring
+        self._tail = 0
+        self._items: List[Any] = [None] * capacity
+        self._consumers: List[RingConsumer] = []
+        self._changed = threading.Condition()
+
+    def subscribe(self, name: Optional[str] = None) -> RingConsumer:
+        '''
+        Add a consumer reading the messages published from now on
+
+        :param str name: name used in the statistics
+        :rtype: :class:`RingConsumer`
+        '''
+        with self._changed:
+            consumer = RingConsumer(
+                self,
+                name or f'consumer-{len(self._consumers)}',
+                self.head)
+            self._consumers.append(consumer)
+            return consumer
+
+    def _release(self) -> None:
+        '''
+        Release the messages read by every consumer.  The lock of the
+        ring must be held.
+        '''
+        low = min(
+            (consumer.cursor for consumer in self._consumers),
+            default=self.head)
+        # slots older than the ring capacity were already overwritten
+        for seq in range(max(self._tail, self.head - self.capacity), low):
+            self._items[seq % self.capacity] = None
+        self._tail = max(self._tail, low)
+
+    def _overflow(self, oldest: int) -> bool:
+        '''
+        Apply the overflow policy to the consumers that did not read the
+        oldest message yet.  The lock of the ring must be held.
+
+        :rtype: bool
+        :returns: False if the producer must wait
+        '''
+        late = [c for c in self._consumers if c.cursor <= oldest]
+        if not late:
+            return True
+        if self.policy == OverflowPolicy.block:
+            return False
+        item = self._items[oldest % self.capacity]
+        for consumer in late:
+            if self.policy == OverflowPolicy.spill:
+                if consumer._spill is None:
+                    consumer._spill = _Spill()
+                consumer._spill.append(item)
+                consumer.spilled += 1
+            else:
+                consumer.dropped += 1
+            consumer.cursor = oldest + 1
+        return True
+
+    def put(self, item: Any, *args, **kwargs) -> None:
+        '''
+        Publish a message to every consumer (same signature as
+        :meth:`queue.Queue.put` so the ring can be used by the producers)
+        '''
+        with self._changed:
+            # the ring was closed, the message is dropped
+            if self.closed:
+                return
+            oldest = self.head - self.capacity
+            while oldest >= 0 and not self._overflow(oldest):
+                if self.closed:
+                    return
+                self._changed.wait()
+            self._items[self.head % self.capacity] = item
+            self.head += 1
+            self._release()
+            self._changed.notify_all()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        '''
+        Lag, dropped and spilled messages per consumer
+
+        :rtype: dict
+        '''
+        with self._changed:
+            return {
+                consumer.name: {
+                    'lag': consumer.lag,
+                    'dropped': consumer.dropped,
+                    'spilled': consumer.spilled,
+                }
+                for consumer in self._consumers
+            }
+
+    def log_stats(self) -> None:
+        '''
+        Log the statistics of the consumers
+        '''
+        for name, stats in self.stats().items():
+            logging.info(f'Broadcast consumer {name}: {stats}')
+
+    def close(self) -> None:
+        '''
+        Release a producer waiting for a consumer (messages published
+        afterward are dropped) and remove the spill files
+        '''
+        with self._changed:
+            self.closed = True
+            self._changed.notify_all()
+        for consumer in self._consumers:
+            if consumer._spill is not None:
+                consumer._spill.close()
@@ -0,0 +1,134 @@
+'''
+Quantile sketch
+===============
+
+Mergeable quantile sketch with a relative accuracy guarantee, based on
+logarithmic buckets (DDSketch).  A value x > 0 is counted in the bucket
+ceil(log(x) / log(gamma)) where gamma = (1 + a) / (1 - a) for the
+relative accuracy a.  Any quantile is returned within a relative error
+of a, whatever the amount of values, and the memory only grows with the
+range of the values (a few hundred buckets for latencies from 1 ms to
+days at 1%).
+
+Values lower than min_value (including zero and negative latencies of
+clocks out of sync) are counted together and reported as zero.
+
+..  codeauthor:: Charles Blais
+'''
+import math
+
+from typing import Dict, Iterable, List, Union
+
+import numpy as np
+
+DEFAULT_RELATIVE_ACCURACY = 0.01
+DEFAULT_MIN_VALUE = 1e-3
+
+
+class QuantileSketch(object):
+    '''
+    See module description.
+
+    :param float relative_accuracy: relative accuracy of the quantiles
+    :param float min_value: values lower are counted as zero
+    '''
+    def __init__(
+        self,
+        relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY,
+        min_value: float = DEFAULT_MIN_VALUE,
+    ):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError('relative accuracy must be between 0 and 1')
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets: Dict[int, int] = {}
+        self.zero = 0
+        self.count = 0
+
+    def bucket(self, values: np.ndarray) -> np.ndarray:
+        '''
+        Bucket of each value (values lower than min_value must be
+        excluded)
+
+        :rtype: np.ndarray
+        '''
+        return np.ceil(np.log(values) / self._log_gamma).astype('int64')
+
+    def add(self, values: Union[float, Iterable[float], np.ndarray]):
+        '''
+        Add values to the sketch
+
+        :param values: value or values
+        '''
+        array = np.asarray(values, dtype='float64').ravel()
+        array = array[~np.isnan(array)]
+        low = array < self.min_value
+        self.zero += int(low.sum())
+        self.count += len(array)
+        indices, counts = np.unique(
+            self.bucket(array[~low]), return_counts=True)
+        self.add_buckets(indices, counts, count=False)
+
+    def add_buckets(
+        self,
+        indices: Iterable[int],
+        counts: Iterable[int],
+        count: bool = True,
+    ):
+        '''
+        Add the counts of buckets (ex: computed for many sketches at once
+        with :meth:`bucket`)
+
+        :param indices: buckets
+        :param counts: amount of values of each bucket
+        :param bool count: add the counts to the total count
+        '''
+        buckets = self.buckets
+        for index, value in zip(indices, counts):
+            index, value = int(index), int(value)
+            buckets[index] = buckets.get(index, 0) + value
+            if count:
+                self.count += value
+
+    def merge(self, other: 'QuantileSketch'):
+        '''
+        Merge the values of another sketch of the same accuracy
+
+        :raises ValueError: sketches of different accuracy
+        '''
+        if other.gamma != self.gamma or other.min_value != self.min_value:
+            raise ValueError('Can not merge sketches of different accuracy')
+        self.add_buckets(other.buckets.keys(), other.buckets.values(),
+                         count=False)
+        self.zero += other.zero
+        self.count += other.count
+
+    def quantile(self, q: float) -> float:
+        '''
+        Value at the quantile (nan if the sketch is empty)
+
+        :param float q: quantile (0-1)
+        :rtype: float
+        '''
+        if not self.count:
+            return math.nan
+        rank = q * (self.count - 1)
+        if rank < self.zero:
+            return 0.0
+        seen = self.zero
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                # middle of the bucket in relative terms
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+    def quantiles(self, qs: Iterable[float]) -> List[float]:
+        '''
+        Values at the quantiles
+
+        :rtype: [float, ...]
+        '''
+        return [self.quantile(q) for q in qs]
@@ -0,0 +1,321 @@
+'''
+Asyncio engine
+==============
+
+Alternative to the thread engine of :mod:`pysniffwave.sniffwave.client`.
+
+Sniffwave is executed with :func:`asyncio.create_subprocess_exec` (no
+shell) and its output is streamed through async line or batch readers.
+Workers are driven as coroutines fed by :class:`asyncio.Queue`, their
+blocking :meth:`Worker.process` (HDF5, SQL) being offloaded to a
+dedicated executor thread per worker.
+
+A single event loop can supervise several sniffwave instances feeding
+the same workers, the supervisor reacts as soon as a child exits
+instead of on a health check interval.
+
+..  codeauthor:: Charles Blais
+'''
+import asyncio
+import concurrent.futures
+import logging
+import shlex
+import signal
+
+from typing import AsyncIterator, List, Optional, Union
+
+from pysniffwave.workers.worker import Worker
+from .columnar import ColumnBatch, ColumnParser
+from .parser import Channel, ChannelError, parse
+from .reader import DEFAULT_CHUNK_SIZE
+from .spec import SniffwaveSpec, to_specs
+
+
+async def read_lines(stream: asyncio.StreamReader) -> AsyncIterator[str]:
+    '''
+    Async line reader
+
+    :param stream: stream to read
+    '''
+    while True:
+        line = await stream.readline()
+        if not line:
+            return
+        yield line.decode('utf-8', errors='replace')
+
+
+async def read_batches(
+    stream: asyncio.StreamReader,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> AsyncIterator[List[str]]:
+    '''
+    Async batch reader yielding the complete lines of each chunk read.
+    The partial line at the end of a chunk is carried over to the next.
+
+    :param stream: stream to read
+    :param int chunk_size: maximum size of a chunk in bytes
+    '''
+    tail = b''
+    while True:
+        chunk = await stream.read(chunk_size)
+        if not chunk:
+            return
+        data = tail + chunk
+        end = data.rfind(b'\n') + 1
+        tail = data[end:]
+        if end:
+            yield data[:end].decode('utf-8', errors='replace').splitlines()
+
+
+class AsyncSniffwave(object):
+    '''
+    Sniffwave handler for the asyncio engine
+
+    :type cmd_args: str or [str,...]
+    :param str cmd_args: wave identifier
+
+    :param int max_lines: maximum amount of lines to decode
+    :param int max_tries: maximum amount of failed attempts
+    :param int chunk_size: read the output in chunks of the size (bytes)
+        and publish :class:`ColumnBatch` (None to publish line by line)
+    :param str program: sniffwave executable
+    :param str source: tag added to the packets (ex: ring name)
+    '''
+    def __init__(
+        self,
+        cmd_args: Union[str, List[str]] = 'WAVE_RING',
+        max_lines: int = -1,
+        max_fails: int = -1,
+        chunk_size: Optional[int] = DEFAULT_CHUNK_SIZE,
+        program: str = 'sniffwave',
+        queues: Optional[List[asyncio.Queue]] = None,
+        source: Optional[str] = None,
+    ):
+        self.cmd_args = cmd_args if isinstance(cmd_args, list) \
+            else shlex.split(cmd_args)
+        self.max_lines = max_lines
+        self.max_fails = max_fails
+        self.chunk_size = chunk_size
+        self.program = program
+        self.queues = [] if queues is None else queues
+        self.source = source
+        self._proc: Optional[asyncio.subprocess.Process] = None
+        self._stopped = False
+
+    def stop(self):
+        '''
+        Stop reading and terminate the sniffwave process
+        '''
+        logging.info('Request received to stop sniffwave')
+        self._stopped = True
+        if self._proc is not None and self._proc.returncode is None:
+            self._proc.terminate()
+
+    async def _publish(
+        self,
+        item: Union[Channel, ChannelError, ColumnBatch]
+    ) -> None:
+        for q in self.queues:
+            await q.put(item)
+
+    async def _log_stderr(self, stream: asyncio.StreamReader) -> None:
+        '''
+        Drain stderr so sniffwave never blocks on a full pipe
+        '''
+        async for line in read_lines(stream):
+            logging.error(f'sniffwave: {line.rstrip()}')
+
+    async def run(self) -> Optional[int]:
+        '''
+        Execute sniffwave program and publish packets until told to stop,
+        the process exits or a limit (lines, fails) is reached.
+
+        :rtype: int
+        :returns: return code of sniffwave (None if not executed)
+        '''
+        logging.info(f'Executing: {self.program} {" ".join(self.cmd_args)}')
+        try:
+            self._proc = proc = await asyncio.create_subprocess_exec(
+                self.program, *self.cmd_args,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE)
+        except FileNotFoundError:
+            logging.error(f'The {self.program} program could not be found, \
+make sure it exists in the system PATH')
+            return None
+        assert proc.stdout is not None and proc.stderr is not None
+        stderr = asyncio.create_task(self._log_stderr(proc.stderr))
+
+        if self.chunk_size is None:
+            await self._read_lines(proc.stdout)
+        else:
+            await self._read_batches(proc.stdout, self.chunk_size)
+
+        if proc.returncode is None:
+            logging.info('Stopping sniffwave gracefully')
+            proc.terminate()
+        rcode = await proc.wait()
+        await stderr
+        logging.info(f'sniffwave stopped with rcode {rcode}')
+        return rcode
+
+    def _keep_reading(self, current_fails: int) -> bool:
+        return not self._stopped \
+            and self.max_lines != 0 \
+            and current_fails != 0
+
+    async def _read_lines(self, stream: asyncio.StreamReader) -> None:
+        current_fails = self.max_fails
+        async for line in read_lines(stream):
+            stat = parse(line)
+            if stat is None:
+                if current_fails > 0:
+                    current_fails -= 1
+            else:
+                current_fails = self.max_fails
+                if self.source is not None:
+                    stat['source'] = self.source
+                await self._publish(stat)
+                if self.max_lines > 0:
+                    self.max_lines -= 1
+            if not self._keep_reading(current_fails):
+                break
+
+    async def _read_batches(
+        self,
+        stream: asyncio.StreamReader,
+        chunk_size: int,
+    ) -> None:
+        current_fails = self.max_fails
+        parser = ColumnParser()
+        async for lines in read_batches(stream, chunk_size):
+            # never publish more than the maximum of lines to read
+            if self.max_lines > 0:
+                lines = lines[:self.max_lines]
+            batch = parser.parse(lines, self.source)
+            if not len(batch):
+                if current_fails > 0:
+                    current_fails -= 1
+            else:
+                current_fails = self.max_fails
+                await self._publish(batch)
+                if self.max_lines > 0:
+                    self.max_lines -= len(batch)
+            if not self._keep_reading(current_fails):
+                break
+
+
+async def run_worker(
+    myworker: Worker,
+    myqueue: asyncio.Queue,
+) -> None:
+    '''
+    Drive a worker from an async queue.  The worker stops when receiving
+    None or when no message is received for its timeout.
+
+    :param myworker: worker processing the messages
+    :param myqueue: queue of messages
+    '''
+    loop = asyncio.get_running_loop()
+    # one thread per worker keeps the order of writes and thread bound
+    # resources (ex: sqlite connection)
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=1,
+        thread_name_prefix=type(myworker).__name__)
+    await loop.run_in_executor(executor, myworker.setup)
+    try:
+        running = True
+        while running:
+            try:
+                item = await asyncio.wait_for(
+                    myqueue.get(), timeout=myworker.timeout)
+            except asyncio.TimeoutError:
+                logging.error('Worker timeout (no message), stop')
+                break
+            if myworker.interval > 0 and item is not None:
+                await asyncio.sleep(myworker.interval)
+            items = [item]
+            while not myqueue.empty():
+                items.append(myqueue.get_nowait())
+            if None in items:
+                running = False
+                items = [item for item in items if item is not None]
+            if items:
+                await loop.run_in_executor(
+                    executor, myworker.process, items)
+    finally:
+        await loop.run_in_executor(executor, myworker.teardown)
+        executor.shutdown()
+
+
+async def supervise(
+    myworkers: List[Worker],
+    sniffwaves: List[AsyncSniffwave],
+) -> None:
+    '''
+    Run every sniffwave instance feeding all the workers until any
+    instance or any worker stopped.
+
+    :param myworkers: workers
+    :param sniffwaves: sniffwave instances
+    '''
+    loop = asyncio.get_running_loop()
+
+    myqueues: List[asyncio.Queue] = [asyncio.Queue() for _ in myworkers]
+    for mysniff in sniffwaves:
+        mysniff.queues = myqueues
+
+    def stop():
+        for mysniff in sniffwaves:
+            mysniff.stop()
+
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop)
+
+    worker_tasks = [
+        asyncio.create_task(run_worker(myworker, myqueue))
+        for myworker, myqueue in zip(myworkers, myqueues)]
+    sniff_tasks = [
+        asyncio.create_task(mysniff.run()) for mysniff in sniffwaves]
+    try:
+        await asyncio.wait(
+            [*sniff_tasks, *worker_tasks],
+            return_when=asyncio.FIRST_COMPLETED)
+        if not any(task.done() for task in sniff_tasks):
+            logging.info('Worker stopped...')
+        stop()
+        await asyncio.gather(*sniff_tasks)
+        logging.info('Sniffwave stopped...')
+        for myqueue in myqueues:
+            myqueue.put_nowait(None)
+        await asyncio.gather(*worker_tasks)
+    finally:
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(signum)
+
+
+def start(
+    myworkers: Union[Worker, List[Worker]],
+    cmd_args: Union[str, List[str], List[SniffwaveSpec]] = 'WAVE_RING',
+    max_lines: int = -1,
+    max_fails: int = -1,
+    chunk_size: Optional[int] = DEFAULT_CHUNK_SIZE,
+    program: str = 'sniffwave',
+):
+    '''
+    Start reading content of the sniffwave and send to the worker using
+    the asyncio engine
+
+    .. see:: :func:`pysniffwave.sniffwave.client.start`
+    '''
+    if not isinstance(myworkers, list):
+        myworkers = [myworkers]
+    asyncio.run(supervise(myworkers, [
+        AsyncSniffwave(
+            cmd_args=spec.args,
+            max_lines=max_lines,
+            max_fails=max_fails,
+            chunk_size=chunk_size,
+            program=program,
+            source=spec.source)
+        for spec in to_specs(cmd_args)]))
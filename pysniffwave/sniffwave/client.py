@@ -3,14 +3,39 @@
 '''
 import logging
 import queue
+import random
 import subprocess
+import threading
 import time
 
-from typing import Union, List
+from typing import Optional, Union, List
 
+from pysniffwave.queues import BoundedQueue, BroadcastRing, OverflowPolicy
 from pysniffwave.thread import StoppableThread
 from pysniffwave.workers.worker import Worker
+from .columnar import ColumnBatch, ColumnParser
 from .parser import parse
+from .pool import ParsePool
+from .reader import DEFAULT_CHUNK_SIZE, ChunkReader
+from .replay import Replay
+from .spec import SniffwaveSpec, to_specs
+
+QueueLike = Union[queue.Queue, BroadcastRing]
+
+
+def backoff_delay(attempt: int, base: float, maximum: float) -> float:
+    '''
+    Jittered exponential backoff: the delay doubles with each attempt
+    (up to the maximum) and is randomized between half and the full
+    delay so several readers do not respawn together.
+
+    :param int attempt: attempt number (from 0)
+    :param float base: delay of the first attempt (s)
+    :param float maximum: maximum delay (s)
+    :rtype: float
+    '''
+    delay = min(maximum, base * 2 ** min(attempt, 32))
+    return delay * random.uniform(0.5, 1.0)
 
 
 class Sniffwave(StoppableThread):
@@ -19,21 +44,46 @@ class Sniffwave(StoppableThread):
     '''
     def __init__(
         self,
-        queues: Union[queue.Queue, List[queue.Queue]],
+        queues: Union[QueueLike, List[QueueLike]],
         cmd_args: Union[str, List[str]] = 'WAVE_RING',
         max_lines: int = -1,
         max_fails: int = -1,
+        chunk_size: Optional[int] = None,
+        source: Optional[str] = None,
+        parse_processes: int = 0,
+        max_restarts: int = 0,
+        hang_timeout: float = 0,
+        backoff: float = 1,
+        max_backoff: float = 30,
+        replay: Optional[Replay] = None,
+        program: str = 'sniffwave',
         *args, **kwargs
     ):
         '''
         :type queue: :class:`queue.Queue` or [:class:`queue.Queue`, ...]
-        :param queue: queues
+        :param queue: queues (or :class:`BroadcastRing`)
 
         :type cmd_args: str or [str,...]
         :param str cmd_args: wave identifier
 
         :param int max_lines: maximum amount of lines to decode
         :param int max_tries: maximum amount of failed attempts
+        :param int chunk_size: read the output in chunks of the size (bytes)
+            and publish :class:`ColumnBatch` instead of one message per
+            line (default: None, line by line)
+        :param str source: tag added to the packets (ex: ring name)
+        :param int parse_processes: with chunk_size, parse the chunks in a
+            pool of processes while this thread only reads the pipe
+            (default: 0, parse in this thread)
+        :param int max_restarts: amount of times sniffwave is respawned
+            when it exits or hangs (default: 0, never, -1 for infinite)
+        :param float hang_timeout: sniffwave is killed when it produces no
+            output for the time (s) (default: 0, never)
+        :param float backoff: delay (s) before the first respawn, doubled
+            (with jitter) on each consecutive respawn
+        :param float max_backoff: maximum delay (s) before a respawn
+        :param replay: replay a capture instead of executing sniffwave
+        :param str program: sniffwave executable (ex: sniffwave_synthetic)
         '''
         super().__init__(*args, **kwargs)
         self.cmd_args = ' '.join(cmd_args) \
@@ -41,26 +91,187 @@ class Sniffwave(StoppableThread):
         self.queues = [queues] if not isinstance(queues, list) else queues
         self.max_lines = max_lines
         self.max_fails = max_fails
+        self.chunk_size = chunk_size
+        self.source = source
+        self.parse_processes = parse_processes
+        self.max_restarts = max_restarts
+        self.hang_timeout = hang_timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.replay = replay
+        self.program = program
+        self._current_fails = max_fails
+        # restart statistics
+        self.restarts = 0
+        self.hangs = 0
+        self.downtime = 0.0
+        self._last_output = time.monotonic()
+        self._down_since: Optional[float] = None
+
+    def _spawn(self):
+        '''
+        Execute the sniffwave program (or the replay)
+
+        :rtype: :class:`subprocess.Popen` or :class:`ReplayProcess`
+        :raises FileNotFoundError: sniffwave could not be executed
+        '''
+        if self.replay is not None:
+            logging.info(f'Replaying: {" ".join(self.replay.paths)}')
+            return self.replay.spawn()
+        logging.info(f'Executing: {self.program} {self.cmd_args}')
+        # exec so the signals (terminate, kill) reach sniffwave itself
+        # and not only the shell
+        return subprocess.Popen(
+            f'exec {self.program} {self.cmd_args}',
+            shell=True,
+            # the bulk reader reads the pipe without python buffering
+            bufsize=-1 if self.chunk_size is None else 0,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+
+    def _publish(self, item: Union[dict, ColumnBatch]) -> None:
+        '''
+        Add message to all queues
+        '''
+        for q in self.queues:
+            q.put(item)
+
+    def _mark_output(self) -> None:
+        '''
+        Record sniffwave produced output (hang detection and downtime)
+        '''
+        self._last_output = time.monotonic()
+        if self._down_since is not None:
+            self.downtime += self._last_output - self._down_since
+            self._down_since = None
+
+    def _watch(self, proc, done: threading.Event) -> None:
+        '''
+        Kill sniffwave when no output is produced for the hang timeout.
+        The reader then sees the pipe closing and respawns it.
+
+        :type proc: :class:`subprocess.Popen`
+        :param proc: sniffwave process
+        :param done: set when the process is no longer read
+        '''
+        while not done.wait(min(1.0, self.hang_timeout)):
+            silence = time.monotonic() - self._last_output
+            if silence >= self.hang_timeout:
+                logging.error(f'sniffwave {self.cmd_args} produced no output \
+for {silence:.1f}s, killing it')
+                self.hangs += 1
+                proc.kill()
+                return
+
+    def stats(self) -> dict:
+        '''
+        Restart statistics
+
+        :rtype: dict
+        '''
+        downtime = self.downtime
+        if self._down_since is not None:
+            downtime += time.monotonic() - self._down_since
+        return {
+            'restarts': self.restarts,
+            'hangs': self.hangs,
+            'downtime': round(downtime, 3),
+        }
 
     def run(self):
         '''
         Execute sniffwave program and listen for packets
         stop if told to stop
+
+        When sniffwave exits or hangs, it is respawned (up to max_restarts)
+        after a jittered exponential backoff.  The queues, thus the
+        workers, are kept across restarts.
         '''
-        current_fails = self.max_fails
+        pool = None
+        if self.chunk_size is not None and self.parse_processes > 0:
+            pool = ParsePool(self._publish_parsed, self.parse_processes)
+        attempt = 0
+        try:
+            while True:
+                started = time.monotonic()
+                closed = self._run_once(pool)
+                if not closed or self.is_stopped:
+                    break
+                if 0 <= self.max_restarts <= self.restarts:
+                    break
+                # sniffwave ran long enough, start the backoff over
+                if time.monotonic() - started > self.max_backoff:
+                    attempt = 0
+                delay = backoff_delay(attempt, self.backoff, self.max_backoff)
+                attempt += 1
+                self.restarts += 1
+                if self._down_since is None:
+                    self._down_since = time.monotonic()
+                logging.warning(f'Respawning sniffwave {self.cmd_args} in \
+{delay:.1f}s (restart {self.restarts})')
+                if self._stop_event.wait(delay):
+                    break
+        finally:
+            if pool is not None:
+                pool.close()
+
+    def _run_once(self, pool: Optional[ParsePool] = None) -> bool:
+        '''
+        Execute sniffwave once and read its output
 
+        :param pool: pool parsing the chunks
+        :rtype: bool
+        :returns: True if sniffwave closed its output (exit or hang)
+        '''
         try:
-            logging.info(f'Executing: sniffwave {self.cmd_args}')
-            proc = subprocess.Popen(
-                f'sniffwave {self.cmd_args}',
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
+            proc = self._spawn()
         except FileNotFoundError:
             logging.error('The sniffwave program could not be found, make sure \
 it exists in the system PATH')
-            return
+            return False
+
+        self._last_output = time.monotonic()
+        done = threading.Event()
+        if self.hang_timeout > 0:
+            threading.Thread(
+                target=self._watch, args=(proc, done),
+                name='SniffwaveWatchdog', daemon=True).start()
+
+        try:
+            if self.chunk_size is None:
+                closed = self._read_lines(proc)
+            elif pool is not None:
+                closed = self._read_chunks_pool(proc, pool)
+            else:
+                closed = self._read_chunks(proc)
+        finally:
+            done.set()
+
+        # terminate the process
+        logging.info('Stopping sniffwave gracefully')
+        proc.terminate()
+        try:
+            proc.wait(timeout=1.0)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+        # release the pipes before a respawn
+        for pipe in (proc.stdout, proc.stderr):
+            if pipe is not None:
+                pipe.close()
+        return closed
+
+    def _read_lines(self, proc) -> bool:
+        '''
+        Read and publish the sniffwave output one line at a time
+
+        :type proc: :class:`subprocess.Popen`
+        :param proc: sniffwave process
+        :rtype: bool
+        :returns: True if the output was closed
+        '''
+        current_fails = self.max_fails
 
         while not self.is_stopped \
                 and self.max_lines != 0 \
@@ -76,12 +287,12 @@ fail decount: {current_fails})')
             line = proc.stdout.readline()
             logging.debug(line)
 
-            # do nothing if the line is empty
+            # pipe closed, sniffwave stopped
             if not line:
-                if current_fails > 0:
-                    logging.debug(f'Reducing max fail count: {current_fails}')
-                    current_fails -= 1
-                continue
+                logging.error(f'sniffwave has a rcode {proc.wait()}')
+                logging.error(proc.stderr.read())
+                return True
+            self._mark_output()
 
             # parse the content of the line
             stat = parse(line.decode('utf-8'))
@@ -94,81 +305,269 @@ fail decount: {current_fails})')
 
             # reset fail count
             current_fails = self.max_fails
-            # add message to all queues
-            for q in self.queues:
-                q.put(stat)
+            if self.source is not None:
+                stat['source'] = self.source
+            self._publish(stat)
 
             # maximum of lines to read
             if self.max_lines > 0:
                 logging.debug(f'Reducing max line count: {self.max_lines}')
                 self.max_lines -= 1
+        return False
 
-        # terminate the process
-        logging.info('Stopping sniffwave gracefully')
-        proc.terminate()
-        return proc.wait(timeout=1.0)
+    def _read_chunks(self, proc) -> bool:
+        '''
+        Read the sniffwave output in bulk and publish one
+        :class:`ColumnBatch` per chunk.
+
+        Fail and line counting are done per batch: a chunk without any
+        decodable packet counts as one fail.
+
+        :type proc: :class:`subprocess.Popen`
+        :param proc: sniffwave process
+        :rtype: bool
+        :returns: True if the output was closed
+        '''
+        current_fails = self.max_fails
+        reader = ChunkReader(
+            proc.stdout, chunk_size=self.chunk_size or DEFAULT_CHUNK_SIZE)
+        parser = ColumnParser()
+
+        while not self.is_stopped \
+                and self.max_lines != 0 \
+                and current_fails != 0:
+            lines = reader.read_lines()
+
+            # pipe closed, sniffwave stopped
+            if lines is None:
+                logging.error(f'sniffwave has a rcode {proc.wait()}')
+                logging.error(proc.stderr.read())
+                reader.close()
+                return True
+            self._mark_output()
+
+            # never publish more than the maximum of lines to read
+            if self.max_lines > 0:
+                lines = lines[:self.max_lines]
+
+            batch = parser.parse(lines, self.source)
+            if not len(batch):
+                if lines and current_fails > 0:
+                    logging.debug(f'Reducing max fail count: {current_fails}')
+                    current_fails -= 1
+                continue
+
+            # reset fail count
+            current_fails = self.max_fails
+            self._publish(batch)
+
+            if self.max_lines > 0:
+                self.max_lines -= len(batch)
+        reader.close()
+        return False
+
+    def _read_chunks_pool(self, proc, pool: ParsePool) -> bool:
+        '''
+        Read the sniffwave output in bulk and hand the raw chunks to a
+        :class:`ParsePool`.  Batches are published in order by
+        :meth:`_publish_parsed` which also keeps the fail and line
+        counts, stopping the thread when a limit is reached.
+
+        :type proc: :class:`subprocess.Popen`
+        :param proc: sniffwave process
+        :param pool: pool parsing the chunks
+        :rtype: bool
+        :returns: True if the output was closed
+        '''
+        self._current_fails = self.max_fails
+        reader = ChunkReader(
+            proc.stdout, chunk_size=self.chunk_size or DEFAULT_CHUNK_SIZE)
+
+        closed = False
+        while not self.is_stopped:
+            chunk = reader.read_chunk()
+
+            # pipe closed, sniffwave stopped
+            if chunk is None:
+                logging.error(f'sniffwave has a rcode {proc.wait()}')
+                logging.error(proc.stderr.read())
+                closed = True
+                break
+            self._mark_output()
+
+            if chunk:
+                pool.submit(chunk, self.source)
+
+        reader.close()
+        return closed
+
+    def _publish_parsed(self, batch: ColumnBatch) -> None:
+        '''
+        Publish a batch parsed by the pool, see :meth:`_read_chunks_pool`
+        '''
+        if self.max_lines == 0 or self._current_fails == 0:
+            return
+
+        if not len(batch):
+            if self._current_fails > 0:
+                logging.debug(
+                    f'Reducing max fail count: {self._current_fails}')
+                self._current_fails -= 1
+                if self._current_fails == 0:
+                    self.stop()
+            return
+
+        # reset fail count
+        self._current_fails = self.max_fails
+
+        # never publish more than the maximum of lines to read
+        if self.max_lines > 0:
+            batch = batch.head(self.max_lines)
+            self.max_lines -= len(batch)
+        self._publish(batch)
+        if self.max_lines == 0:
+            self.stop()
 
 
 def start(
     myworkers: Union[Worker, List[Worker]],
-    cmd_args: str = 'WAVE_RING',
+    cmd_args: Union[str, List[str], List[SniffwaveSpec]] = 'WAVE_RING',
     healthcheck: int = 1,
     max_lines: int = -1,
     max_fails: int = -1,
+    chunk_size: Optional[int] = None,
+    parse_processes: int = 0,
+    broadcast_size: int = 0,
+    overflow: OverflowPolicy = OverflowPolicy.block,
+    queue_size: int = 0,
+    max_restarts: int = 0,
+    hang_timeout: float = 0,
+    backoff: float = 1,
+    max_backoff: float = 30,
+    replay: Optional[Replay] = None,
+    program: str = 'sniffwave',
 ):
     '''
     Start reading content of the sniffwave and send to the worker
 
+    Each sniffwave spec gets its own reader thread, all of them feeding
+    the same workers.  Processing stops as soon as any reader or any
+    worker stops.  With max_restarts, a reader respawns its sniffwave
+    when it exits or hangs instead of stopping.
+
     :type myworkers: :class:`Worker` or [:class:`Worker`, ...]
     :param myworkers: worker(s) to pass decoded sniffwave information via queue
 
-    :type cmd_args: str or [str,...]
-    :param str cmd_args: wave identifier
+    :type cmd_args: str or [str,...] or [:class:`SniffwaveSpec`, ...]
+    :param str cmd_args: wave identifier or sniffwave specs
 
     :param int healthcheck: interval time in seconds to check if all
         threads are running
-    :param int max_lines: maximum amount of lines to decode
+    :param int max_lines: maximum amount of lines to decode (per spec)
     :param int max_tries: maximum amount of failed attempts
+    :param int chunk_size: bulk read size in bytes, see :class:`Sniffwave`
+    :param int parse_processes: amount of parsing processes per spec,
+        see :class:`Sniffwave`
+    :param int broadcast_size: publish the messages once in a
+        :class:`BroadcastRing` of the size read by every worker instead of
+        one queue per worker (default: 0, one queue per worker)
+    :param overflow: overflow policy of the broadcast ring or of the
+        worker queues when full
+    :param int queue_size: maximum amount of messages in each worker
+        queue, see :class:`BoundedQueue` (default: 0, unbounded)
+    :param int max_restarts: amount of respawns of each sniffwave,
+        see :class:`Sniffwave` (default: 0, never, -1 for infinite)
+    :param float hang_timeout: kill sniffwave when silent for the time (s)
+    :param float backoff: delay (s) before the first respawn
+    :param float max_backoff: maximum delay (s) before a respawn
+    :param replay: replay a capture instead of executing sniffwave,
+        see :class:`Replay`
+    :param str program: sniffwave executable (ex: sniffwave_synthetic)
     '''
     if not isinstance(myworkers, list):
         myworkers = [myworkers]
 
+    if max_restarts != 0:
+        # workers stop when they receive nothing for their timeout
+        outage = hang_timeout + max_backoff
+        for myworker in myworkers:
+            if myworker.timeout <= outage:
+                logging.warning(f'{type(myworker).__name__} timeout \
+({myworker.timeout}s) is shorter than the hang timeout and maximum \
+backoff ({outage}s), it could stop while sniffwave is respawned')
+
     # create queues for each worker
-    myqueues: List[queue.Queue[dict]] = []
+    myqueues: List[QueueLike] = []
+    ring: Optional[BroadcastRing] = None
+    if broadcast_size > 0:
+        ring = BroadcastRing(broadcast_size, overflow)
+        myqueues.append(ring)
     for myworker in myworkers:
-        myqueue: queue.Queue[dict] = queue.Queue()
-        myqueues.append(myqueue)
-        # set the queue and start my worker thread
-        myworker.set_queue(myqueue)
+        if ring is not None:
+            myworker.set_queue(ring.subscribe(type(myworker).__name__))
+        else:
+            myqueue = BoundedQueue(
+                queue_size, overflow, type(myworker).__name__)
+            myqueues.append(myqueue)
+            myworker.set_queue(myqueue)
+        # start my worker thread
         myworker.start()
 
-    # start the listening process
-    mysniff = Sniffwave(
-        myqueues,
-        cmd_args=cmd_args,
-        max_lines=max_lines,
-        max_fails=max_fails)
-    mysniff.start()
+    # start the listening processes
+    mysniffs: List[Sniffwave] = []
+    for spec in to_specs(cmd_args):
+        mysniff = Sniffwave(
+            myqueues,
+            cmd_args=spec.args,
+            max_lines=max_lines,
+            max_fails=max_fails,
+            chunk_size=chunk_size,
+            source=spec.source,
+            parse_processes=parse_processes,
+            max_restarts=max_restarts,
+            hang_timeout=hang_timeout,
+            backoff=backoff,
+            max_backoff=max_backoff,
+            replay=replay,
+            program=program)
+        mysniff.start()
+        mysniffs.append(mysniff)
 
     # infinite check if thread is still running
     keep_running = True
     while keep_running:
         logging.info('Health check: sniffwave')
-        if not mysniff.is_alive():
-            logging.info('Sniffwave stopped...')
-            break
+        for mysniff in mysniffs:
+            if not mysniff.is_alive():
+                logging.info(f'Sniffwave {mysniff.cmd_args} stopped...')
+                keep_running = False
+                break
+            if max_restarts != 0:
+                logging.info(f'Sniffwave {mysniff.cmd_args}: \
+{mysniff.stats()}')
         for myworker in myworkers:
             logging.info('Health check: worker')
             if not myworker.is_alive():
                 logging.info('Worker stopped...')
                 keep_running = False
                 break
-        time.sleep(healthcheck)
+        if ring is not None:
+            ring.log_stats()
+        for workqueue in myqueues:
+            if isinstance(workqueue, BoundedQueue):
+                workqueue.log_stats()
+        if keep_running:
+            time.sleep(healthcheck)
 
     # indicate both thread to stop
-    mysniff.stop()
+    for mysniff in mysniffs:
+        mysniff.stop()
     for myworker in myworkers:
         myworker.stop()
-    mysniff.join()
+    if ring is not None:
+        # release sniffwave if waiting for a stopped worker
+        ring.close()
+    for mysniff in mysniffs:
+        mysniff.join()
     for myworker in myworkers:
         myworker.join()
@@ -0,0 +1,334 @@
+'''
+Columnar parser
+===============
+
+Decode sniffwave lines straight into NumPy structured arrays instead
+of one :class:`Channel` dictionary per packet.
+
+Timestamps (start_time, end_time and recorded_at) are kept as epoch
+float64 until the batch is converted to a :class:`pd.DataFrame`, at
+which point they are converted in one vectorized pass to the same
+local naive datetimes produced by :func:`pysniffwave.sniffwave.parser.parse`.
+
+..  codeauthor:: Charles Blais
+'''
+import datetime
+import time
+
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .parser import LINE_PATTERN, Channel, ChannelError
+
+
+# String sizes follow the limits of the Earthworm TRACE2 header
+SCNL_DTYPE = [
+    ('station', 'U6'),
+    ('channel', 'U8'),
+    ('network', 'U8'),
+    ('location', 'U2'),
+]
+CHANNEL_DTYPE = np.dtype([
+    *SCNL_DTYPE,
+    ('n_samples', 'uint16'),
+    ('sample_rate', 'float32'),
+    ('start_time', 'float64'),
+    ('n_bytes', 'uint16'),
+    ('data_latency', 'float32'),
+    ('feeding_latency', 'float32'),
+    ('recorded_at', 'float64'),
+])
+ERROR_DTYPE = np.dtype([
+    *SCNL_DTYPE,
+    ('error', 'U20'),
+    ('start_time', 'float64'),
+    ('end_time', 'float64'),
+    ('recorded_at', 'float64'),
+])
+TIME_COLUMNS = ('start_time', 'end_time', 'recorded_at')
+
+
+def to_datetime(epoch: np.ndarray) -> np.ndarray:
+    '''
+    Convert epoch seconds to local naive datetime64[us]
+
+    The UTC offset is resolved once for the whole array, a batch is not
+    expected to straddle a daylight saving change.
+
+    :param epoch: epoch seconds (float64)
+    :rtype: np.ndarray
+    '''
+    if not len(epoch):
+        return epoch.astype('datetime64[us]')
+    offset = time.localtime(float(epoch[0])).tm_gmtoff
+    return np.round((epoch + offset) * 1e6).astype(
+        'int64').astype('datetime64[us]')
+
+
+def to_epoch(values: np.ndarray) -> np.ndarray:
+    '''
+    Convert local naive datetime64 to epoch seconds, the inverse of
+    :func:`to_datetime`
+
+    :param values: local naive datetimes
+    :rtype: np.ndarray
+    '''
+    seconds = values.astype('datetime64[us]').astype('int64') / 1e6
+    if not len(seconds):
+        return seconds
+    offset = time.localtime(float(seconds[0])).tm_gmtoff
+    return seconds - offset
+
+
+def to_frame(
+    records: np.ndarray,
+    source: Optional[str] = None,
+) -> pd.DataFrame:
+    '''
+    Convert a structured array of CHANNEL_DTYPE or ERROR_DTYPE
+    to a dataframe with the same columns as the dictionary responses.
+
+    :param records: structured array
+    :param str source: source tag added as a column if set
+    :rtype: pd.DataFrame
+    '''
+    columns = {}
+    for name in records.dtype.names or ():
+        column = records[name]
+        if name in TIME_COLUMNS:
+            # HDFStore of pandas 2 writes the integers of other units
+            # but reads them back as nanoseconds
+            column = to_datetime(column).astype('datetime64[ns]')
+        elif column.dtype.kind == 'U':
+            column = column.astype(object)
+        columns[name] = column
+    if source is not None:
+        columns['source'] = np.full(len(records), source, dtype=object)
+    return pd.DataFrame(columns)
+
+
+def to_records(
+    records: np.ndarray,
+    source: Optional[str] = None,
+) -> List[Union[Channel, ChannelError]]:
+    '''
+    Convert a structured array back to the dictionary responses
+    for workers operating on single packets.
+
+    :param records: structured array
+    :param str source: source tag added to the responses if set
+    :rtype: [:class:`Channel` or :class:`ChannelError`, ...]
+    '''
+    names = records.dtype.names or ()
+    Response = ChannelError if 'error' in names else Channel
+    responses = []
+    for row in records.tolist():
+        response = Response(zip(names, row))
+        for name in TIME_COLUMNS:
+            if name in response:
+                response[name] = datetime.datetime.fromtimestamp(
+                    response[name])
+        if source is not None:
+            response['source'] = source
+        responses.append(response)
+    return responses
+
+
+def _latest(records: np.ndarray) -> np.ndarray:
+    '''
+    Last row of each SCNL in the structured array (order preserved)
+    '''
+    if not len(records):
+        return records
+    scnl = records[[name for name, _ in SCNL_DTYPE]][::-1]
+    _, index = np.unique(scnl, return_index=True)
+    return records[np.sort(len(records) - 1 - index)]
+
+
+class ColumnBatch(object):
+    '''
+    Batch of decoded sniffwave lines
+
+    :param channels: structured array of CHANNEL_DTYPE
+    :param errors: structured array of ERROR_DTYPE
+    :param str source: source of the packets (ex: ring name)
+    '''
+    def __init__(
+        self,
+        channels: np.ndarray,
+        errors: np.ndarray,
+        source: Optional[str] = None,
+    ):
+        self.channels = channels
+        self.errors = errors
+        self.source = source
+
+    def __len__(self) -> int:
+        return len(self.channels) + len(self.errors)
+
+    def __iter__(self) -> Iterator[Union[Channel, ChannelError]]:
+        '''
+        Iterate over the dictionary responses (channels first)
+        '''
+        yield from to_records(self.channels, self.source)
+        yield from to_records(self.errors, self.source)
+
+    def head(self, n: int) -> 'ColumnBatch':
+        '''
+        First n packets of the batch (channels first)
+
+        :param int n: amount of packets
+        :rtype: :class:`ColumnBatch`
+        '''
+        channels = self.channels[:n]
+        return ColumnBatch(
+            channels,
+            self.errors[:n - len(channels)],
+            self.source)
+
+    def split(self, n: int) -> Tuple['ColumnBatch', 'ColumnBatch']:
+        '''
+        First n packets of the batch (see head) and the other packets
+
+        :param int n: amount of packets of the first batch
+        :rtype: (:class:`ColumnBatch`, :class:`ColumnBatch`)
+        '''
+        head = self.head(n)
+        return head, ColumnBatch(
+            self.channels[len(head.channels):],
+            self.errors[len(head.errors):],
+            self.source)
+
+    def latest(self) -> 'ColumnBatch':
+        '''
+        Keep only the latest packet of each channel (SCNL)
+
+        :rtype: :class:`ColumnBatch`
+        '''
+        return ColumnBatch(
+            _latest(self.channels),
+            _latest(self.errors),
+            self.source)
+
+    @staticmethod
+    def concatenate(batches: List['ColumnBatch']) -> 'ColumnBatch':
+        '''
+        Merge multiple batches of the same source into one
+
+        :param batches: batches to merge
+        :rtype: :class:`ColumnBatch`
+
+        :raises ValueError: batches are from different sources
+        '''
+        sources = set(batch.source for batch in batches)
+        if len(sources) > 1:
+            raise ValueError(f'Can not merge batches of sources {sources}')
+        return ColumnBatch(
+            np.concatenate(
+                [batch.channels for batch in batches]
+                or [np.empty(0, CHANNEL_DTYPE)]),
+            np.concatenate(
+                [batch.errors for batch in batches]
+                or [np.empty(0, ERROR_DTYPE)]),
+            sources.pop() if sources else None,
+        )
+
+
+class ColumnParser(object):
+    '''
+    Parse sniffwave lines into preallocated column buffers
+
+    The buffers are reused between calls and grow when a buffer of lines
+    contains more packets than their capacity.  Each call returns a
+    :class:`ColumnBatch` holding a compact copy of the filled rows.
+
+    :param int capacity: initial amount of rows preallocated
+    '''
+    def __init__(self, capacity: int = 4096):
+        self._channels = np.empty(capacity, dtype=CHANNEL_DTYPE)
+        self._errors = np.empty(max(capacity // 8, 1), dtype=ERROR_DTYPE)
+        self.skipped = 0
+
+    @staticmethod
+    def _grow(buffer: np.ndarray) -> np.ndarray:
+        grown = np.empty(len(buffer) * 2, dtype=buffer.dtype)
+        grown[:len(buffer)] = buffer
+        return grown
+
+    def parse(
+        self,
+        lines: Iterable[str],
+        source: Optional[str] = None,
+        recorded_at: Optional[float] = None,
+    ) -> ColumnBatch:
+        '''
+        Parse a buffer of sniffwave lines
+
+        Lines that can not be decoded are skipped and counted in the
+        skipped property.
+
+        :param lines: sniffwave lines
+        :param str source: source of the lines (ex: ring name)
+        :param float recorded_at: epoch of reception of the lines
+            (default: now)
+        :rtype: :class:`ColumnBatch`
+        '''
+        if recorded_at is None:
+            recorded_at = time.time()
+        match = LINE_PATTERN.match
+        channels, errors = self._channels, self._errors
+        n_channels = n_errors = skipped = 0
+        for line in lines:
+            result = match(line)
+            if result is None:
+                skipped += 1
+                continue
+            station, channel, network, location = result.group(
+                'station', 'channel', 'network', 'location')
+            if location == '--':
+                location = ''
+            if result['error'] is None:
+                if n_channels == len(channels):
+                    channels = self._channels = self._grow(channels)
+                channels[n_channels] = (
+                    station, channel, network, location,
+                    int(result['n_samples']),
+                    float(result['sample_rate']),
+                    float(result['start_time']),
+                    int(result['n_bytes']),
+                    float(result['data_latency']),
+                    float(result['feeding_latency']),
+                    recorded_at,
+                )
+                n_channels += 1
+            else:
+                if n_errors == len(errors):
+                    errors = self._errors = self._grow(errors)
+                errors[n_errors] = (
+                    station, channel, network, location,
+                    result['error'],
+                    float(result['error_start_time']),
+                    float(result['end_time']),
+                    recorded_at,
+                )
+                n_errors += 1
+        self.skipped = skipped
+        return ColumnBatch(
+            channels[:n_channels].copy(),
+            errors[:n_errors].copy(),
+            source)
+
+
+def parse_columns(lines: Iterable[str]) -> ColumnBatch:
+    '''
+    Parse a buffer of sniffwave lines into a :class:`ColumnBatch`
+
+    Prefer keeping a :class:`ColumnParser` when parsing repeatedly
+    so the buffers are reused.
+
+    :param lines: sniffwave lines
+    :rtype: :class:`ColumnBatch`
+    '''
+    return ColumnParser().parse(lines)
@@ -5,7 +5,7 @@ import logging
 import re
 import datetime
 
-from typing import Optional, Union
+from typing import Iterable, List, Optional, Union
 
 
 class Channel(dict):
@@ -16,6 +16,65 @@ class ChannelError(dict):
     '''Special condition response'''
 
 
+# Single anchored pattern covering both line types returned by sniffwave.
+# Only the fields we keep are captured so a line is decoded in one pass.
+LINE_PATTERN = re.compile(
+    r'\s*(?P<station>[A-Z0-9]+)\.(?P<channel>[A-Z0-9]+)\.'
+    r'(?P<network>[A-Z0-9]+)\.(?P<location>[A-Z0-9-]+)\s+(?:'
+    # 1. standard line with latency
+    r'\(\S+ \S+\) \S+ \S+\s+(?P<n_samples>\d+)\s+(?P<sample_rate>[\d.]+)'
+    r' \S+ \S+ \((?P<start_time>[\d.]+)\) \S+ \S+ \([\d.]+\)'
+    r'.*?len\s*(?P<n_bytes>\d+) \[D:\s*(?P<data_latency>-?[\d.]+)s'
+    r' F:\s*(?P<feeding_latency>-?[\d.]+)s\]'
+    r'|'
+    # 2. error: gap, overlap, out-of-order
+    r'(?P<error>[a-z-]+)\s.*?\((?P<error_start_time>[\d.]+)\)'
+    r' \S+ \S+ \((?P<end_time>[\d.]+)\)'
+    r')'
+)
+
+
+def _from_match(
+    match: 're.Match[str]',
+    recorded_at: datetime.datetime,
+) -> Union[Channel, ChannelError]:
+    '''
+    Convert a match of LINE_PATTERN to its response object
+    '''
+    location = match['location']
+    if location == '--':
+        location = ''
+
+    if match['error'] is not None:
+        return ChannelError(
+            station=match['station'],
+            channel=match['channel'],
+            network=match['network'],
+            location=location,
+            error=match['error'],
+            start_time=datetime.datetime.fromtimestamp(
+                float(match['error_start_time'])),
+            end_time=datetime.datetime.fromtimestamp(
+                float(match['end_time'])),
+            recorded_at=recorded_at,
+        )
+
+    return Channel(
+        station=match['station'],
+        channel=match['channel'],
+        network=match['network'],
+        location=location,
+        n_samples=int(match['n_samples']),
+        sample_rate=float(match['sample_rate']),
+        start_time=datetime.datetime.fromtimestamp(
+            float(match['start_time'])),
+        n_bytes=int(match['n_bytes']),
+        data_latency=float(match['data_latency']),
+        feeding_latency=float(match['feeding_latency']),
+        recorded_at=recorded_at,
+    )
+
+
 def parse(line: str) -> Optional[Union[Channel, ChannelError]]:
     '''
     Parse the line response of the sniffwave message.
@@ -26,52 +85,39 @@ def parse(line: str) -> Optional[Union[Channel, ChannelError]]:
     For an example of each, see the content of the sniffwave_output.txt in the
     test folder.
 
-    We cheat the process by simply grabbing all numeric values from the
-    content.  We do this since sniffwave output aren't constant table
-    like patterns are constant white space delimited (not a fan of the format).
+    Both line types are decoded by the precompiled LINE_PATTERN which
+    is anchored on the SCNL code.  Lines that do not match (header,
+    separator, truncated output) return None.
     '''
-    logging.info(f'Parsing line: {line}')
-    # standard line with latency check (most common)
-    if len(line) < 125:
-        logging.warning('sniffwave line does not contain the \
-minimum amount of 125 characters')
+    match = LINE_PATTERN.match(line)
+    if match is None:
+        logging.warning(f'Line could not be parsed: {line.rstrip()}')
         return None
+    return _from_match(match, datetime.datetime.now())
 
-    # line must start with SCNL pattern
-    if not re.match(r'^[A-Z0-9]+\.[A-Z0-9]+\.[A-Z0-9]+', line.lstrip()):
-        logging.warning('Line does not contain SCNL pattern')
-        return None
-    scnl = line[0:16].strip().split('.')
-    scnl_dict = {
-        'station': scnl[0],
-        'channel': scnl[1],
-        'network': scnl[2],
-        'location': '' if scnl[3] == '--' else scnl[3],
-    }
-
-    # get all numeric values from the line - SCNL pattern we don't care
-    numbers = re.findall(r"\d+\.\d+|\d+", line[33:])
-    if len(numbers) < 15:
-        logging.warning('Line does not contain the minimum amount of numbers')
-        return None
 
-    # these are special condition flags
-    if len(line) < 170:
-        return ChannelError(
-            **scnl_dict,
-            error=line[16:].lstrip().split(' ')[0],
-            start_time=datetime.datetime.fromtimestamp(float(numbers[7])),
-            end_time=datetime.datetime.fromtimestamp(float(numbers[-1])),
-            recorded_at=datetime.datetime.now(),
-        )
+def parse_many(
+    lines: Iterable[str],
+) -> List[Union[Channel, ChannelError]]:
+    '''
+    Parse a buffer of sniffwave lines.
 
-    return Channel(
-        **scnl_dict,
-        n_samples=int(numbers[0]),
-        sample_rate=float(numbers[1]),
-        start_time=datetime.datetime.fromtimestamp(float(numbers[8])),
-        n_bytes=int(numbers[-3]),
-        data_latency=float(numbers[-2]),
-        feeding_latency=float(numbers[-1]),
-        recorded_at=datetime.datetime.now(),
-    )
+    Same as :func:`parse` but the reception time is shared by every
+    line of the buffer and lines that can not be parsed are skipped.
+
+    :param lines: sniffwave lines
+    :rtype: [:class:`Channel` or :class:`ChannelError`, ...]
+    '''
+    recorded_at = datetime.datetime.now()
+    match = LINE_PATTERN.match
+    stats: List[Union[Channel, ChannelError]] = []
+    skipped = 0
+    for line in lines:
+        result = match(line)
+        if result is None:
+            skipped += 1
+            continue
+        stats.append(_from_match(result, recorded_at))
+    if skipped:
+        logging.warning(f'{skipped} line(s) could not be parsed')
+    return stats
@@ -0,0 +1,127 @@
+'''
+Parsing pool
+============
+
+Parse raw sniffwave chunks in a pool of processes so parsing scales
+across cores and the thread reading the pipe stays responsive.
+
+Chunks are submitted by the reader as bytes holding complete lines.  A
+collector thread waits on the results in submission order and hands
+each :class:`ColumnBatch` to a callback, so batches are published in
+the same order the lines were read.
+
+..  codeauthor:: Charles Blais
+'''
+import logging
+import multiprocessing
+import queue
+import signal
+import threading
+import time
+
+from typing import Callable, Optional
+
+from .columnar import ColumnBatch, ColumnParser
+
+# parser of each process of the pool, buffers are reused between chunks
+_parser: Optional[ColumnParser] = None
+
+
+def _init_process():
+    '''
+    Initialize the parser of the process.  Interruptions are handled by
+    the parent process.
+    '''
+    global _parser
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _parser = ColumnParser()
+
+
+def parse_chunk(
+    chunk: bytes,
+    source: Optional[str] = None,
+    recorded_at: Optional[float] = None,
+) -> ColumnBatch:
+    '''
+    Parse a chunk of complete sniffwave lines
+
+    :param bytes chunk: raw sniffwave output
+    :param str source: source of the lines (ex: ring name)
+    :param float recorded_at: epoch of reception of the chunk
+    :rtype: :class:`ColumnBatch`
+    '''
+    parser = ColumnParser() if _parser is None else _parser
+    return parser.parse(
+        chunk.decode('utf-8', errors='replace').splitlines(),
+        source,
+        recorded_at)
+
+
+class ParsePool(object):
+    '''
+    Pool of processes parsing raw chunks
+
+    :param callback: function receiving the parsed batches in order
+    :param int processes: amount of processes (default: cpu count)
+    :param int max_pending: maximum amount of chunks being parsed, the
+        reader blocks on :meth:`submit` beyond (default: 4 per process)
+    '''
+    def __init__(
+        self,
+        callback: Callable[[ColumnBatch], None],
+        processes: Optional[int] = None,
+        max_pending: Optional[int] = None,
+    ):
+        processes = processes or multiprocessing.cpu_count()
+        self.callback = callback
+        # spawn avoids forking the threads of the logger
+        self._pool = multiprocessing.get_context('spawn').Pool(
+            processes, initializer=_init_process)
+        self._pending: queue.Queue = queue.Queue(
+            maxsize=max_pending or processes * 4)
+        self._collector = threading.Thread(
+            target=self._collect, name='ParsePoolCollector', daemon=True)
+        self._collector.start()
+
+    def submit(
+        self,
+        chunk: bytes,
+        source: Optional[str] = None,
+    ) -> None:
+        '''
+        Submit a chunk of complete lines to parse
+
+        :param bytes chunk: raw sniffwave output
+        :param str source: source of the lines (ex: ring name)
+        '''
+        self._pending.put(self._pool.apply_async(
+            parse_chunk, (chunk, source, time.time())))
+
+    @property
+    def pending(self) -> int:
+        '''
+        Amount of chunks submitted but not yet handed to the callback
+        '''
+        return self._pending.qsize()
+
+    def _collect(self):
+        '''
+        Hand the results to the callback in submission order
+        '''
+        while True:
+            result = self._pending.get()
+            if result is None:
+                return
+            try:
+                self.callback(result.get())
+            except Exception:
+                logging.exception('Failed to parse sniffwave chunk')
+
+    def close(self):
+        '''
+        Wait for the pending chunks and stop the processes
+        '''
+        self._pending.put(None)
+        self._collector.join()
+        self._pool.close()
+        self._pool.join()
@@ -0,0 +1,78 @@
+'''
+Bulk reader
+===========
+
+Read the sniffwave output in large chunks instead of one line per call.
+
+A single reusable buffer is filled with ``readinto`` from the pipe, the
+chunk is split into complete lines and the partial line at the end of
+the chunk is carried over to the next read.
+
+..  codeauthor:: Charles Blais
+'''
+import io
+
+from typing import BinaryIO, List, Optional, Union
+
+DEFAULT_CHUNK_SIZE = 65536
+
+
+class ChunkReader(object):
+    '''
+    Read complete lines from a pipe in bulk
+
+    :param stream: stream or file descriptor of the pipe.  Streams
+        should be unbuffered (ex: Popen with bufsize=0) otherwise
+        content already buffered by the stream is skipped.
+    :param int chunk_size: size of the read buffer in bytes
+    '''
+    def __init__(
+        self,
+        stream: Union[BinaryIO, int],
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ):
+        fd = stream if isinstance(stream, int) else stream.fileno()
+        self._raw = io.FileIO(fd, mode='rb', closefd=False)
+        self._buffer = bytearray(chunk_size)
+        self._view = memoryview(self._buffer)
+        self._tail = b''
+
+    def fileno(self) -> int:
+        return self._raw.fileno()
+
+    def read_chunk(self) -> Optional[bytes]:
+        '''
+        Read the next chunk of the pipe.  Blocks until content is
+        available.
+
+        :rtype: bytes or None
+        :returns: complete lines of the chunk (can be empty if the chunk
+            did not complete a line) or None when the pipe is closed
+        '''
+        size = self._raw.readinto(self._view)
+        if not size:
+            return None
+        data = self._tail + self._view[:size]
+        end = data.rfind(b'\n') + 1
+        self._tail = data[end:]
+        return data[:end]
+
+    def read_lines(self) -> Optional[List[str]]:
+        '''
+        Read the next chunk of the pipe and split it in lines.
+
+        .. see:: :meth:`read_chunk`
+
+        :rtype: [str, ...] or None
+        '''
+        chunk = self.read_chunk()
+        if chunk is None:
+            return None
+        return chunk.decode('utf-8', errors='replace').splitlines()
+
+    def close(self):
+        '''
+        Release the buffer (the file descriptor is not closed)
+        '''
+        self._view.release()
+        self._raw.close()
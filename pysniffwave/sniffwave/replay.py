@@ -0,0 +1,253 @@
+'''
+Replay
+======
+
+Replay captured sniffwave output (ex: tests/sniffwave_output.txt) in
+place of the sniffwave program, so the logger and its workers can be
+exercised without an Earthworm ring.
+
+:class:`ReplayProcess` mimics the part of :class:`subprocess.Popen`
+used by :class:`pysniffwave.sniffwave.client.Sniffwave`: the captured
+lines are written by a feeder thread to a pipe read as ``stdout``.
+
+Packets are paced on their estimated arrival time (end time of the
+packet plus its data latency) divided by the rate multiplier, a rate of
+0 replaying as fast as the pipe is read.  When looping, the timestamps
+can be rewritten so each pass follows the previous one and the first
+packet arrives now.
+
+..  codeauthor:: Charles Blais
+'''
+import functools
+import io
+import logging
+import os
+import re
+import signal
+import subprocess
+import threading
+import time
+
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from .parser import LINE_PATTERN
+
+# date and epoch printed by sniffwave (ex: 2010/06/22 14:15:55.67
+# (1277216155.6650)), the date is in UTC
+TIME_PATTERN = re.compile(
+    rb'\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2}\.\d{2} \((?P<epoch>\d+\.\d+)\)')
+
+# end time and data latency of a standard line
+ARRIVAL_PATTERN = re.compile(
+    r'\(([\d.]+)\) 0x.*\[D:\s*(-?[\d.]+)s')
+
+
+@functools.lru_cache(maxsize=1024)
+def _format_second(second: int) -> str:
+    return time.strftime('%Y/%m/%d %H:%M:%S', time.gmtime(second))
+
+
+def format_time(epoch: float) -> str:
+    '''
+    Format an epoch the way sniffwave prints it
+
+    :param float epoch: epoch
+    :rtype: str
+    '''
+    # epsilon against the binary representation (ex: 55.665 -> 55.67)
+    centiseconds = int(epoch * 100 + 0.5 + 1e-6)
+    date = _format_second(centiseconds // 100)
+    return f'{date}.{centiseconds % 100:02d} ({epoch:.4f})'
+
+
+def rewrite_times(line: bytes, offset: float) -> bytes:
+    '''
+    Shift every date and epoch of the line
+
+    :param bytes line: sniffwave line
+    :param float offset: shift in seconds
+    :rtype: bytes
+    '''
+    return TIME_PATTERN.sub(
+        lambda match: format_time(
+            float(match['epoch']) + offset).encode(), line)
+
+
+def load_capture(paths: List[str]) -> List[Tuple[float, bytes]]:
+    '''
+    Load captured sniffwave output.  Lines not describing a packet
+    (headers) are skipped.
+
+    :param paths: captured files
+    :rtype: [(float, bytes), ...]
+    :returns: estimated arrival epoch and content of each line, the
+        arrival of a gap/overlap line is the one of the previous line
+    '''
+    lines: List[Tuple[float, bytes]] = []
+    arrival = None
+    for path in paths:
+        with open(path, 'rb') as fp:
+            for line in fp:
+                text = line.decode('utf-8', errors='replace')
+                if LINE_PATTERN.match(text) is None:
+                    continue
+                match = ARRIVAL_PATTERN.search(text)
+                if match is not None:
+                    estimate = float(match[1]) + float(match[2])
+                    # arrivals only move forward in a capture
+                    arrival = estimate if arrival is None \
+                        else max(arrival, estimate)
+                lines.append((arrival or 0.0, line.rstrip(b'\n') + b'\n'))
+    # error lines before the first standard line
+    first = next((at for at, _ in lines if at), 0.0)
+    return [(at or first, line) for at, line in lines]
+
+
+@dataclass
+class Replay:
+    '''
+    Replay configuration
+
+    Properties
+    ----------
+    paths: List[str]
+        Captured sniffwave output files, replayed in order
+
+    rate: float
+        Rate multiplier (1 real-time, 10 ten times faster, 0 as fast as
+        possible)
+
+    loops: int
+        Amount of passes over the capture (-1 for infinite)
+
+    rewrite_times: bool
+        Shift the timestamps so the first packet arrives now and each
+        pass follows the previous one
+    '''
+    paths: List[str] = field(default_factory=list)
+    rate: float = 1.0
+    loops: int = 1
+    rewrite_times: bool = False
+
+    def spawn(self) -> 'ReplayProcess':
+        '''
+        Start replaying
+
+        :rtype: :class:`ReplayProcess`
+        '''
+        return ReplayProcess(self)
+
+
+class ReplayProcess(object):
+    '''
+    Process like object replaying a capture, see :class:`Replay`
+
+    :param replay: replay configuration
+    '''
+    def __init__(self, replay: Replay):
+        self.replay = replay
+        # like Popen, the return code is only set by poll or wait
+        self.returncode: Optional[int] = None
+        self._exit_code = 0
+        self.args = replay.paths
+        self.pid = os.getpid()
+        self._lines = load_capture(replay.paths)
+        self._stop_event = threading.Event()
+        read_fd, self._write_fd = os.pipe()
+        self.stdout = open(read_fd, 'rb')
+        self.stderr = io.BytesIO()
+        self._feeder = threading.Thread(
+            target=self._feed, name='ReplayFeeder', daemon=True)
+        self._feeder.start()
+
+    def _feed(self) -> None:
+        '''
+        Write the captured lines to the pipe at the replay rate
+        '''
+        replay = self.replay
+        try:
+            if self._lines:
+                first = self._lines[0][0]
+                span = self._lines[-1][0] - first
+                # keep the average spacing between two passes
+                span += span / max(len(self._lines) - 1, 1)
+                started = time.monotonic()
+                offset = time.time() - first if replay.rewrite_times else 0.0
+                passes = 0
+                while replay.loops < 0 or passes < replay.loops:
+                    self._feed_pass(first, started, offset, passes * span)
+                    passes += 1
+                    if self._stop_event.is_set():
+                        break
+        except OSError as err:
+            # reader closed the pipe
+            logging.debug(f'Replay stopped: {err}')
+            if not self._exit_code:
+                self._exit_code = -signal.SIGPIPE
+        finally:
+            os.close(self._write_fd)
+
+    def _feed_pass(
+        self,
+        first: float,
+        started: float,
+        offset: float,
+        shift: float,
+    ) -> None:
+        '''
+        Write one pass over the capture
+
+        :param float first: arrival of the first line of the capture
+        :param float started: monotonic time of the start of the replay
+        :param float offset: shift of the timestamps to now
+        :param float shift: shift of the timestamps of the pass
+        '''
+        rate = self.replay.rate
+        rewrite = self.replay.rewrite_times
+        for arrival, line in self._lines:
+            if self._stop_event.is_set():
+                return
+            if rate > 0:
+                wait = started + (arrival + shift - first) / rate \
+                    - time.monotonic()
+                if wait > 0 and self._stop_event.wait(wait):
+                    return
+            if rewrite:
+                line = rewrite_times(line, offset + shift)
+            os.write(self._write_fd, line)
+
+    def poll(self) -> Optional[int]:
+        if not self._feeder.is_alive():
+            self.returncode = self._exit_code
+        return self.returncode
+
+    def wait(self, timeout: Optional[float] = None) -> int:
+        '''
+        Wait for the end of the replay
+
+        :raises subprocess.TimeoutExpired: replay still running
+        '''
+        self._feeder.join(timeout)
+        if self._feeder.is_alive():
+            raise subprocess.TimeoutExpired(self.args, timeout or 0)
+        self.returncode = self._exit_code
+        return self.returncode
+
+    def send_signal(self, signum: int) -> None:
+        '''
+        Stop the replay, the pipe is closed once the feeder stops
+        '''
+        if self._feeder.is_alive() and not self._exit_code:
+            self._exit_code = -signum
+        self._stop_event.set()
+
+    def terminate(self) -> None:
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self) -> None:
+        '''
+        Stop the replay and close the pipe to release a blocked feeder
+        '''
+        self.send_signal(signal.SIGKILL)
+        self.stdout.close()
@@ -0,0 +1,89 @@
+'''
+Sniffwave specifications
+========================
+
+A single logger can supervise several sniffwave invocations (ex: the
+WAVE_RING, an import ring and per-network filtered invocations).  Each
+invocation is described by a :class:`SniffwaveSpec`, the packets it
+produces being tagged with the source of the spec.
+
+..  codeauthor:: Charles Blais
+'''
+import shlex
+
+from dataclasses import dataclass
+from typing import List, Optional, Union
+
+
+@dataclass
+class SniffwaveSpec:
+    '''
+    Sniffwave invocation
+
+    Properties
+    ----------
+    cmd_args: str | List[str]
+        Command arguments sent to sniffwave (ex: "WAVE_RING")
+
+    source: str | None
+        Tag of the packets produced by the invocation (ex: the ring)
+    '''
+    cmd_args: Union[str, List[str]] = 'WAVE_RING'
+    source: Optional[str] = None
+
+    @property
+    def args(self) -> List[str]:
+        '''
+        Command arguments as a list
+        '''
+        return list(self.cmd_args) if isinstance(self.cmd_args, list) \
+            else shlex.split(self.cmd_args)
+
+    @property
+    def ring(self) -> str:
+        '''
+        Ring name (first command argument)
+        '''
+        args = self.args
+        return args[0] if args else ''
+
+    @classmethod
+    def from_string(cls, value: str) -> 'SniffwaveSpec':
+        '''
+        Decode a spec from the command line, the source can be prefixed
+        using "source=" (ex: "imports=IMPORT_RING IU wild wild wild").
+        Without prefix, the source is the ring name.
+
+        :param str value: spec
+        :rtype: :class:`SniffwaveSpec`
+        '''
+        source, sep, cmd_args = value.partition('=')
+        if not sep or ' ' in source:
+            spec = cls(cmd_args=value)
+            spec.source = spec.ring
+            return spec
+        return cls(cmd_args=cmd_args, source=source)
+
+
+def to_specs(
+    cmd_args: Union[str, List[str], List[SniffwaveSpec]]
+) -> List[SniffwaveSpec]:
+    '''
+    Normalize command arguments to a list of specs.
+
+    A string or a list of strings is a single invocation which packets
+    are not tagged.  When more than one spec is given, specs without a
+    source are tagged with their ring name.
+
+    :type cmd_args: str or [str,...] or [:class:`SniffwaveSpec`, ...]
+    :rtype: [:class:`SniffwaveSpec`, ...]
+    '''
+    if isinstance(cmd_args, str) or not all(
+            isinstance(spec, SniffwaveSpec) for spec in cmd_args):
+        return [SniffwaveSpec(cmd_args=cmd_args)]  # type: ignore[arg-type]
+    specs = [spec for spec in cmd_args if isinstance(spec, SniffwaveSpec)]
+    if len(specs) > 1:
+        for spec in specs:
+            if spec.source is None:
+                spec.source = spec.ring
+    return specs
@@ -0,0 +1,220 @@
+'''
+Synthetic
+=========
+
+Generate sniffwave output for a configurable amount of channels, so the
+logger and its workers can be benchmarked at scale without an Earthworm
+installation.
+
+Every channel sends a packet per packet length.  Channels are spread
+evenly on the packet length (random phase) and the lines are written in
+arrival order, paced by the rate multiplier (0 as fast as possible).
+Gap, overlap and out-of-order lines are injected at the error rate
+before the packet they affect, like sniffwave does.
+
+The generator is executed by the sniffwave_synthetic program which can
+stand in for sniffwave (see the program option of the logger).
+
+..  codeauthor:: Charles Blais
+'''
+import random
+import time
+
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional, TextIO, Tuple
+
+from .replay import format_time
+
+# components of each synthetic station
+CHANNEL_CODES = ['HNZ', 'HNN', 'HNE']
+
+ERROR_KINDS = ['gap', 'overlap', 'out-of-order']
+
+
+@dataclass
+class Synthetic:
+    '''
+    Synthetic output configuration
+
+    Properties
+    ----------
+    channels: int
+        Amount of channels (3 components per station)
+
+    sample_rates: List[float]
+        Sample rates (Hz) assigned to the stations in turn
+
+    packet_length: float
+        Duration (s) of a packet, thus the cadence of each channel
+
+    latency: float
+        Mean data latency (s)
+
+    latency_jitter: float
+        Standard deviation of the data latency (s)
+
+    feeding_latency: float
+        Feeding latency (s)
+
+    error_rate: float
+        Probability of a packet to be a gap, overlap or out-of-order
+
+    rate: float
+        Rate multiplier (1 real-time, 0 as fast as possible)
+
+    duration: float
+        Duration (s) of data generated (-1 for infinite)
+
+    seed: int | None
+        Seed of the random generator
+    '''
+    channels: int = 100
+    sample_rates: List[float] = field(default_factory=lambda: [100.0])
+    packet_length: float = 1.0
+    latency: float = 2.0
+    latency_jitter: float = 0.5
+    feeding_latency: float = 0.2
+    error_rate: float = 0.0
+    rate: float = 1.0
+    duration: float = -1
+    seed: Optional[int] = None
+
+
+def scnl_codes(count: int) -> List[str]:
+    '''
+    SCNL codes of the synthetic channels as printed by sniffwave
+
+    :param int count: amount of channels
+    :rtype: [str, ...]
+    '''
+    return [
+        f'S{index // len(CHANNEL_CODES):05d}.'
+        f'{CHANNEL_CODES[index % len(CHANNEL_CODES)]}.SY.--'
+        for index in range(count)
+    ]
+
+
+def format_packet(
+    scnl: str,
+    sample_rate: float,
+    n_samples: int,
+    start: float,
+    data_latency: float,
+    feeding_latency: float,
+) -> str:
+    '''
+    Format a standard sniffwave line
+
+    :rtype: str
+    '''
+    end = start + (n_samples - 1) / sample_rate
+    return f'{scnl:>15} (0x32 0x30) 0 s4 {n_samples:3d} {sample_rate:.1f} \
+{format_time(start)} {format_time(end)} 0x00 0x00 i73 m52 t19 \
+len{64 + 4 * n_samples:4d} \
+[D:{data_latency:4.1f}s F:{feeding_latency:4.1f}s]\n'
+
+
+def format_error(scnl: str, kind: str, start: float, end: float) -> str:
+    '''
+    Format a gap, overlap or out-of-order sniffwave line
+
+    :rtype: str
+    '''
+    return f'{scnl:>15} {kind:>8} of {end - start:6.2f}s        \
+{format_time(start)} {format_time(end)}\n'
+
+
+def generate(
+    config: Synthetic,
+    start: Optional[float] = None,
+) -> Iterator[Tuple[float, str]]:
+    '''
+    Generate the sniffwave lines in arrival order
+
+    :param config: synthetic output configuration
+    :param float start: epoch of the first packet (default: now)
+    :rtype: iterator of (float, str)
+    :returns: nominal arrival epoch and line
+    '''
+    rng = random.Random(config.seed)
+    start = time.time() if start is None else start
+    length = config.packet_length
+    codes = scnl_codes(config.channels)
+    rates = [
+        config.sample_rates[index // len(CHANNEL_CODES)
+                            % len(config.sample_rates)]
+        for index in range(config.channels)]
+    phases = sorted(
+        (rng.uniform(0, length), index) for index in range(config.channels))
+
+    packets = 0
+    while config.duration < 0 or packets * length < config.duration:
+        base = start + packets * length
+        for phase, index in phases:
+            scnl = codes[index]
+            sample_rate = rates[index]
+            packet_start = base + phase
+            arrival = packet_start + length + config.latency
+            n_samples = max(1, int(round(sample_rate * length)))
+
+            if config.error_rate and rng.random() < config.error_rate:
+                kind = rng.choice(ERROR_KINDS)
+                size = rng.uniform(1 / sample_rate, length / 2)
+                if kind == 'gap':
+                    error = (packet_start, packet_start + size)
+                    packet_start += size
+                    n_samples = max(
+                        1, n_samples - int(round(size * sample_rate)))
+                elif kind == 'overlap':
+                    error = (packet_start - size, packet_start)
+                    packet_start -= size
+                else:
+                    packet_start -= 2 * length
+                    error = (packet_start, packet_start + length)
+                yield arrival, format_error(scnl, kind, *error)
+
+            latency = max(
+                0.0, rng.gauss(config.latency, config.latency_jitter))
+            yield arrival, format_packet(
+                scnl, sample_rate, n_samples, packet_start,
+                latency, config.feeding_latency)
+        packets += 1
+
+
+def run(config: Synthetic, output: TextIO, flush_lines: int = 1024) -> int:
+    '''
+    Write the synthetic output paced at the rate of the configuration.
+    The first packets are generated in the past so lines are written
+    right away.
+
+    :param config: synthetic output configuration
+    :param output: stream to write to
+    :param int flush_lines: maximum amount of lines written at once
+    :rtype: int
+    :returns: amount of lines written
+    '''
+    origin = time.time()
+    start = origin - config.packet_length - config.latency
+    started = time.monotonic()
+    count = 0
+    lines: List[str] = []
+    for arrival, line in generate(config, start):
+        if config.rate > 0:
+            due = started + (arrival - origin) / config.rate
+            if due > time.monotonic():
+                # write what is due before waiting
+                output.write(''.join(lines))
+                output.flush()
+                lines.clear()
+                wait = due - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+        lines.append(line)
+        count += 1
+        if len(lines) >= flush_lines:
+            output.write(''.join(lines))
+            output.flush()
+            lines.clear()
+    output.write(''.join(lines))
+    output.flush()
+    return count
@@ -6,7 +6,7 @@ Database handle
 '''
 import os
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect
 from sqlalchemy.pool import SingletonThreadPool
 from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
@@ -34,3 +34,28 @@ def init_db():
     '''
     from . import models  # noqa: F401
     Base.metadata.create_all(bind=engine)
+    upgrade_db(bind=engine)
+
+
+def upgrade_db(bind=engine):
+    '''
+    Add the nullable columns missing from the existing tables
+
+    create_all does not alter the tables created by a previous version,
+    for example the source column of Channel and ChannelError.
+    '''
+    from . import models  # noqa: F401
+    inspector = inspect(bind)
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {
+                column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=bind.dialect)
+                conn.exec_driver_sql(
+                    f'ALTER TABLE "{table.name}" '
+                    f'ADD COLUMN "{column.name}" {column_type}')
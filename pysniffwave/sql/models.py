@@ -21,6 +21,7 @@ class Channel(Base):  # type: ignore
     n_bytes = Column(Integer, nullable=False)
     data_latency = Column(Float, nullable=False)
     feeding_latency = Column(Float, nullable=False)
+    source = Column(String(20), nullable=True)
 
 
 class ChannelError(Base):  # type: ignore
@@ -34,3 +35,4 @@ class ChannelError(Base):  # type: ignore
     error = Column(String(20), nullable=False)
     start_time = Column(DateTime, nullable=False)
     end_time = Column(DateTime, nullable=False)
+    source = Column(String(20), nullable=True)
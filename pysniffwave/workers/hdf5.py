@@ -2,90 +2,335 @@
 ..  codeauthor:: Charles Blais
 '''
 import logging
-from typing import Optional, List
+import queue
+from typing import Any, Dict, Optional, List
 import time
 import datetime
 
+import numpy as np
 import pandas as pd
 
-from pysniffwave.nagios.arrival_metrics import LatestArrivalWorker
+from pysniffwave.nagios.arrival_metrics import DEFAULT_ARRIVAL_FILE, \
+    DEFAULT_ARRIVAL_INTERVAL, LatestArrivalWorker
+from pysniffwave.nagios.latest_state import LatestStateWriter
 
 from .worker import Worker
 
 from pysniffwave.hdf5.client import Client
+from pysniffwave.hdf5.compaction import Compactor
+from pysniffwave.hdf5.compression import DEFAULT_PROFILE
+from pysniffwave.hdf5.rollup import MinuteRollup
+from pysniffwave.hdf5.sketches import HourlySketches
+from pysniffwave.hdf5.swmr import SWMRClient
+from pysniffwave.hdf5.writer import ProcessClient
 
 from pysniffwave.sniffwave.parser import Channel, ChannelError
+from pysniffwave.sniffwave.columnar import ColumnBatch, to_records
 
 # from pysniffwave.nagios.store import get_arrival_file, store_latest_timestamp
 
+# Channels tracked by the latest arrival object
+LATEST_ARRIVAL_CHANNELS = ['HNN', 'HNZ', 'HNE']
+
+DEFAULT_FLUSH_ROWS = 10000
+DEFAULT_FLUSH_DELAY = 5.0
+# maximum time (s) waiting for messages before checking for a stop request
+STOP_POLL = 1.0
+
+
+def _rows(item: Any) -> int:
+    '''
+    Amount of rows (packets) of a message
+    '''
+    return len(item) if isinstance(item, ColumnBatch) else 1
+
 
 class HDF5Worker(Worker):
     '''
     HDF5 worker
     ===========
+
+    Messages are written in batches, as soon as flush_rows rows are
+    pending or the oldest pending row was received flush_delay seconds
+    ago, whichever comes first.  The worker stops when no message is
+    received for its timeout.
+
+    With writer_process, the archive is written by a separate process
+    (see :mod:`pysniffwave.hdf5.writer`) and the worker only hands it
+    the batches.  With compact, the hourly files are compacted and
+    indexed once closed (see :mod:`pysniffwave.hdf5.compaction`).  With
+    rollup, per minute aggregates of the channels are written to daily
+    files (see :mod:`pysniffwave.hdf5.rollup`).  With sketches, hourly
+    latency quantile sketches of the channels are written to the same
+    daily files (see :mod:`pysniffwave.hdf5.sketches`).  With swmr, the
+    hourly files are written in SWMR mode with h5py so the current hour
+    can be read (see :mod:`pysniffwave.hdf5.swmr`).  With latest_state,
+    the latest state of every channel is published to a memory mapped
+    table (see :mod:`pysniffwave.nagios.latest_state`).
     '''
+    client: Optional[Any] = None
+    compactor: Optional[Compactor] = None
+    rollup: Optional[MinuteRollup] = None
+    sketches: Optional[HourlySketches] = None
+    latest_arrival: Optional[LatestArrivalWorker] = None
+    latest_state: Optional[LatestStateWriter] = None
+
     def __init__(
         self,
         *args,
         directory: Optional[str] = None,
+        flush_rows: int = DEFAULT_FLUSH_ROWS,
+        flush_delay: float = DEFAULT_FLUSH_DELAY,
+        writer_process: bool = False,
+        compression: str = DEFAULT_PROFILE,
+        compact: bool = False,
+        rollup: bool = False,
+        sketches: bool = False,
+        swmr: bool = False,
+        latest_state: Optional[str] = None,
+        arrival_file: Optional[str] = DEFAULT_ARRIVAL_FILE,
+        arrival_interval: float = DEFAULT_ARRIVAL_INTERVAL,
+        arrival_csv: Optional[str] = None,
         **kwargs,
     ):
         '''
         :param str directory: location where to store files
+        :param int flush_rows: rows pending that trigger a write
+        :param float flush_delay: maximum time (s) a row is pending
+        :param bool writer_process: write from a separate process
+        :param str compression: name of the compression profile
+        :param bool compact: compact the hourly files once closed
+        :param bool rollup: write the per minute rollups
+        :param bool sketches: write the hourly latency sketches
+        :param bool swmr: write the hourly files in SWMR mode
+        :param str latest_state: file of the latest state table
+        :param str arrival_file: file of the latest arrival statistics
+            (None to disable)
+        :param float arrival_interval: minimum time (s) between writes
+            of the arrival file
+        :param str arrival_csv: CSV export of the arrival file, when it
+            is a binary snapshot
         '''
         super().__init__(*args, **kwargs)
         self.directory = directory
+        self.flush_rows = flush_rows
+        self.flush_delay = flush_delay
+        self.writer_process = writer_process
+        self.compression = compression
+        self.compact = compact
+        self.with_rollup = rollup
+        self.with_sketches = sketches
+        self.swmr = swmr
+        self.state_path = latest_state
+        self.arrival_file = arrival_file
+        self.arrival_interval = arrival_interval
+        self.arrival_csv = arrival_csv
+        # engines processing messages by interval wait for the delay
+        self.interval = flush_delay
 
-    def run(self):
+    def setup(self) -> None:
         '''
-        SQLite thread start.  It will first initation the connection
+        Initialize the latest arrival object and the HDF5 client
         '''
+        # Initialize the latest arrival object, written at most every
+        # arrival interval
+        if self.arrival_file:
+            self.latest_arrival = LatestArrivalWorker(
+                filepath=self.arrival_file,
+                interval=self.arrival_interval,
+                csv_filepath=self.arrival_csv
+            )
 
-        # Initialize the latest arrival object to write every 10 changes
-        latest_arrival = LatestArrivalWorker(
-            filepath='/data/sniffwave/latest_arrival.csv',
-            changes=10
-        )
-        if self.queue is None:
-            raise ValueError('queue was not set in worker')
+        if self.state_path is not None:
+            self.latest_state = LatestStateWriter(self.state_path)
 
         # initialize client for HDF5 storage
-        client = Client(directory=self.directory)
+        self.client = self.create_client()
+
+        if self.with_rollup:
+            self.rollup = MinuteRollup(
+                directory=self.directory, compression=self.compression)
+        if self.with_sketches:
+            self.sketches = HourlySketches(
+                directory=self.directory, compression=self.compression)
+
+    def create_client(self) -> Any:
+        '''
+        Client of the archive, any object with the write, write_error and
+        close methods of :class:`pysniffwave.hdf5.client.Client`
+        '''
+        if self.swmr:
+            return SWMRClient(
+                directory=self.directory,
+                compression=self.compression)
+        if self.writer_process:
+            return ProcessClient(
+                directory=self.directory,
+                compression=self.compression,
+                compact=self.compact)
+        if self.compact:
+            self.compactor = Compactor(self.compression)
+        return Client(
+            directory=self.directory,
+            compression=self.compression,
+            on_close=None if self.compactor is None
+            else self.compactor.submit)
+
+    def process(self, items: List[Any]) -> None:
+        '''
+        Write the messages to the HDF5 archive
+        '''
+        if self.client is None:
+            raise ValueError('client was not set up in worker')
+
+        channel: List[Channel] = []
+        channel_errors: List[ChannelError] = []
+        batches: List[ColumnBatch] = []
+        for item in items:
+            if isinstance(item, ColumnBatch):
+                batches.append(item)
+                if self.latest_state is not None:
+                    self.latest_state.update(item.channels)
+                if self.latest_arrival is None:
+                    continue
+                # Add to the latest arrival object
+                latest = item.channels[np.isin(
+                    item.channels['channel'], LATEST_ARRIVAL_CHANNELS)]
+                if len(latest):
+                    self.latest_arrival.add_latest_timestamp([
+                        record for record in to_records(latest, item.source)
+                        if isinstance(record, Channel)])
+            elif isinstance(item, ChannelError):
+                channel_errors.append(item)
+            else:
+                channel.append(item)
+                if self.latest_state is not None:
+                    self.latest_state.update(item)
+                # Add to the latest arrival object
+                if self.latest_arrival is not None and \
+                        item['channel'] in LATEST_ARRIVAL_CHANNELS:
+                    self.latest_arrival.add_latest_timestamp(item)
 
-        # Ensure the latest_timestamp file exists
-        # if self.directory is not None:
-        #     arrival_file = get_arrival_file(directory=self.directory)
+        if len(channel):
+            df = pd.DataFrame(channel)
+            if self.rollup is not None:
+                self.rollup.update(df)
+            if self.sketches is not None:
+                self.sketches.update(df)
+            self.client.write(df, at=datetime.datetime.now())
+        if len(channel_errors):
+            self.client.write_error(
+                pd.DataFrame(channel_errors),
+                at=datetime.datetime.now())
+        # structured arrays are handed as is to the client, one write per
+        # source of packets
+        sources: Dict[Optional[str], List[ColumnBatch]] = {}
+        for batch in batches:
+            sources.setdefault(batch.source, []).append(batch)
+        for source, source_batches in sources.items():
+            batch = ColumnBatch.concatenate(source_batches)
+            if len(batch.channels):
+                if self.rollup is not None:
+                    self.rollup.update(batch.channels, source)
+                if self.sketches is not None:
+                    self.sketches.update(batch.channels, source)
+                self.client.write(
+                    batch.channels,
+                    at=datetime.datetime.now(),
+                    source=source)
+            if len(batch.errors):
+                self.client.write_error(
+                    batch.errors,
+                    at=datetime.datetime.now(),
+                    source=source)
+        if self.rollup is not None:
+            self.rollup.write()
+        if self.sketches is not None:
+            self.sketches.write()
+
+    def teardown(self) -> None:
+        '''
+        Ensure any open HDF5 files are closed (and the writer process
+        drained) before stopping
+        '''
+        if self.client is not None:
+            self.client.close()
+        if self.rollup is not None:
+            self.rollup.close()
+        if self.sketches is not None:
+            self.sketches.close()
+        if self.compactor is not None:
+            self.compactor.close()
+        if self.latest_state is not None:
+            self.latest_state.close()
+        # changes since the last write of the arrival file
+        if self.latest_arrival is not None:
+            self.latest_arrival.write_to_file()
+
+    def _flush(self, pending: List[Any], rows: int) -> None:
+        '''
+        Write the pending messages
+        '''
+        logging.info(f'Writing {rows} rows')
+        self.process(pending)
+        if isinstance(self.client, ProcessClient):
+            self.client.log_stats()
 
+    def run(self):
+        '''
+        HDF5 thread start.  It will first initialize the client
+        '''
+        if self.queue is None:
+            raise ValueError('queue was not set in worker')
+
+        self.setup()
+
+        pending: List[Any] = []
+        rows = 0
+        oldest = received = time.monotonic()
         while not self.is_stopped:
-            logging.debug(f'Sleeping for {self.timeout}s')
-            time.sleep(self.timeout)
-            qsize = self.queue.qsize()
+            if pending:
+                deadline = oldest + self.flush_delay
+            else:
+                deadline = received + self.timeout
+            wait = min(max(deadline - time.monotonic(), 0), STOP_POLL)
+            try:
+                # every message has at least one row
+                items = self.get_many(
+                    max_items=max(self.flush_rows - rows, 1), timeout=wait)
+            except queue.Empty:
+                items = []
 
-            if(qsize == 0):
+            now = time.monotonic()
+            if items:
+                if not pending:
+                    oldest = now
+                received = now
+                for item in items:
+                    # split the batches overflowing flush_rows, a burst
+                    # is written in writes of at most flush_rows
+                    while isinstance(item, ColumnBatch) and \
+                            rows + len(item) > self.flush_rows:
+                        head, item = item.split(self.flush_rows - rows)
+                        if len(head):
+                            pending.append(head)
+                        self._flush(pending, self.flush_rows)
+                        pending, rows, oldest = [], 0, now
+                    if not isinstance(item, ColumnBatch) or len(item):
+                        pending.append(item)
+                        rows += _rows(item)
+            elif not pending and now - received >= self.timeout:
                 logging.error('No message in queue for worker, stop')
                 break
 
-            channel: List[Channel] = []
-            channel_errors: List[ChannelError] = []
-            logging.info(f'Processing {qsize} in queue')
-            for _ in range(qsize - 1):
-                item = self.queue.get()
-                if isinstance(item, ChannelError):
-                    channel_errors.append(item)
-                else:
-                    channel.append(item)
-                    # Add to the latest arrival object
-                    if item['channel'] in ['HNN', 'HNZ', 'HNE']:
-                        latest_arrival.add_latest_timestamp(item)
-
-            if len(channel):
-                client.write(
-                    pd.DataFrame(channel),
-                    at=datetime.datetime.now())
-            if len(channel_errors):
-                client.write_error(
-                    pd.DataFrame(channel_errors),
-                    at=datetime.datetime.now())
-
-        # Ensure any open HDF5 files are closed before stopping
-        client.close()
+            if pending and (
+                    rows >= self.flush_rows
+                    or now - oldest >= self.flush_delay):
+                self._flush(pending, rows)
+                pending = []
+                rows = 0
+
+        if pending:
+            logging.info(f'Writing {rows} remaining rows')
+            self.process(pending)
+        self.teardown()
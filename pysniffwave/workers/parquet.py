@@ -0,0 +1,28 @@
+'''
+..  codeauthor:: Charles Blais
+'''
+from typing import Any
+
+from .hdf5 import HDF5Worker
+
+from pysniffwave.parquet.client import Client
+
+
+class ParquetWorker(HDF5Worker):
+    '''
+    Parquet worker
+    ==============
+
+    Same batching, latest arrival, rollups and sketches as the
+    :class:`HDF5Worker` but the channels and errors are written to the
+    parquet archive (see :mod:`pysniffwave.parquet.client`), one part
+    file per flush, so the current hour can be read.  The parts of an
+    hour are merged in a background process once it is over.  The
+    writer process, compression profiles and compaction of the HDF5
+    archive do not apply.
+    '''
+    def create_client(self) -> Any:
+        '''
+        Client of the parquet archive
+        '''
+        return Client(directory=self.directory)
@@ -4,6 +4,10 @@
 import logging
 import queue
 
+from typing import Any, List
+
+from pysniffwave.sniffwave.columnar import ColumnBatch
+
 from .worker import Worker
 
 
@@ -11,6 +15,17 @@ class PrintWorker(Worker):
     '''
     Standard print worker
     '''
+    def process(self, items: List[Any]) -> None:
+        '''
+        Print information to stdout
+        '''
+        for data in items:
+            if isinstance(data, ColumnBatch):
+                for record in data:
+                    print(record)
+            else:
+                print(data)
+
     def run(self):
         '''
         Print information to stdout
@@ -22,7 +37,7 @@ class PrintWorker(Worker):
             logging.debug('Waiting for message in queue')
             try:
                 data = self.queue.get(timeout=self.timeout)
-                print(data)
+                self.process([data])
             except queue.Empty:
                 logging.error('Worker timeout (no message), stop')
                 self.stop()
@@ -4,6 +4,10 @@
 import logging
 import queue
 
+from typing import Any, List, Optional
+
+from pysniffwave.sniffwave.columnar import ColumnBatch
+
 from .worker import Worker
 
 from pysniffwave.sql.client import Client
@@ -14,6 +18,27 @@ class SQLWorker(Worker):
     SQLite worker
     =============
     '''
+    client: Optional[Client] = None
+
+    def setup(self) -> None:
+        '''
+        Initialize the client connection
+        '''
+        self.client = Client()
+
+    def process(self, items: List[Any]) -> None:
+        '''
+        Insert messages in the database
+        '''
+        if self.client is None:
+            raise ValueError('client was not set up in worker')
+        for data in items:
+            if isinstance(data, ColumnBatch):
+                for record in data:
+                    self.client.insert(record)
+            else:
+                self.client.insert(data)
+
     def run(self):
         '''
         SQLite thread start.  It will first initation the connection
@@ -22,14 +47,14 @@ class SQLWorker(Worker):
             raise ValueError('queue was not set in worker')
 
         # initialize client connection
-        client = Client()
+        self.setup()
 
         while not self.is_stopped:
             logging.debug('Waiting for message in queue')
             try:
-                client.insert(
-                    self.queue.get(timeout=self.timeout)
-                )
+                data = self.queue.get(timeout=self.timeout)
             except queue.Empty:
                 logging.error('Worker timeout (no message), stop')
                 self.stop()
+                continue
+            self.process([data])
@@ -2,19 +2,34 @@
 ..  codeauthor:: Charles Blais
 '''
 
+from pysniffwave.queues import RingConsumer
 from pysniffwave.thread import StoppableThread
 import queue
 
-from typing import Optional
+from typing import Any, List, Optional, Union
+
+QueueLike = Union[queue.Queue, RingConsumer]
 
 
 class Worker(StoppableThread):
     '''
     Abstract for workers
+
+    Workers implement :meth:`process` which receives the messages taken
+    from the queue.  Resources used by :meth:`process` are opened in
+    :meth:`setup` and released in :meth:`teardown` so the same worker can
+    be driven by its own thread (:meth:`run`) or by another engine such
+    as :mod:`pysniffwave.sniffwave.aio`.
+
+    :param float interval: minimum time (s) between two calls of
+        :meth:`process`, messages received in between are processed
+        together (default: 0, as soon as received)
     '''
+    interval: float = 0
+
     def __init__(
         self,
-        queue: Optional[queue.Queue] = None,
+        queue: Optional[QueueLike] = None,
         timeout: float = 10,
         *args, **kwargs
     ):
@@ -22,8 +37,50 @@ class Worker(StoppableThread):
         self.queue = queue
         self.timeout = timeout
 
-    def set_queue(self, value: queue.Queue):
+    def set_queue(self, value: QueueLike):
         self.queue = value
 
     def set_timeout(self, value: float):
         self.timeout = value
+
+    def get_many(
+        self,
+        max_items: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ) -> List[Any]:
+        '''
+        Wait up to timeout for a message then take every message
+        available (up to max_items) in one call
+
+        :raises queue.Empty: no message received within the timeout
+        '''
+        if self.queue is None:
+            raise ValueError('queue was not set in worker')
+        if isinstance(self.queue, RingConsumer):
+            return self.queue.get_many(max_items, timeout=timeout)
+        items = [self.queue.get(timeout=timeout)]
+        while max_items is None or len(items) < max_items:
+            try:
+                items.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def setup(self) -> None:
+        '''
+        Open the resources required by the worker
+        '''
+
+    def process(self, items: List[Any]) -> None:
+        '''
+        Process messages received from the queue
+
+        :param items: messages (dictionary or
+            :class:`pysniffwave.sniffwave.columnar.ColumnBatch`)
+        '''
+        raise NotImplementedError()
+
+    def teardown(self) -> None:
+        '''
+        Release the resources of the worker
+        '''
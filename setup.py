@@ -124,7 +124,7 @@ setup(
     #
     #   py_modules=["my_module"],
     #
-    packages=find_packages(exclude=['contrib', 'docs', 'tests']),  # Required
+    packages=find_packages(exclude=['benchmarks', 'contrib', 'docs', 'tests']),  # Required
 
     # This field lists other packages that your project depends on to run.
     # Any package you put here will be installed by pip when your project is
@@ -155,6 +155,9 @@ setup(
             'flake8',
             'pytest-cov'
         ],
+        'parquet': [
+            'pyarrow',
+        ],
     },
 
     # If there are data files included in your packages that need to be
@@ -181,7 +184,10 @@ setup(
     entry_points={  # Optional
         'console_scripts': [
             'sniffwave_logger=pysniffwave.bin.sniffwave_logger:main',
-            'check_arrival_metrics=pysniffwave.bin.check_arrival_metrics:main'
+            'check_arrival_metrics=pysniffwave.bin.check_arrival_metrics:main',
+            'sniffwave_synthetic=pysniffwave.bin.sniffwave_synthetic:main',
+            'sniffwave_compression=pysniffwave.bin.sniffwave_compression:main',
+            'sniffwave_query=pysniffwave.bin.sniffwave_query:main',
         ],
     },
 
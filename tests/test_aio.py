@@ -0,0 +1,87 @@
+import asyncio
+import os
+from typing import Any, List
+
+import pytest
+
+import pysniffwave.sniffwave.aio as sniffwave_aio
+from pysniffwave.sniffwave.columnar import ColumnBatch
+from pysniffwave.sniffwave.spec import SniffwaveSpec, to_specs
+from pysniffwave.workers.worker import Worker
+
+
+class CollectWorker(Worker):
+    '''
+    Keep every message received
+    '''
+    def setup(self):
+        self.items: List[Any] = []
+        self.closed = False
+
+    def process(self, items):
+        self.items.extend(items)
+
+    def teardown(self):
+        self.closed = True
+
+
+@pytest.fixture
+def fake_sniffwave(tmp_path, monkeypatch):
+    '''
+    Fake sniffwave program printing the sample output
+    '''
+    program = tmp_path.joinpath('sniffwave')
+    program.write_text(
+        f'#!/bin/sh\ncat {os.path.abspath("tests/sniffwave_output.txt")}\n'
+        'exec sleep ${SNIFFWAVE_SLEEP:-0}\n')
+    program.chmod(0o755)
+    monkeypatch.setenv('PATH', f'{tmp_path}{os.pathsep}{os.environ["PATH"]}')
+
+
+def test_start_batches(fake_sniffwave):
+    '''
+    Test the asyncio engine stops once sniffwave exits
+    '''
+    myworkers = [CollectWorker(timeout=5), CollectWorker(timeout=5)]
+    sniffwave_aio.start(myworkers, chunk_size=1024)
+    for myworker in myworkers:
+        assert myworker.closed
+        assert all(isinstance(item, ColumnBatch) for item in myworker.items)
+        assert sum(len(item) for item in myworker.items) == 23
+
+
+def test_start_lines(fake_sniffwave):
+    '''
+    Test the line reader and the maximum of lines
+    '''
+    myworker = CollectWorker(timeout=5)
+    sniffwave_aio.start(myworker, max_lines=10, chunk_size=None)
+    assert len(myworker.items) == 10
+    assert all(isinstance(item, dict) for item in myworker.items)
+
+
+def test_supervise_specs(fake_sniffwave, monkeypatch):
+    '''
+    Test multiple sniffwave specs feeding the same worker
+    '''
+    monkeypatch.setenv('SNIFFWAVE_SLEEP', '5')
+    myworker = CollectWorker(timeout=5)
+
+    async def main():
+        sniffwaves = [
+            sniffwave_aio.AsyncSniffwave(
+                cmd_args=spec.args,
+                source=spec.source,
+                chunk_size=None)
+            for spec in to_specs([
+                SniffwaveSpec('WAVE_RING'),
+                SniffwaveSpec.from_string('imports=IMPORT_RING IU'),
+            ])]
+        # stopping any of the instances stops all of them
+        asyncio.get_running_loop().call_later(1, sniffwaves[0].stop)
+        await sniffwave_aio.supervise([myworker], sniffwaves)
+
+    asyncio.run(main())
+    sources = [item['source'] for item in myworker.items]
+    assert sources.count('WAVE_RING') == 23
+    assert sources.count('imports') == 23
@@ -1,9 +1,14 @@
 from datetime import datetime
 import pathlib
-from pysniffwave.nagios.arrival_metrics import LatestArrivalWorker
+import time
+from pysniffwave.nagios.arrival_metrics import SNAPSHOT_MAGIC, \
+    ArrivalStat, LatestArrivalWorker
 from pysniffwave.nagios.check_arrival import ArrivalThresholds, \
     check_fresh_arrival, check_timely_arrival, get_arrival_results
+from pysniffwave.nagios.latest_state import LatestStateReader, \
+    LatestStateWriter, load_arrival_stats
 from pysniffwave.nagios.models import NagiosOutputCode
+from pysniffwave.sniffwave.columnar import ColumnParser
 from pysniffwave.sniffwave.parser import Channel, parse
 from typing import List
 import pytest
@@ -180,3 +185,153 @@ def test_arrival_results(worker: LatestArrivalWorker):
     )
 
     assert results.status.value == 1
+
+
+def test_latest_state(tmp_path):
+    '''
+    Test the latest state table is published and read back, including
+    after reopening it
+    '''
+    with open('tests/sniffwave_output.txt') as sniff_file:
+        lines = sniff_file.readlines()
+    parser = ColumnParser()
+    path = tmp_path / 'latest_state'
+    writer = LatestStateWriter(path, capacity=64)
+    first = parser.parse(lines, recorded_at=1277215800.0).channels
+    assert writer.update(first) == len(writer.index)
+    writer.update(parser.parse(lines, recorded_at=1277215810.0).channels)
+
+    reader = LatestStateReader(path)
+    slots = reader.read()
+    assert len(slots) == len(writer.index)
+    assert (slots['sequence'] % 2 == 0).all()
+    assert (slots['recorded_at'] == 1277215810.0).all()
+    scnl = slots['scnl'][0].decode()
+    assert reader.get(scnl)['packets'] >= 2
+    assert reader.get('XX.NONE..HHZ') is None
+    reader.close()
+    writer.close()
+
+    # state survives reopening the table
+    writer = LatestStateWriter(path, capacity=64)
+    assert len(writer.index) == len(slots)
+    channels: List[Channel] = [
+        channel for channel in map(parse, lines)
+        if isinstance(channel, Channel)]
+    writer.update(channels)
+    arrival_stats = load_arrival_stats(path)
+    assert set(arrival_stats) == set(writer.index)
+    assert arrival_stats['MN.TIP..HHZ'].total_latency() == \
+        pytest.approx(6.4, abs=1e-5)
+
+
+def test_latest_state_close(tmp_path):
+    '''
+    Test the latest state table can be closed twice
+    '''
+    path = tmp_path / 'latest_state'
+    writer = LatestStateWriter(path, capacity=8)
+    reader = LatestStateReader(path)
+    for _ in range(2):
+        reader.close()
+        writer.close()
+    assert not hasattr(reader, 'slots')
+    assert not hasattr(writer, 'slots')
+
+
+def test_arrival_interval(tmp_path):
+    '''
+    Test the arrival file is written by interval, only when channels
+    changed and replaced atomically
+    '''
+    path = tmp_path / 'latest_arrival.csv'
+    arrival_worker = LatestArrivalWorker(path, interval=3600)
+    with open('tests/sniffwave_output.txt') as sniff_file:
+        channels = [
+            channel for channel in map(parse, sniff_file.readlines())
+            if isinstance(channel, Channel)]
+    arrival_worker.add_latest_timestamp(channels)
+    # interval not elapsed
+    assert path.read_text() == ''
+    assert arrival_worker.dirty
+
+    arrival_worker.write_to_file()
+    assert not arrival_worker.dirty
+    assert len(path.read_text().splitlines()) == len(arrival_worker)
+    assert list(tmp_path.iterdir()) == [path]
+    inode = path.stat().st_ino
+    # nothing changed, nothing written
+    arrival_worker.write_to_file()
+    assert path.stat().st_ino == inode
+
+    arrival_worker.interval = 0
+    arrival_worker.add_latest_timestamp(channels[0])
+    assert path.stat().st_ino != inode
+    reloaded = LatestArrivalWorker(path, interval=0)
+    assert not reloaded.dirty
+    assert set(reloaded) == set(arrival_worker)
+    assert reloaded[channels[0]['network'] + '.' + channels[0]['station']
+                    + '.' + channels[0]['location'] + '.'
+                    + channels[0]['channel']].start_time == \
+        channels[0]['start_time']
+
+
+def test_arrival_snapshot(tmp_path, worker: LatestArrivalWorker):
+    '''
+    Test the binary snapshot is written with its CSV export and loaded
+    back with the same statistics
+    '''
+    path = tmp_path / 'latest_arrival.bin'
+    csv_path = tmp_path / 'latest_arrival.csv'
+    snapshot = LatestArrivalWorker(path, csv_filepath=csv_path)
+    assert snapshot.binary
+    assert len(snapshot) == 0
+    for stat in worker.values():
+        snapshot[stat.channel] = stat
+    snapshot.write_to_file()
+    assert path.read_bytes().startswith(SNAPSHOT_MAGIC)
+    assert sorted(tmp_path.iterdir()) == [path, csv_path]
+
+    loaded = LatestArrivalWorker(path, changes=-1)
+    assert not loaded.dirty
+    assert list(loaded) == list(worker)
+    for channel, stat in worker.items():
+        assert loaded[channel].start_time == stat.start_time
+        assert loaded[channel].data_latency == stat.data_latency
+        assert loaded[channel].feeding_latency == stat.feeding_latency
+    assert str(loaded['CH.MUGIO..HHN']) == str(worker['CH.MUGIO..HHN'])
+
+    # the export is the CSV arrival file
+    exported = LatestArrivalWorker(csv_path, changes=-1)
+    assert not exported.binary
+    assert exported == loaded
+    assert csv_path.read_text() == loaded.to_csv()
+
+
+def test_arrival_snapshot_timezone(tmp_path, monkeypatch):
+    '''
+    Test the snapshot times round trip in a local time zone with
+    daylight saving, including the hour skipped when it starts
+    '''
+    monkeypatch.setenv('TZ', 'America/Toronto')
+    time.tzset()
+    try:
+        path = tmp_path / 'latest_arrival.bin'
+        csv_path = tmp_path / 'latest_arrival.csv'
+        snapshot = LatestArrivalWorker(path, csv_filepath=csv_path)
+        for stat in [
+            ArrivalStat(
+                'XX.GAP..HHZ', datetime(2024, 3, 10, 2, 30, 0, 500000),
+                1.5, 0.5),
+            ArrivalStat(
+                'XX.FOLD..HHZ', datetime(2024, 11, 3, 1, 30), 2.0, 0.25),
+        ]:
+            snapshot[stat.channel] = stat
+        snapshot.write_to_file()
+
+        loaded = LatestArrivalWorker(path, changes=-1)
+        assert loaded == snapshot
+        assert LatestArrivalWorker(csv_path, changes=-1) == loaded
+    finally:
+        monkeypatch.undo()
+        time.tzset()
@@ -0,0 +1,42 @@
+from benchmarks.suite import make_dataset, run
+
+
+def test_make_dataset(tmp_path):
+    '''
+    Test the synthetic dataset has one packet per channel and round
+    '''
+    dataset = make_dataset(30, 4, tmp_path, error_rate=0)
+    assert len(dataset.lines) == 4
+    assert all(len(lines) == 30 for lines in dataset.lines)
+    batches = dataset.batches()
+    assert sum(len(batch.channels) for batch in batches) == 120
+    assert batches[1].channels['recorded_at'][0] == \
+        batches[0].channels['recorded_at'][0] + 1
+
+
+def test_run(tmp_path):
+    '''
+    Test the results of the benchmarks on a small dataset
+    '''
+    results = run(
+        [30], rounds=2,
+        paths=['parse', 'hdf5', 'latest_arrival', 'check_arrival', 'sql'],
+        directory=tmp_path)
+    paths = [result['path'] for result in results['results']]
+    assert paths[:2] == ['parse', 'parse']
+    assert paths[-4:] == [
+        'latest_arrival', 'check_arrival', 'check_arrival', 'sql']
+    assert set(paths[2:-4]) == {'hdf5'}
+    assert all(result['channels'] == 30 for result in results['results'])
+    hdf5 = [result for result in results['results']
+            if result['path'] == 'hdf5']
+    assert all(result['rows'] == 60 for result in hdf5)
+    assert results['results'][-4]['rows'] == 60
+
+    checks = results['results'][-3:-1]
+    assert [check['format'] for check in checks] == ['csv', 'binary']
+    for check in checks:
+        assert check['rows'] == 30
+        # a Nagios status, the check did not crash
+        assert check['exit_code'] in (0, 1, 2)
+        assert 0 < check['peak_rss_bytes'] < 200 * 1024 * 1024
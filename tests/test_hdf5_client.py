@@ -0,0 +1,388 @@
+import concurrent.futures
+import datetime
+import multiprocessing
+import os
+import threading
+
+import pandas as pd
+import pytest
+
+from pysniffwave.hdf5.aggregate import ChannelAggregator
+from pysniffwave.hdf5.client import Client
+from pysniffwave.hdf5.compaction import compact
+from pysniffwave.hdf5.rollup import MinuteRollup
+from pysniffwave.hdf5.compression import measure, synthetic_hour
+from pysniffwave.hdf5.query import Query
+from pysniffwave.hdf5.sketches import HourlySketches, SketchMerger
+from pysniffwave.hdf5.swmr import SWMRClient, SWMRReader, read
+from pysniffwave.hdf5.writer import ProcessClient
+from pysniffwave.sketch import QuantileSketch
+from pysniffwave.sniffwave.columnar import ColumnParser, to_records
+
+
+def test_client_write_columns(tmp_path):
+    '''
+    Test writing structured arrays of the columnar parser
+    '''
+    with open('tests/sniffwave_output.txt', 'r') as fp:
+        batch = ColumnParser().parse(fp.readlines())
+
+    at = datetime.datetime(2010, 6, 22, 14)
+    client = Client(directory=tmp_path)
+    client.write(batch.channels, at=at)
+    client.write_error(batch.errors, at=at)
+    client.close()
+
+    filename = client.get_filename(at)
+    channels = pd.read_hdf(filename, 'channels')
+    errors = pd.read_hdf(filename, 'errors')
+    assert len(channels) == 19
+    assert len(errors) == 4
+    assert channels['n_samples'].dtype == 'uint16'
+    assert errors['error'].iloc[0] == 'overlap'
+
+
+def test_client_write_times(tmp_path):
+    '''
+    Test the times of structured arrays are read back unchanged
+    '''
+    with open('tests/sniffwave_output.txt', 'r') as fp:
+        lines = fp.readlines()
+    at = datetime.datetime(2010, 6, 22, 14)
+    batch = ColumnParser().parse(lines, recorded_at=at.timestamp())
+    client = Client(directory=tmp_path)
+    client.write(batch.channels, at=at)
+    client.write_error(batch.errors, at=at)
+    client.close()
+
+    filename = client.get_filename(at)
+    channels = pd.read_hdf(filename, 'channels')
+    assert (channels['recorded_at'] == pd.Timestamp(at)).all()
+    assert channels['start_time'].tolist() == [
+        channel['start_time'] for channel in to_records(batch.channels)]
+    errors = pd.read_hdf(filename, 'errors')
+    assert errors['end_time'].tolist() == [
+        error['end_time'] for error in to_records(batch.errors)]
+
+
+def test_client_write_source(tmp_path):
+    '''
+    Test writing packets tagged with their source
+    '''
+    with open('tests/sniffwave_output.txt', 'r') as fp:
+        batch = ColumnParser().parse(fp.readlines(), source='WAVE_RING')
+
+    at = datetime.datetime(2010, 6, 22, 14)
+    client = Client(directory=tmp_path)
+    client.write(batch.channels, at=at, source=batch.source)
+    client.close()
+
+    channels = pd.read_hdf(client.get_filename(at), 'channels')
+    assert (channels['source'] == 'WAVE_RING').all()
+
+
+def test_process_client(tmp_path):
+    '''
+    Test writing from the writer process, drained on close
+    '''
+    with open('tests/sniffwave_output.txt', 'r') as fp:
+        batch = ColumnParser().parse(fp.readlines())
+
+    at = datetime.datetime(2010, 6, 22, 14)
+    client = ProcessClient(directory=tmp_path)
+    for _ in range(3):
+        client.write(batch.channels, at=at)
+    client.write_error(batch.errors, at=at)
+    client.close()
+    assert client.backlog == 0
+    assert client.stats()['sent'] == 4
+
+    filename = Client(directory=tmp_path).get_filename(at)
+    assert len(pd.read_hdf(filename, 'channels')) == 3 * 19
+    assert len(pd.read_hdf(filename, 'errors')) == 4
+
+
+def test_process_client_stopped(tmp_path):
+    '''
+    Test writing while the backlog is full raises once the writer
+    process stopped instead of blocking
+    '''
+    with open('tests/sniffwave_output.txt', 'r') as fp:
+        batch = ColumnParser().parse(fp.readlines())
+
+    at = datetime.datetime(2010, 6, 22, 14)
+    client = ProcessClient(directory=tmp_path, max_backlog=1)
+    # the writer process ignores SIGTERM
+    threading.Timer(0.5, client._process.kill).start()
+    with pytest.raises(RuntimeError):
+        while True:
+            client.write(batch.channels, at=at)
+    client.close()
+
+
+def test_compression_profiles(tmp_path):
+    '''
+    Test measuring the compression profiles on synthetic data
+    '''
+    batches = synthetic_hour(channels=30, duration=60)
+    results = measure(batches, ['none', 'zlib-9', 'blosc-zstd'], tmp_path)
+    assert [result['profile'] for result in results] == \
+        ['none', 'zlib-9', 'blosc-zstd']
+    assert all(result['rows'] >= 30 * 60 for result in results)
+    assert results[1]['bytes_per_row'] < results[0]['bytes_per_row']
+
+
+def test_compact(tmp_path):
+    '''
+    Test compacting an hourly file sorts and indexes the tables
+    '''
+    with open('tests/sniffwave_output.txt', 'r') as fp:
+        batch = ColumnParser().parse(fp.readlines())
+
+    at = datetime.datetime(2010, 6, 22, 14)
+    closed = []
+    client = Client(directory=tmp_path, on_close=closed.append)
+    for _ in range(3):
+        client.write(batch.channels, at=at)
+    client.write_error(batch.errors, at=at)
+    client.close()
+    filename = client.get_filename(at)
+    # the hour is over, the file is handed for compaction
+    assert closed == [filename]
+
+    compact(filename)
+    with pd.HDFStore(filename, mode='r') as store:
+        table = store.get_storer('channels').table
+        assert table.colindexes['station'].is_csi
+        assert table.colindexes['recorded_at'].is_csi
+        station = store.select(
+            'channels', where='station == "{}"'.format(
+                batch.channels['station'][0]))
+    assert len(station) == 3 * (
+        batch.channels['station'] == batch.channels['station'][0]).sum()
+    assert len(pd.read_hdf(filename, 'errors')) == 4
+    assert list(tmp_path.rglob('.*.compact')) == []
+
+
+def test_client_find(tmp_path):
+    '''
+    Test querying the archive with codes, wildcards and projection
+    '''
+    with open('tests/sniffwave_output.txt', 'r') as fp:
+        lines = fp.readlines()
+    parser = ColumnParser()
+    start = datetime.datetime(2010, 6, 22, 14)
+    client = Client(directory=tmp_path)
+    for hour in range(3):
+        at = start + datetime.timedelta(hours=hour)
+        batch = parser.parse(lines, recorded_at=at.timestamp())
+        client.write(batch.channels, at=at)
+        client.write_error(batch.errors, at=at)
+    client.close()
+
+    reader = Client(directory=tmp_path)
+    channels = reader.find(start, start + datetime.timedelta(hours=2))
+    assert len(channels) == 2 * 19
+    assert reader.find(start, start + datetime.timedelta(hours=3),
+                       processes=0).equals(
+        reader.find(start, start + datetime.timedelta(hours=3),
+                    processes=2))
+
+    station = channels['station'].iloc[0]
+    found = reader.find(
+        start, start + datetime.timedelta(hours=3),
+        station=station, channel='H?Z,H?N',
+        columns=['recorded_at', 'station', 'channel'])
+    assert list(found.columns) == ['recorded_at', 'station', 'channel']
+    assert (found['station'] == station).all()
+    assert found['channel'].str.match('^H.[ZN]$').all()
+
+    errors = reader.find_error(start, start + datetime.timedelta(hours=1))
+    assert len(errors) == 4
+    frames = list(reader.iter_find(
+        start, start + datetime.timedelta(hours=3), processes=0))
+    assert [len(frame) for frame in frames] == [19, 19, 19]
+
+
+def test_client_aggregate(tmp_path):
+    '''
+    Test the statistics per channel over chunks of the archive
+    '''
+    with open('tests/sniffwave_output.txt', 'r') as fp:
+        lines = fp.readlines()
+    parser = ColumnParser()
+    start = datetime.datetime(2010, 6, 22, 14)
+    client = Client(directory=tmp_path)
+    for hour in range(3):
+        at = start + datetime.timedelta(hours=hour)
+        batch = parser.parse(lines, recorded_at=at.timestamp())
+        client.write(batch.channels, at=at)
+    client.close()
+
+    reader = Client(directory=tmp_path)
+    end = start + datetime.timedelta(hours=3)
+    chunks = list(reader.iter_find(start, end, chunksize=7))
+    assert max(len(chunk) for chunk in chunks) <= 7
+    assert sum(len(chunk) for chunk in chunks) == 3 * 19
+
+    aggregator = ChannelAggregator('data_latency', quantiles=[0.5, 1])
+    result = aggregator.consume(
+        reader.iter_find(start, end, chunksize=7)).result()
+    channels = reader.find(start, end)
+    channels['scnl'] = channels['network'].str.cat(
+        [channels['station'], channels['location'], channels['channel']],
+        sep='.')
+    expected = channels.groupby('scnl')['data_latency'].agg(
+        ['count', 'mean', 'max'])
+    assert (result['count'] == expected['count']).all()
+    assert ((result['mean'] - expected['mean']).abs() < 1e-6).all()
+    assert (result['max'] == expected['max']).all()
+    # quantiles within the relative accuracy of the sketch
+    assert ((result['p100'] - expected['max']).abs()
+            <= 0.01 * expected['max'] + 1e-3).all()
+
+
+def test_rollup(tmp_path):
+    '''
+    Test the per minute rollups are written once the minute is over
+    '''
+    with open('tests/sniffwave_output.txt', 'r') as fp:
+        lines = fp.readlines()
+    parser = ColumnParser()
+    start = datetime.datetime(2010, 6, 22, 14)
+    rollup = MinuteRollup(directory=tmp_path, grace=10)
+    for seconds in (0, 30, 60):
+        at = start + datetime.timedelta(seconds=seconds)
+        rollup.update(parser.parse(lines, recorded_at=at.timestamp()).channels)
+    # first minute is not over by the grace period
+    assert rollup.write() == 0
+    rollup.update(parser.parse(lines, recorded_at=(
+        start + datetime.timedelta(seconds=75)).timestamp()).channels)
+    channels = parser.parse(lines).channels
+    count = len(set(zip(
+        channels['network'], channels['station'],
+        channels['location'], channels['channel'])))
+    assert rollup.write() == count
+    assert rollup.pending == count
+    rollup.close()
+    assert rollup.pending == 0
+
+    found = Client(directory=tmp_path).find_rollup(
+        start, start + datetime.timedelta(hours=1))
+    assert len(found) == 2 * count
+    first = found[found['minute'] == pd.Timestamp(start)]
+    assert first['packets'].sum() == 2 * len(channels)
+    assert first['n_samples'].sum() == 2 * channels['n_samples'].sum()
+    assert (first['data_latency_min'] <= first['data_latency_mean']).all()
+    assert (first['data_latency_mean'] <= first['data_latency_max']).all()
+
+
+def test_sketches(tmp_path):
+    '''
+    Test the hourly latency sketches are written once the hour is over
+    and merged by network
+    '''
+    with open('tests/sniffwave_output.txt', 'r') as fp:
+        lines = fp.readlines()
+    parser = ColumnParser()
+    start = datetime.datetime(2010, 6, 22, 14)
+    sketches = HourlySketches(directory=tmp_path, grace=10)
+    for seconds in (0, 1800, 3600):
+        at = start + datetime.timedelta(seconds=seconds)
+        sketches.update(
+            parser.parse(lines, recorded_at=at.timestamp()).channels)
+    # first hour is not over by the grace period
+    assert sketches.write() == 0
+    sketches.update(parser.parse(lines, recorded_at=(
+        start + datetime.timedelta(seconds=3615)).timestamp()).channels)
+    assert sketches.write() > 0
+    sketches.close()
+    assert sketches.pending == 0
+
+    channels = parser.parse(lines).channels
+    found = Client(directory=tmp_path).find_sketches(
+        start, start + datetime.timedelta(hours=2))
+    assert set(found['hour']) == {
+        pd.Timestamp(start), pd.Timestamp(start) + pd.Timedelta(hours=1)}
+
+    merger = SketchMerger('feeding_latency', by=['network'])
+    merger.update(found)
+    expected = QuantileSketch()
+    for _ in range(4):
+        expected.add(channels['feeding_latency'])
+    merged = merger.sketches()
+    assert sum(sketch.count for sketch in merged.values()) == expected.count
+    assert SketchMerger('feeding_latency', by=[]).consume(
+        [found]).sketches()[''].quantile(0.99) == expected.quantile(0.99)
+    assert list(merger.result().columns) == ['count', 'p50', 'p95', 'p99']
+
+
+def _read_live(filename):
+    with SWMRReader(filename) as reader:
+        return len(reader.read_new()), len(reader.read_new('errors'))
+
+
+def test_swmr(tmp_path):
+    '''
+    Test the hour being written in SWMR mode is read by another process
+    '''
+    with open('tests/sniffwave_output.txt', 'r') as fp:
+        lines = fp.readlines()
+    start = datetime.datetime(2010, 6, 22, 14)
+    batch = ColumnParser().parse(lines, recorded_at=start.timestamp())
+    client = SWMRClient(directory=tmp_path)
+    client.write(batch.channels, at=start)
+    client.write(pd.DataFrame(to_records(batch.channels)), at=start)
+    client.write_error(batch.errors, at=start, source='imports')
+    filename = client.get_filename(start)
+
+    with concurrent.futures.ProcessPoolExecutor(
+            1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        assert executor.submit(_read_live, filename).result() == (
+            2 * len(batch.channels), len(batch.errors))
+        client.write(batch.channels, at=start)
+        assert executor.submit(_read_live, filename).result()[0] == \
+            3 * len(batch.channels)
+
+    station = batch.channels['station'][0]
+    found = read(tmp_path, Query(
+        start, start + datetime.timedelta(hours=1), station=station))
+    assert len(found) == 3 * (batch.channels['station'] == station).sum()
+    assert (found['recorded_at'] == pd.Timestamp(start)).all()
+    errors = read(tmp_path, Query(
+        start, start + datetime.timedelta(hours=1), table='errors'))
+    assert set(errors['source']) == {'imports'}
+    client.close()
+
+
+def _abandon_writer(directory, at):
+    with open('tests/sniffwave_output.txt', 'r') as fp:
+        batch = ColumnParser().parse(
+            fp.readlines(), recorded_at=at.timestamp())
+    client = SWMRClient(directory=directory)
+    client.write(batch.channels, at=at)
+    # exit without closing the file, as a crash would
+    os._exit(0)
+
+
+def test_swmr_abandoned(tmp_path):
+    '''
+    Test a writer restarted after a crash within the hour rolls over to
+    the next part of the hour and the parts are read
+    '''
+    with open('tests/sniffwave_output.txt', 'r') as fp:
+        lines = fp.readlines()
+    start = datetime.datetime(2010, 6, 22, 14)
+    batch = ColumnParser().parse(lines, recorded_at=start.timestamp())
+    process = multiprocessing.get_context('spawn').Process(
+        target=_abandon_writer, args=(tmp_path, start))
+    process.start()
+    process.join()
+
+    client = SWMRClient(directory=tmp_path)
+    client.write(batch.channels, at=start)
+    client.close()
+    assert client.get_filenames(start) == [
+        client.get_filename(start), client.get_filename(start, 1)]
+    found = read(tmp_path, Query(start, start + datetime.timedelta(hours=1)))
+    assert len(found) == 2 * len(batch.channels)
@@ -0,0 +1,58 @@
+import datetime
+
+import pytest
+
+from pysniffwave.sniffwave.columnar import ColumnParser
+
+pytest.importorskip('pyarrow')
+
+from pysniffwave.parquet.client import Client  # noqa: E402
+
+
+def test_client_parts(tmp_path):
+    '''
+    Test the parts of the current hour are readable and merged into the
+    hourly file on rollover
+    '''
+    with open('tests/sniffwave_output.txt', 'r') as fp:
+        lines = fp.readlines()
+    parser = ColumnParser()
+    start = datetime.datetime(2010, 6, 22, 14)
+    end = start + datetime.timedelta(hours=1)
+    batch = parser.parse(lines, recorded_at=start.timestamp())
+
+    client = Client(directory=tmp_path)
+    client.write(batch.channels, at=start)
+    client.write(batch.channels, at=start, source='imports')
+    client.write_error(batch.errors, at=start)
+    parts = client.get_parts_directory(start)
+    assert len(list(parts.glob('part-*.parquet'))) == 2
+    assert not client.get_filename(start).exists()
+
+    # the hour being written is readable
+    found = client.find(start, end)
+    assert len(found) == 2 * len(batch.channels)
+    assert set(found['source'].dropna()) == {'imports'}
+    station = found['station'].iloc[0]
+    found = client.find(
+        start, end, station=station, channel='H?Z,H?N',
+        columns=['station', 'channel'])
+    assert list(found.columns) == ['station', 'channel']
+    assert (found['station'] == station).all()
+    assert found['channel'].str.match('^H.[ZN]$').all()
+
+    # rollover merges the parts of the previous hour in background
+    client.write(parser.parse(
+        lines, recorded_at=end.timestamp()).channels, at=end)
+    assert len(client.find(start, end)) == 2 * len(batch.channels)
+    client.close()
+    assert client.merged == 3
+    assert client.get_filename(start).exists()
+    assert client.get_filename(start, 'errors').exists()
+    assert not parts.exists()
+
+    reader = Client(directory=tmp_path)
+    assert len(reader.find(start, end)) == 2 * len(batch.channels)
+    assert len(reader.find(start, end + datetime.timedelta(hours=1))) == \
+        3 * len(batch.channels)
+    assert len(reader.find_error(start, end)) == len(batch.errors)
@@ -0,0 +1,134 @@
+import queue
+import threading
+
+import pytest
+
+from pysniffwave.queues import BoundedQueue, BroadcastRing, OverflowPolicy
+from pysniffwave.sniffwave import parser
+from pysniffwave.sniffwave.columnar import parse_columns
+
+
+def test_broadcast():
+    '''
+    Test every consumer reads every message once
+    '''
+    ring = BroadcastRing(capacity=4)
+    first = ring.subscribe('first')
+    second = ring.subscribe('second')
+    for value in range(3):
+        ring.put(value)
+    assert first.get_many() == [0, 1, 2]
+    assert second.get() == 0
+    assert ring.stats() == {
+        'first': {'lag': 0, 'dropped': 0, 'spilled': 0},
+        'second': {'lag': 2, 'dropped': 0, 'spilled': 0},
+    }
+    with pytest.raises(queue.Empty):
+        first.get(timeout=0.01)
+
+
+def test_drop_oldest():
+    '''
+    Test the slow consumer loses the oldest messages
+    '''
+    ring = BroadcastRing(capacity=2, policy=OverflowPolicy.drop_oldest)
+    fast = ring.subscribe()
+    slow = ring.subscribe()
+    for value in range(5):
+        ring.put(value)
+        assert fast.get_nowait() == value
+    assert slow.dropped == 3
+    assert slow.get_many() == [3, 4]
+
+
+def test_spill():
+    '''
+    Test the slow consumer reads the spilled messages first
+    '''
+    ring = BroadcastRing(capacity=2, policy=OverflowPolicy.spill)
+    slow = ring.subscribe()
+    for value in range(5):
+        ring.put({'value': value})
+    assert slow.spilled == 3
+    assert slow.lag == 5
+    assert [item['value'] for item in slow.get_many()] == [0, 1, 2, 3, 4]
+    ring.close()
+
+
+def test_block():
+    '''
+    Test the producer waits for the slow consumer
+    '''
+    ring = BroadcastRing(capacity=2)
+    slow = ring.subscribe()
+    ring.put(0)
+    ring.put(1)
+    producer = threading.Thread(target=ring.put, args=(2,))
+    producer.start()
+    producer.join(timeout=0.1)
+    assert producer.is_alive()
+    assert slow.get() == 0
+    producer.join(timeout=1)
+    assert not producer.is_alive()
+    assert slow.get_many() == [1, 2]
+
+
+def test_put_closed():
+    '''
+    Test the messages published after closing the ring are dropped
+    '''
+    ring = BroadcastRing(capacity=2, policy=OverflowPolicy.spill)
+    slow = ring.subscribe()
+    ring.put(0)
+    ring.close()
+    for value in range(1, 5):
+        ring.put(value)
+    assert ring.head == 1
+    assert slow.spilled == 0
+    assert slow._spill is None
+    assert slow.get_many() == [0]
+
+
+def test_bounded_drop():
+    '''
+    Test the bounded queue drops the newest or the oldest messages
+    '''
+    newest = BoundedQueue(2, OverflowPolicy.drop_newest)
+    oldest = BoundedQueue(2, OverflowPolicy.drop_oldest)
+    for value in range(5):
+        newest.put(value)
+        oldest.put(value)
+    assert [newest.get_nowait() for _ in range(2)] == [0, 1]
+    assert [oldest.get_nowait() for _ in range(2)] == [3, 4]
+    assert oldest.stats() == {
+        'depth': 0, 'maxsize': 2, 'high_water': 2,
+        'dropped': 3, 'compacted': 0}
+    with pytest.raises(ValueError):
+        BoundedQueue(2, OverflowPolicy.spill)
+
+
+def test_bounded_latest_only():
+    '''
+    Test the full queue keeps the latest packet per channel
+    '''
+    with open('tests/sniffwave_output.txt') as fp:
+        lines = fp.readlines()
+    stats = parser.parse_many(lines)
+
+    # 23 packets, 2 channels received twice
+    myqueue = BoundedQueue(22, OverflowPolicy.latest_only)
+    for stat in stats:
+        myqueue.put(stat)
+    assert myqueue.compacted == 2
+    assert myqueue.dropped == 0
+    assert myqueue.qsize() == 21
+
+    batch = parse_columns(lines)
+    myqueue = BoundedQueue(2, OverflowPolicy.latest_only)
+    for _ in range(3):
+        myqueue.put(batch)
+    assert myqueue.compacted == 1
+    latest = [myqueue.get_nowait() for _ in range(2)]
+    assert len(latest[0].channels) == 17
+    assert len(latest[0].errors) == 4
+    assert latest[1] is batch
@@ -0,0 +1,31 @@
+import numpy as np
+
+from pysniffwave.sketch import QuantileSketch
+
+
+def test_quantile_sketch():
+    '''
+    Test the quantiles are within the relative accuracy
+    '''
+    values = np.random.default_rng(1).lognormal(1, 1, 100000)
+    sketch = QuantileSketch(relative_accuracy=0.01)
+    sketch.add(values[:50000])
+    other = QuantileSketch(relative_accuracy=0.01)
+    other.add(values[50000:])
+    sketch.merge(other)
+    assert sketch.count == len(values)
+    for q in (0.01, 0.5, 0.9, 0.99):
+        expected = np.quantile(values, q, method='lower')
+        assert abs(sketch.quantile(q) - expected) <= 0.011 * expected
+
+
+def test_quantile_sketch_zero():
+    '''
+    Test values lower than the minimum are reported as zero
+    '''
+    sketch = QuantileSketch()
+    sketch.add([-1.0, 0.0, 0.0, 5.0])
+    assert sketch.zero == 3
+    assert sketch.quantile(0.5) == 0.0
+    assert abs(sketch.quantile(1) - 5.0) <= 0.05
+    assert np.isnan(QuantileSketch().quantile(0.5))
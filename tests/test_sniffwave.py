@@ -1,4 +1,16 @@
+import os
+import queue
+import time
+from typing import List
+
 import pysniffwave.sniffwave.client as sniffwave
+from pysniffwave.sniffwave.columnar import ColumnBatch, ColumnParser, \
+    to_frame
+from pysniffwave.sniffwave.parser import ChannelError, parse_many
+from pysniffwave.sniffwave.pool import ParsePool
+from pysniffwave.sniffwave.reader import ChunkReader
+from pysniffwave.sniffwave.replay import Replay, load_capture, rewrite_times
+from pysniffwave.sniffwave.spec import SniffwaveSpec, to_specs
 
 
 def test_parse():
@@ -9,3 +21,224 @@ def test_parse():
     for line in fp.readlines():
         print(sniffwave.parse(line))
     fp.close()
+
+
+def test_parse_many():
+    '''
+    Test the batch parser against the line parser
+    '''
+    with open('tests/sniffwave_output.txt', 'r') as fp:
+        lines = fp.readlines()
+    expected = [
+        stat for stat in (sniffwave.parse(line) for line in lines)
+        if stat is not None]
+    stats = parse_many(lines)
+    assert len(stats) == len(expected) == 23
+    for stat, other in zip(stats, expected):
+        assert type(stat) is type(other)
+        assert {**stat, 'recorded_at': None} == \
+            {**other, 'recorded_at': None}
+    assert isinstance(stats[3], ChannelError)
+    assert stats[3]['error'] == 'overlap'
+    assert stats[3]['location'] == ''
+
+
+def test_parse_columns():
+    '''
+    Test the columnar parser against the batch parser
+    '''
+    with open('tests/sniffwave_output.txt', 'r') as fp:
+        lines = fp.readlines()
+    parser = ColumnParser(capacity=4)
+    batch = parser.parse(lines)
+    assert len(batch.channels) == 19
+    assert len(batch.errors) == 4
+    assert parser.skipped == 2
+
+    expected = parse_many(lines)
+    records = list(batch)
+    assert len(records) == len(expected)
+    expected.sort(key=lambda stat: isinstance(stat, ChannelError))
+    for record, other in zip(records, expected):
+        assert type(record) is type(other)
+        assert record.keys() == other.keys()
+        for key in record:
+            if key == 'recorded_at':
+                continue
+            if isinstance(other[key], float):
+                assert abs(record[key] - other[key]) < 1e-4
+            else:
+                assert record[key] == other[key]
+
+    df = to_frame(batch.channels)
+    assert df['start_time'].iloc[0] == expected[0]['start_time']
+    assert df['location'].iloc[0] == ''
+
+
+def test_chunk_reader():
+    '''
+    Test the partial line is carried over to the next chunk
+    '''
+    read_fd, write_fd = os.pipe()
+    reader = ChunkReader(read_fd, chunk_size=16)
+    os.write(write_fd, b'first line\nsecond')
+    assert reader.read_lines() == ['first line']
+    assert reader.read_lines() == []
+    os.write(write_fd, b' line\n')
+    assert reader.read_lines() == ['second line']
+    os.close(write_fd)
+    assert reader.read_lines() is None
+    reader.close()
+    os.close(read_fd)
+
+
+def test_sniffwave_chunks(tmp_path, monkeypatch):
+    '''
+    Test bulk reading of a fake sniffwave program
+    '''
+    program = tmp_path.joinpath('sniffwave')
+    program.write_text(
+        f'#!/bin/sh\ncat {os.path.abspath("tests/sniffwave_output.txt")}\n')
+    program.chmod(0o755)
+    monkeypatch.setenv('PATH', f'{tmp_path}{os.pathsep}{os.environ["PATH"]}')
+
+    myqueue: queue.Queue = queue.Queue()
+    mysniff = sniffwave.Sniffwave(
+        myqueue, max_lines=20, max_fails=2, chunk_size=1024)
+    mysniff.run()
+
+    batches = []
+    while not myqueue.empty():
+        batches.append(myqueue.get())
+    assert all(isinstance(batch, ColumnBatch) for batch in batches)
+    assert sum(len(batch) for batch in batches) == 20
+
+
+def test_sniffwave_restart(tmp_path, monkeypatch):
+    '''
+    Test sniffwave is respawned when it exits or hangs
+    '''
+    program = tmp_path.joinpath('sniffwave')
+    program.write_text(
+        f'#!/bin/sh\ncat {os.path.abspath("tests/sniffwave_output.txt")}\n'
+        'exec sleep ${SNIFFWAVE_SLEEP:-0}\n')
+    program.chmod(0o755)
+    monkeypatch.setenv('PATH', f'{tmp_path}{os.pathsep}{os.environ["PATH"]}')
+
+    # exits after its output
+    myqueue: queue.Queue = queue.Queue()
+    mysniff = sniffwave.Sniffwave(
+        myqueue, chunk_size=1024, max_restarts=2, backoff=0.01)
+    mysniff.run()
+    assert mysniff.restarts == 2
+    assert mysniff.hangs == 0
+    assert sum(len(myqueue.get()) for _ in range(myqueue.qsize())) == 3 * 23
+
+    # hangs after its output
+    monkeypatch.setenv('SNIFFWAVE_SLEEP', '30')
+    myqueue = queue.Queue()
+    mysniff = sniffwave.Sniffwave(
+        myqueue, max_restarts=1, hang_timeout=0.5, backoff=0.01)
+    mysniff.run()
+    assert mysniff.stats()['restarts'] == 1
+    assert mysniff.stats()['hangs'] == 2
+    assert myqueue.qsize() == 2 * 23
+
+    assert 0.5 <= sniffwave.backoff_delay(3, 1, 30) <= 8
+    assert 15 <= sniffwave.backoff_delay(10, 1, 30) <= 30
+
+
+def test_replay():
+    '''
+    Test replaying a capture in place of sniffwave
+    '''
+    lines = load_capture(['tests/sniffwave_output.txt'])
+    assert len(lines) == 23
+    assert rewrite_times(lines[0][1], 0) == lines[0][1]
+
+    # as fast as possible, twice with the timestamps rewritten
+    myqueue: queue.Queue = queue.Queue()
+    mysniff = sniffwave.Sniffwave(
+        myqueue, chunk_size=1024, replay=Replay(
+            ['tests/sniffwave_output.txt'],
+            rate=0, loops=2, rewrite_times=True))
+    started = time.time()
+    mysniff.run()
+    batch = ColumnBatch.concatenate(
+        [myqueue.get() for _ in range(myqueue.qsize())])
+    assert len(batch.channels) == 2 * 19
+    assert len(batch.errors) == 2 * 4
+    first, second = batch.channels[:19], batch.channels[19:]
+    assert abs(first['start_time'][0] + 6.3 + 2.035 - started) < 1
+    assert (second['start_time'] > first['start_time']).all()
+
+    # paced at 100 times real-time, the capture spans 59s
+    myqueue = queue.Queue()
+    mysniff = sniffwave.Sniffwave(
+        myqueue, replay=Replay(['tests/sniffwave_output.txt'], rate=100))
+    started = time.time()
+    mysniff.run()
+    assert myqueue.qsize() == 23
+    assert 0.5 < time.time() - started < 5
+
+
+def test_specs():
+    '''
+    Test the normalization of sniffwave specs
+    '''
+    specs = to_specs('WAVE_RING')
+    assert len(specs) == 1
+    assert specs[0].source is None
+    assert specs[0].args == ['WAVE_RING']
+
+    specs = to_specs([
+        SniffwaveSpec(['WAVE_RING']),
+        SniffwaveSpec.from_string('imports=IMPORT_RING IU wild wild wild'),
+    ])
+    assert [spec.source for spec in specs] == ['WAVE_RING', 'imports']
+    assert specs[1].args == ['IMPORT_RING', 'IU', 'wild', 'wild', 'wild']
+
+
+def test_parse_pool():
+    '''
+    Test batches parsed by the pool are handed back in order
+    '''
+    with open('tests/sniffwave_output.txt', 'rb') as fp:
+        lines = fp.readlines()[2:]
+
+    batches: List[ColumnBatch] = []
+    pool = ParsePool(batches.append, processes=2)
+    for line in lines:
+        pool.submit(line, 'WAVE_RING')
+    pool.close()
+
+    assert len(batches) == len(lines)
+    stations = [
+        (batch.channels['station'].tolist()
+         or batch.errors['station'].tolist())[0]
+        for batch in batches]
+    assert stations == [line.split(b'.')[0].strip().decode()
+                        for line in lines]
+    assert all(batch.source == 'WAVE_RING' for batch in batches)
+
+
+def test_sniffwave_pool(tmp_path, monkeypatch):
+    '''
+    Test bulk reading of a fake sniffwave program parsed by a pool
+    '''
+    program = tmp_path.joinpath('sniffwave')
+    program.write_text(
+        f'#!/bin/sh\ncat {os.path.abspath("tests/sniffwave_output.txt")}\n')
+    program.chmod(0o755)
+    monkeypatch.setenv('PATH', f'{tmp_path}{os.pathsep}{os.environ["PATH"]}')
+
+    myqueue: queue.Queue = queue.Queue()
+    mysniff = sniffwave.Sniffwave(
+        myqueue, max_lines=20, max_fails=2, chunk_size=512,
+        parse_processes=2)
+    mysniff.run()
+
+    count = 0
+    while not myqueue.empty():
+        count += len(myqueue.get())
+    assert count == 20
@@ -1,6 +1,9 @@
 import datetime
 
+from sqlalchemy import create_engine, inspect
+
 from pysniffwave.sql.client import Client
+from pysniffwave.sql.database import upgrade_db
 
 
 def test_client_find():
@@ -15,3 +18,28 @@ def test_client_find():
         now - datetime.timedelta(days=10),
         now,
     ))
+
+
+def test_upgrade_db(tmp_path):
+    '''
+    Test the source column is added to the tables of a previous version
+    '''
+    engine = create_engine(f'sqlite:///{tmp_path / "sniffwave.db"}')
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            'CREATE TABLE "Channel" '
+            '(recorded_at DATETIME, station VARCHAR(5))')
+        conn.exec_driver_sql(
+            'INSERT INTO "Channel" '
+            'VALUES (\'2024-01-01 00:00:00\', \'ABC\')')
+    upgrade_db(bind=engine)
+    # a second upgrade has nothing to do
+    upgrade_db(bind=engine)
+    columns = [
+        column['name'] for column in inspect(engine).get_columns('Channel')]
+    assert columns == ['recorded_at', 'station', 'source']
+    assert not inspect(engine).has_table('ChannelError')
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql(
+            'SELECT station, source FROM "Channel"').fetchall() == [
+                ('ABC', None)]
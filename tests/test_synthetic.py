@@ -0,0 +1,41 @@
+import queue
+import sys
+
+import pysniffwave.sniffwave.client as sniffwave
+from pysniffwave.sniffwave.columnar import ColumnBatch, ColumnParser
+from pysniffwave.sniffwave.synthetic import Synthetic, generate
+
+
+def test_generate():
+    '''
+    Test the synthetic lines are decoded by the parser
+    '''
+    config = Synthetic(
+        channels=30, sample_rates=[100.0, 40.0], error_rate=0.2,
+        duration=10, seed=1)
+    lines = [line for _, line in generate(config, start=1277216155.665)]
+    parser = ColumnParser()
+    batch = parser.parse(lines)
+    assert parser.skipped == 0
+    assert len(batch.channels) == 30 * 10
+    assert len(batch.errors) == len(lines) - 30 * 10 > 0
+    assert set(batch.errors['error']) == {'gap', 'overlap', 'out-of-order'}
+    assert set(batch.channels['sample_rate']) == {100.0, 40.0}
+    assert batch.channels['start_time'].min() > 1277216155.665 - 20
+
+
+def test_sniffwave_synthetic():
+    '''
+    Test the synthetic program standing in for sniffwave
+    '''
+    myqueue: queue.Queue = queue.Queue()
+    mysniff = sniffwave.Sniffwave(
+        myqueue,
+        cmd_args='WAVE_RING -n 300 -r 0 -d 2 --seed 1',
+        chunk_size=65536,
+        program=f'{sys.executable} -m pysniffwave.bin.sniffwave_synthetic')
+    mysniff.run()
+    batch = ColumnBatch.concatenate(
+        [myqueue.get() for _ in range(myqueue.qsize())])
+    assert len(batch.channels) == 600
+    assert len(set(batch.channels['station'])) == 100
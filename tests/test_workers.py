@@ -1,4 +1,7 @@
+import queue
+
 import pysniffwave.sniffwave.client as sniffwave
+from pysniffwave.sniffwave.columnar import ColumnParser
 from pysniffwave.workers.print import PrintWorker
 from pysniffwave.workers.sql import SQLWorker
 from pysniffwave.workers.hdf5 import HDF5Worker
@@ -29,3 +32,62 @@ def test_worker_hdf5():
     # start the worker thread
     myworker = HDF5Worker(timeout=5)
     sniffwave.start(myworker, max_lines=10, max_fails=10)
+
+
+class RecordHDF5Worker(HDF5Worker):
+    '''
+    HDF5 worker recording the flushed messages instead of writing them
+    '''
+    def setup(self):
+        self.flushes = []
+
+    def process(self, items):
+        self.flushes.append(items)
+
+    def teardown(self):
+        pass
+
+
+def test_worker_hdf5_flush():
+    '''
+    Test the hdf5 worker flushes by rows and by delay
+    '''
+    myqueue: queue.Queue = queue.Queue()
+    for value in range(5):
+        myqueue.put(value)
+    myworker = RecordHDF5Worker(
+        myqueue, timeout=0.2, flush_rows=3, flush_delay=0.1)
+    myworker.run()
+    # a burst is split by rows, the rest is written after the delay
+    assert myworker.flushes == [[0, 1, 2], [3, 4]]
+
+    for value in range(2):
+        myqueue.put(value)
+    myworker = RecordHDF5Worker(
+        myqueue, timeout=0.2, flush_rows=3, flush_delay=0.05)
+    myworker.run()
+    assert myworker.flushes == [[0, 1]]
+
+
+def test_worker_hdf5_flush_batches():
+    '''
+    Test a burst of batches is written in writes of at most flush_rows
+    '''
+    with open('tests/sniffwave_output.txt') as fp:
+        batch = ColumnParser().parse(fp.readlines())
+    myqueue: queue.Queue = queue.Queue()
+    for _ in range(3):
+        myqueue.put(batch)
+    myworker = RecordHDF5Worker(
+        myqueue, timeout=0.2, flush_rows=10, flush_delay=0.1)
+    myworker.run()
+    sizes = [
+        sum(len(item) for item in flush) for flush in myworker.flushes]
+    assert sum(sizes) == 3 * len(batch)
+    assert all(size == 10 for size in sizes[:-1])
+    assert 0 < sizes[-1] <= 10
+    # packets are kept in order
+    stations = [
+        station for flush in myworker.flushes for item in flush
+        for station in item.channels['station']]
+    assert stations == 3 * list(batch.channels['station'])